@@ -0,0 +1,118 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.mixins import AccessMixin, UserPassesTestMixin
+from django.core.cache import cache
+from django.dispatch import Signal
+
+from .models import ProjectMembership
+
+ROLE_MEMBER = ProjectMembership.MEMBER
+ROLE_ADMIN = ProjectMembership.ADMIN
+ROLE_LEVELS = {ROLE_MEMBER: 1, ROLE_ADMIN: 2}
+
+ROLES_CACHE_TIMEOUT = 60 * 60
+
+# sent with user_ids whenever their roles may have changed
+project_roles_changed = Signal()
+
+
+def _roles_cache_key(user_id):
+    return 'basecamp:project-roles:%s' % user_id
+
+
+def _build_project_roles(user):
+    return dict(ProjectMembership.objects.filter(user_id=user.pk).values_list('project_id', 'role'))
+
+
+def roles_cache_enabled():
+    # invalidation reaches only the cache the changing process sees, so a per-process cache would
+    # let other workers keep a removed member's roles until the timeout
+    return getattr(settings, 'BASECAMP_CACHE_SHARED', False)
+
+
+def get_project_roles(user):
+    if not user.is_authenticated:
+        return {}
+    roles = getattr(user, '_project_roles', None)
+    if roles is None:
+        key = _roles_cache_key(user.pk)
+        roles = cache.get(key) if roles_cache_enabled() else None
+        if roles is None:
+            roles = _build_project_roles(user)
+            if roles_cache_enabled():
+                cache.set(key, roles, ROLES_CACHE_TIMEOUT)
+        user._project_roles = roles
+    return roles
+
+
+async def aget_project_roles(user):
+    if not user.is_authenticated:
+        return {}
+    roles = getattr(user, '_project_roles', None)
+    if roles is None:
+        key = _roles_cache_key(user.pk)
+        roles = await cache.aget(key) if roles_cache_enabled() else None
+        if roles is None:
+            roles = {project_id: role async for project_id, role in
+                     ProjectMembership.objects.filter(user_id=user.pk).values_list('project_id', 'role')}
+            if roles_cache_enabled():
+                await cache.aset(key, roles, ROLES_CACHE_TIMEOUT)
+        user._project_roles = roles
+    return roles
+
+
+def get_project_role(user, project_id):
+    return get_project_roles(user).get(int(project_id))
+
+
+def has_project_role(user, project_id, role=ROLE_MEMBER):
+    current = get_project_role(user, project_id)
+    return current is not None and ROLE_LEVELS[current] >= ROLE_LEVELS[role]
+
+
+async def ahas_project_role(user, project_id, role=ROLE_MEMBER):
+    current = (await aget_project_roles(user)).get(int(project_id))
+    return current is not None and ROLE_LEVELS[current] >= ROLE_LEVELS[role]
+
+
+async def aget_request_user(request):
+    # the lazy request.user reads the session and the user row, which must not run on the event loop
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+def invalidate_project_roles(*user_ids):
+    cache.delete_many([_roles_cache_key(user_id) for user_id in user_ids])
+    project_roles_changed.send(sender=None, user_ids=user_ids)
+
+
+class ProjectAccessMixin(UserPassesTestMixin):
+    project_role = ROLE_MEMBER
+
+    def test_func(self, **kwargs):
+        return has_project_role(self.request.user, self.kwargs['pk'], self.project_role)
+
+    def get_project_role(self):
+        return get_project_role(self.request.user, self.kwargs['pk'])
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await aget_request_user(request)
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncProjectAccessMixin(AccessMixin):
+    project_role = ROLE_MEMBER
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await aget_request_user(request)
+        if not await ahas_project_role(user, kwargs['pk'], self.project_role):
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def aget_project_role(self):
+        return (await aget_project_roles(self.request.user)).get(int(self.kwargs['pk']))
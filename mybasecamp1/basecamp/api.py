@@ -0,0 +1,59 @@
+from django.core.exceptions import ValidationError
+from django.utils.crypto import md5
+from django.utils.http import quote_etag
+
+from .models import *
+from .pagination import keyset_page
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+
+class Resource:
+    """A model exposed read-only through the JSON API, as public field names mapped to lookups."""
+
+    def __init__(self, model, fields, ordering=('id',)):
+        self.model = model
+        self.fields = fields
+        self.ordering = ordering
+
+    def parse_fields(self, value):
+        if not value:
+            return list(self.fields)
+        names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValidationError('Unknown fields: %(fields)s', params={'fields': ', '.join(unknown)})
+        return names
+
+    def rows(self, queryset, names):
+        # only the requested columns are selected, plus what the cursor needs
+        columns = dict.fromkeys([self.fields[name] for name in names] + list(self.ordering))
+        return queryset.values(*columns)
+
+    def serialize(self, row, names):
+        return {name: row[self.fields[name]] for name in names}
+
+    def page(self, queryset, names, cursor=None, size=API_PAGE_SIZE):
+        rows, next_cursor = keyset_page(self.rows(queryset, names), cursor, size, self.ordering, descending=False)
+        return [self.serialize(row, names) for row in rows], next_cursor
+
+
+def version_etag(request, version):
+    # the same data version answers every variant of the URL differently, so the query string is part of it
+    key = '%s %s' % (version.isoformat(), request.get_full_path())
+    return quote_etag(md5(key.encode(), usedforsecurity=False).hexdigest())
+
+
+PROJECTS = Resource(Project, {
+    'id': 'id', 'title': 'title', 'description': 'description', 'created_by': 'created_by__username',
+    'time_create': 'time_create', 'last_activity_at': 'last_activity_at', 'member_count': 'member_count',
+    'discussion_count': 'discussion_count', 'message_count': 'message_count',
+    'open_task_count': 'open_task_count', 'attachment_bytes': 'attachment_bytes',
+})
+DISCUSSIONS = Resource(Discussion, {'id': 'id', 'name': 'disc_name', 'time_create': 'time_create'})
+MESSAGES = Resource(DiscussionMessage, {'id': 'id', 'discussion': 'related_discussion_id', 'user': 'user',
+                                        'text': 'message_text', 'time_create': 'time_create'},
+                    ordering=('time_create', 'id'))
+TASKS = Resource(Task, {'id': 'id', 'name': 'task_name', 'is_solved': 'is_solved', 'time_create': 'time_create'})
+ATTACHMENTS = Resource(Attachments, {'id': 'id', 'name': 'name', 'size': 'size', 'checksum': 'checksum'})
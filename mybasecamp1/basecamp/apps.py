@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BasecampConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'basecamp'
+
+    def ready(self):
+        # job handlers register on import, so the worker knows every job name
+        from . import deletion, signals
@@ -0,0 +1,258 @@
+import datetime
+import io
+import json
+import zipfile
+from collections import Counter
+
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .blobs import acquire_blob
+from .counters import reconcile_counters
+from .events import new_event, record_events
+from .jobs import enqueue
+from .models import (Attachments, Blob, Discussion, DiscussionMessage, Project, ProjectEvent, Task,
+                     validate_project_title)
+from .search import index_projects
+from .storage import READ_SIZE, attachment_storage
+
+ARCHIVE_FORMAT = 1
+MANIFEST = 'manifest.json'
+FILES_PREFIX = 'files/'
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 1000
+
+# NDJSON member, model, exported fields; 'id' and foreign keys only link rows inside the archive
+TABLES = [
+    ('discussions.ndjson', Discussion, {'id': 'id', 'disc_name': 'disc_name', 'time_create': 'time_create'}),
+    ('messages.ndjson', DiscussionMessage, {'discussion': 'related_discussion_id', 'user': 'user',
+                                            'message_text': 'message_text', 'time_create': 'time_create'}),
+    ('tasks.ndjson', Task, {'task_name': 'task_name', 'is_solved': 'is_solved', 'time_create': 'time_create'}),
+    ('attachments.ndjson', Attachments, {'name': 'name', 'file': 'files', 'size': 'size', 'checksum': 'checksum'}),
+]
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+
+    def default(self, o):
+        # DjangoJSONEncoder cuts datetimes to milliseconds, which would reorder messages after an import
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class _Pipe(io.RawIOBase):
+    """Write-only stream that hands out whatever the zip writer produced since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def _project_rows(model, project_id):
+    if model is DiscussionMessage:
+        return model.objects.filter(related_discussion__related_project_id=project_id)
+    return model.objects.filter(related_project_id=project_id)
+
+
+def iter_export(project):
+    """
+    Yield a zip archive of the project chunk by chunk. Rows are read with chunked queries and files
+    are copied in READ_SIZE pieces, so memory stays flat however large the project is.
+    """
+    storage = attachment_storage()
+    pipe = _Pipe()
+    # an unseekable output makes zipfile write sizes after each member instead of seeking back
+    with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as archive:
+        manifest = {'format': ARCHIVE_FORMAT, 'exported_at': timezone.now(),
+                    'project': {'title': project.title, 'description': project.description,
+                                'time_create': project.time_create}}
+        archive.writestr(MANIFEST, json.dumps(manifest, cls=ArchiveEncoder))
+        yield from pipe.drain()
+
+        for member, model, fields in TABLES:
+            rows = _project_rows(model, project.pk).order_by('pk').values_list(*fields.values())
+            with archive.open(member, 'w', force_zip64=True) as output:
+                lines = []
+                for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                    lines.append(json.dumps(dict(zip(fields, row)), cls=ArchiveEncoder))
+                    if len(lines) == EXPORT_CHUNK_SIZE:
+                        output.write(('\n'.join(lines) + '\n').encode())
+                        lines = []
+                        yield from pipe.drain()
+                if lines:
+                    output.write(('\n'.join(lines) + '\n').encode())
+            yield from pipe.drain()
+
+        # attachments sharing a blob store it once
+        names = (_project_rows(Attachments, project.pk).exclude(files='').order_by('files')
+                 .values_list('files', flat=True).distinct())
+        for name in names.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            if not storage.exists(name):
+                continue
+            with storage.open(name) as source, archive.open(FILES_PREFIX + name, 'w', force_zip64=True) as output:
+                for chunk in iter(lambda: source.read(READ_SIZE), b''):
+                    output.write(chunk)
+                    yield from pipe.drain()
+    yield from pipe.drain()
+
+
+def _read_rows(archive, member):
+    with archive.open(member) as source:
+        for line in io.TextIOWrapper(source, encoding='utf-8'):
+            if line.strip():
+                yield json.loads(line)
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bulk_create_with_times(model, objects, times, batch_size):
+    """bulk_create with the given time_create values inserted as they are; None keeps the insert time."""
+    for obj, moment in zip(objects, times):
+        if moment is not None:
+            obj.time_create = moment
+    model.objects.bulk_create(objects, batch_size=batch_size)
+
+
+def _create(model, objects, rows, batch_size):
+    bulk_create_with_times(model, objects, [parse_datetime(row['time_create']) for row in rows], batch_size)
+
+
+def _restore_file(archive, storage, name, written):
+    try:
+        member = archive.getinfo(FILES_PREFIX + name)
+    except KeyError:
+        return None
+    if storage.is_blob_name(name):
+        digest = name.rsplit('/', 1)[-1]
+        if Blob.objects.filter(digest=digest).exists() and storage.exists(name):
+            return name
+    with archive.open(member) as source:
+        written.append(storage.save(name, File(source, name=name)))
+    return written[-1]
+
+
+def _discard_files(storage, names):
+    # the jobs keep any file a row refers to by the time they run, e.g. a blob uploaded again meanwhile
+    digests = [name.rsplit('/', 1)[-1] for name in names if storage.is_blob_name(name)]
+    others = [name for name in names if not storage.is_blob_name(name)]
+    if digests:
+        enqueue('delete_blob_files', digests=digests)
+    if others:
+        enqueue('delete_attachment_files', names=others)
+
+
+def import_project(file, owner, title=None, batch_size=IMPORT_BATCH_SIZE):
+    """Recreate an exported project owned by `owner` and return it with the number of rows per member."""
+    storage = attachment_storage()
+    with zipfile.ZipFile(file) as archive:
+        try:
+            manifest = json.loads(archive.read(MANIFEST))
+        except KeyError:
+            raise ArchiveError('Not a project archive: %s is missing' % MANIFEST)
+        if manifest.get('format') != ARCHIVE_FORMAT:
+            raise ArchiveError('Unsupported archive format %r' % manifest.get('format'))
+        exported = manifest['project']
+        title = title or exported['title']
+        try:
+            validate_project_title(title)
+        except ValidationError:
+            raise ArchiveError('A project titled %r already exists, choose another title' % title)
+        counts = Counter()
+
+        written = []
+        try:
+            with transaction.atomic():
+                project = Project.objects.create(title=title, description=exported['description'],
+                                                 created_by=owner)
+                Project.objects.filter(pk=project.pk).update(time_create=parse_datetime(exported['time_create']))
+
+                discussions = {}
+                for rows in _batches(_read_rows(archive, 'discussions.ndjson'), batch_size):
+                    objects = [Discussion(disc_name=row['disc_name'], related_project=project) for row in rows]
+                    _create(Discussion, objects, rows, batch_size)
+                    discussions.update((row['id'], discussion.pk) for row, discussion in zip(rows, objects))
+                    record_events([new_event(project.pk, ProjectEvent.DISCUSSION_ADDED, discussion.pk,
+                                             name=discussion.disc_name) for discussion in objects], batch_size)
+                    counts['discussions'] += len(rows)
+
+                for rows in _batches(_read_rows(archive, 'messages.ndjson'), batch_size):
+                    objects = [DiscussionMessage(user=row['user'], message_text=row['message_text'],
+                                                 related_discussion_id=discussions[row['discussion']]) for row in rows]
+                    _create(DiscussionMessage, objects, rows, batch_size)
+                    record_events([new_event(project.pk, ProjectEvent.MESSAGE_ADDED, message.pk, actor=message.user,
+                                             discussion=message.related_discussion_id) for message in objects],
+                                  batch_size)
+                    counts['messages'] += len(rows)
+
+                for rows in _batches(_read_rows(archive, 'tasks.ndjson'), batch_size):
+                    objects = [Task(task_name=row['task_name'], is_solved=row['is_solved'], related_project=project)
+                               for row in rows]
+                    _create(Task, objects, rows, batch_size)
+                    record_events([new_event(project.pk, ProjectEvent.TASK_ADDED, task.pk, name=task.task_name)
+                                   for task in objects], batch_size)
+                    counts['tasks'] += len(rows)
+
+                stored = {}
+                blobs = Counter()
+                sizes = {}
+                for rows in _batches(_read_rows(archive, 'attachments.ndjson'), batch_size):
+                    objects = []
+                    for row in rows:
+                        if row['file'] not in stored:
+                            stored[row['file']] = _restore_file(archive, storage, row['file'], written)
+                        name = stored[row['file']]
+                        if name is None:
+                            counts['missing files'] += 1
+                            continue
+                        checksum = name.rsplit('/', 1)[-1] if storage.is_blob_name(name) else row['checksum']
+                        if storage.is_blob_name(name):
+                            blobs[checksum] += 1
+                            sizes[checksum] = row['size'] or 0
+                        objects.append(Attachments(related_project=project, files=name, name=row['name'],
+                                                   size=row['size'], checksum=checksum))
+                    Attachments.objects.bulk_create(objects, batch_size=batch_size)
+                    record_events([new_event(project.pk, ProjectEvent.ATTACHMENT_ADDED, attachment.pk,
+                                             name=attachment.name, size=attachment.size) for attachment in objects],
+                                  batch_size)
+                    counts['attachments'] += len(objects)
+                for digest, count in blobs.items():
+                    acquire_blob(digest, sizes[digest], count=count)
+
+                reconcile_counters(Project.objects.filter(pk=project.pk))
+                index_projects([project], batch_size)
+        except Exception as error:
+            # the rows rolled back, the files written for them would be left behind
+            _discard_files(storage, written)
+            # a malformed date or JSON line, or a file name reaching outside the storage
+            if isinstance(error, (ValueError, SuspiciousFileOperation)):
+                raise ArchiveError('Damaged archive: %s' % error) from error
+            raise
+    return project, counts
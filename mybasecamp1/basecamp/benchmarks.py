@@ -0,0 +1,254 @@
+import hashlib
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .blobs import acquire_blob, create_attachment
+from .counters import reconcile_counters
+from .models import Attachments, Discussion, DiscussionMessage, Project, ProjectMembership, Task, UploadSession
+from .search import index_projects
+from .uploads import start_upload, upload_temp_path
+
+BATCH_SIZE = 1000
+UPLOAD_CONTENT = b'data'
+
+
+@dataclass
+class Scale:
+    users: int = 50
+    projects: int = 20
+    members: int = 10
+    discussions: int = 10
+    messages: int = 50
+    tasks: int = 100
+    attachments: int = 20
+
+
+@dataclass
+class Dataset:
+    user: User
+    project: Project
+    discussion: Discussion
+    attachment: Attachments
+    scale: Scale
+
+
+@dataclass
+class Case:
+    name: str
+    url: str
+    budget: int
+    method: str = 'get'
+    data: dict = field(default_factory=dict)
+    extra: dict = field(default_factory=dict)
+    statuses: tuple = (200,)
+    # run before every request, so one that changes state does the same work each time
+    reset: Optional[Callable] = None
+
+
+def generate_data(scale=None, seed=0):
+    """Fill the database with a synthetic workspace; every project belongs to the first user, who is staff."""
+    scale = scale or Scale()
+    rng = random.Random(seed)
+    password = make_password('benchmark')
+    User.objects.bulk_create([User(username='bench%d' % i, password=password, is_staff=i == 0)
+                              for i in range(scale.users)],
+                             batch_size=BATCH_SIZE)
+    users = list(User.objects.filter(username__startswith='bench').order_by('pk').values_list('pk', flat=True))
+    owner = users[0]
+
+    Project.objects.bulk_create([Project(title='Benchmark project %d' % i, description='Synthetic project %d' % i,
+                                         created_by_id=owner if i % 2 == 0 else rng.choice(users))
+                                 for i in range(scale.projects)], batch_size=BATCH_SIZE)
+    projects = list(Project.objects.filter(title__startswith='Benchmark project').order_by('pk'))
+    memberships = []
+    for project in projects:
+        members = {project.created_by_id, owner} | set(rng.sample(users, min(scale.members, len(users))))
+        memberships += [ProjectMembership(project=project, user_id=user_id,
+                                          role=ProjectMembership.ADMIN if user_id in (owner, project.created_by_id)
+                                          else ProjectMembership.MEMBER) for user_id in members]
+    ProjectMembership.objects.bulk_create(memberships, batch_size=BATCH_SIZE)
+
+    Discussion.objects.bulk_create([Discussion(disc_name='Discussion %d' % i, related_project=project)
+                                    for project in projects for i in range(scale.discussions)],
+                                   batch_size=BATCH_SIZE)
+    discussions = list(Discussion.objects.filter(related_project__in=projects).order_by('pk'))
+    messages = []
+    for discussion in discussions:
+        messages += [DiscussionMessage(user='bench%d' % rng.randrange(scale.users), related_discussion=discussion,
+                                       message_text='Message %d about the release plan' % i)
+                     for i in range(scale.messages)]
+        if len(messages) >= BATCH_SIZE:
+            DiscussionMessage.objects.bulk_create(messages)
+            messages = []
+    DiscussionMessage.objects.bulk_create(messages)
+    Task.objects.bulk_create([Task(task_name='Task %d' % i, is_solved=rng.random() < 0.7, related_project=project)
+                              for project in projects for i in range(scale.tasks)], batch_size=BATCH_SIZE)
+
+    # one real blob shared by every attachment row keeps the generator fast at any size
+    content = b'benchmark attachment\n' * 512
+    attachment = create_attachment(projects[0], ContentFile(content, name='benchmark.txt'))
+    rows = [Attachments(related_project=project, files=attachment.files.name, name='file %d.txt' % i,
+                        size=len(content), checksum=attachment.checksum)
+            for project in projects for i in range(scale.attachments)
+            if (project, i) != (projects[0], 0)]
+    Attachments.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    acquire_blob(attachment.checksum, len(content), count=len(rows))
+
+    index_projects(projects)
+    reconcile_counters(Project.objects.filter(pk__in=[project.pk for project in projects]))
+    discussion = Discussion.objects.filter(related_project=projects[0]).order_by('pk').first()
+    return Dataset(User.objects.get(pk=owner), projects[0], discussion, attachment, scale)
+
+
+def _upload_session(data, received_size):
+    """A session of the benchmark upload and a reset that brings it back to `received_size` bytes received."""
+    session = start_upload(data.project, data.user, 'bench.bin', len(UPLOAD_CONTENT),
+                           hashlib.sha256(UPLOAD_CONTENT).hexdigest())
+    fields = {'file_name': session.file_name, 'total_size': session.total_size, 'chunk_size': session.chunk_size,
+              'checksum': session.checksum, 'related_project': data.project, 'created_by': data.user}
+
+    def reset():
+        UploadSession.objects.update_or_create(id=session.id, defaults=dict(fields, received_size=received_size))
+        os.makedirs(os.path.dirname(upload_temp_path(session)), exist_ok=True)
+        with open(upload_temp_path(session), 'wb') as part:
+            part.write(UPLOAD_CONTENT[:received_size])
+
+    url = reverse('basecamp:upload_session', kwargs={'pk': data.project.pk, 'upload_id': session.id})
+    return url, reset
+
+
+def view_cases(data):
+    # budgets are absolute: they must hold at every Scale, which is what catches N+1 regressions
+    pk = data.project.pk
+    project = {'pk': pk}
+    upload = {'file_name': 'bench.bin', 'total_size': len(UPLOAD_CONTENT),
+              'checksum': hashlib.sha256(UPLOAD_CONTENT).hexdigest()}
+    started_url, started = _upload_session(data, 0)
+    received_url, received = _upload_session(data, len(UPLOAD_CONTENT))
+    return [
+        Case('home', reverse('basecamp:home'), 2),
+        Case('register', reverse('basecamp:register'), 2),
+        Case('login', reverse('basecamp:login'), 2, statuses=(200, 302)),
+        Case('password_change', reverse('basecamp:password_change'), 2),
+        Case('userinfo', reverse('basecamp:userinfo', kwargs={'pk': data.user.pk}), 3),
+        Case('project', reverse('basecamp:project'), 3),
+        Case('search', reverse('basecamp:search'), 4, data={'q': 'release'}),
+        Case('detail', reverse('basecamp:detail', kwargs=project), 10),
+        Case('discussion_history', reverse('basecamp:discussion_history',
+                                           kwargs={'pk': pk, 'discussion_id': data.discussion.pk}), 5),
+        Case('task_board', reverse('basecamp:task_board', kwargs=project), 4, data={'status': 'open'}),
+        Case('task_list_api', reverse('basecamp:task_list_api', kwargs=project), 4),
+        Case('project_events', reverse('basecamp:project_events', kwargs=project), 4),
+        Case('api_projects', reverse('basecamp:api_projects'), 3),
+        Case('api_project', reverse('basecamp:api_project', kwargs=project), 5),
+        Case('api_discussions', reverse('basecamp:api_discussions', kwargs=project), 5),
+        Case('api_messages', reverse('basecamp:api_messages', kwargs={'pk': pk, 'discussion_id': data.discussion.pk}),
+             5),
+        Case('api_tasks', reverse('basecamp:api_tasks', kwargs=project), 5, data={'fields': 'id,name,is_solved'}),
+        Case('api_attachments', reverse('basecamp:api_attachments', kwargs=project), 5),
+        Case('task_bulk_solve', reverse('basecamp:task_bulk_solve', kwargs=project), 9, method='post',
+             data={'tasks': list(Task.objects.filter(related_project_id=pk).values_list('pk', flat=True)[:20]),
+                   'is_solved': '0'}, extra={'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}),
+        Case('delete', reverse('basecamp:delete', kwargs={'pk': data.user.pk}), 3),
+        Case('create_project', reverse('basecamp:create_project'), 2),
+        Case('delete_project', reverse('basecamp:delete_project', kwargs=project), 4),
+        Case('membership', reverse('basecamp:membership', kwargs=project), 5),
+        Case('membership_bulk', reverse('basecamp:membership_bulk', kwargs=project), 3),
+        Case('add_info_project_detail', reverse('basecamp:add_info_project_detail', kwargs=project), 12,
+             method='post', data={'title': 'Benchmark message', 'option': 'Send',
+                                  'discussion_id': data.discussion.pk}, statuses=(302,)),
+        Case('edit_project', reverse('basecamp:edit_project', kwargs=project), 4),
+        Case('export_project', reverse('basecamp:export_project', kwargs=project), 9),
+        Case('bulk_ingest', reverse('basecamp:bulk_ingest', kwargs=project), 15, method='post',
+             data={'rows': [{'type': 'message', 'discussion': data.discussion.pk, 'text': 'Benchmark %d' % i}
+                            for i in range(100)] + [{'type': 'task', 'name': 'Benchmark task'}]},
+             extra={'content_type': 'application/json'}),
+        Case('attachment_download', reverse('basecamp:attachment_download',
+                                            kwargs={'pk': pk, 'attachment_id': data.attachment.pk}), 4),
+        Case('start_upload', reverse('basecamp:start_upload', kwargs=project), 5, method='post', data=upload,
+             statuses=(201,)),
+        Case('upload_status', started_url, 4, reset=started),
+        Case('upload_chunk', started_url, 5, method='put', data=UPLOAD_CONTENT, reset=started,
+             extra={'content_type': 'application/octet-stream',
+                    'HTTP_CONTENT_RANGE': 'bytes 0-%d/%d' % (len(UPLOAD_CONTENT) - 1, len(UPLOAD_CONTENT))}),
+        Case('upload_complete', received_url, 14, method='post', reset=received, statuses=(201,)),
+        Case('upload_abort', received_url, 5, method='delete', reset=received, statuses=(204,)),
+        Case('metrics', reverse('basecamp:metrics'), 2),
+        Case('logout', reverse('basecamp:logout'), 4, method='post', statuses=(302,)),
+    ]
+
+
+def _request(client, case):
+    response = getattr(client, case.method)(case.url, case.data, **case.extra)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def run_benchmarks(data, repeat=5):
+    """Request every case `repeat` times and return one result dict per view."""
+    results = []
+    for case in view_cases(data):
+        client = Client()
+        client.force_login(data.user)
+        cache.clear()
+        if case.reset:
+            case.reset()
+        # the capture slices connection.queries, which stops growing once its log is full
+        reset_queries()
+        with CaptureQueriesContext(connection) as cold:
+            response = _request(client, case)
+        cold_queries = len(cold)
+        timings = []
+        warm_queries = cold_queries
+        for _ in range(repeat):
+            client.force_login(data.user)
+            if case.reset:
+                case.reset()
+            reset_queries()
+            with CaptureQueriesContext(connection) as warm:
+                started = time.perf_counter()
+                _request(client, case)
+                timings.append((time.perf_counter() - started) * 1000)
+            warm_queries = len(warm)
+        client.force_login(data.user)
+        if case.reset:
+            case.reset()
+        tracemalloc.start()
+        try:
+            _request(client, case)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        failures = []
+        if response.status_code not in case.statuses:
+            failures.append('status %d, expected %s' % (response.status_code, case.statuses))
+        if cold_queries > case.budget:
+            failures.append('%d queries, budget %d' % (cold_queries, case.budget))
+        results.append({
+            'view': case.name, 'method': case.method.upper(), 'status': response.status_code,
+            'queries': cold_queries, 'queries_warm': warm_queries, 'budget': case.budget,
+            'median_ms': round(statistics.median(timings), 3) if timings else None,
+            'max_ms': round(max(timings), 3) if timings else None,
+            'peak_kb': round(peak / 1024, 1), 'failures': failures,
+        })
+    return results
+
+
+def report(data, results):
+    return {'scale': asdict(data.scale), 'results': results,
+            'failed': [result['view'] for result in results if result['failures']]}
@@ -0,0 +1,45 @@
+import os
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .counters import bump_counters
+from .jobs import enqueue
+from .models import Attachments, Blob
+from .storage import attachment_storage
+
+
+def acquire_blob(digest, size, count=1):
+    if Blob.objects.filter(digest=digest).update(ref_count=F('ref_count') + count):
+        return
+    try:
+        with transaction.atomic():
+            Blob.objects.create(digest=digest, size=size, ref_count=count)
+    except IntegrityError:
+        Blob.objects.filter(digest=digest).update(ref_count=F('ref_count') + count)
+
+
+def release_blobs(digests):
+    counts = {}
+    for digest in digests:
+        if digest:
+            counts[digest] = counts.get(digest, 0) + 1
+    for digest, count in counts.items():
+        Blob.objects.filter(digest=digest).update(ref_count=Greatest(F('ref_count') - count, 0))
+    unreferenced = list(Blob.objects.filter(digest__in=counts, ref_count=0).values_list('digest', flat=True))
+    Blob.objects.filter(digest__in=unreferenced, ref_count=0).delete()
+    if unreferenced:
+        enqueue('delete_blob_files', digests=unreferenced)
+    return unreferenced
+
+
+def create_attachment(project, file, name=None):
+    storage = attachment_storage()
+    attachment = Attachments(related_project=project, name=os.path.basename(name or file.name), size=file.size)
+    attachment.files.save(attachment.name, file, save=False)
+    if storage.is_blob_name(attachment.files.name):
+        attachment.checksum = os.path.basename(attachment.files.name)
+    attachment.save()
+    bump_counters(project.pk, attachment_bytes=attachment.size or 0)
+    return attachment
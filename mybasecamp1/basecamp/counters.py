@@ -0,0 +1,77 @@
+from django.apps import apps as global_apps
+from django.db.models import BigIntegerField, Count, DateTimeField, F, IntegerField, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+COUNTERS = ('member_count', 'discussion_count', 'message_count', 'open_task_count', 'attachment_bytes')
+
+
+def bump_counters(project_id, **deltas):
+    """Apply counter deltas and mark the project active in a single UPDATE."""
+    Project = global_apps.get_model('basecamp', 'Project')
+    # drift from writes outside these paths must not push a counter below zero
+    changes = {field: F(field) + delta if delta > 0 else Greatest(F(field) + delta, 0)
+               for field, delta in deltas.items() if delta}
+    Project.objects.filter(pk=project_id).update(last_activity_at=timezone.now(), **changes)
+
+
+def _aggregate(queryset, group_by, aggregate, output_field):
+    values = queryset.order_by().values(group_by).annotate(value=aggregate).values('value')
+    return Subquery(values, output_field=output_field)
+
+
+def counter_annotations(apps=global_apps):
+    ProjectMembership = apps.get_model('basecamp', 'ProjectMembership')
+    Discussion = apps.get_model('basecamp', 'Discussion')
+    DiscussionMessage = apps.get_model('basecamp', 'DiscussionMessage')
+    Task = apps.get_model('basecamp', 'Task')
+    Attachments = apps.get_model('basecamp', 'Attachments')
+
+    discussions = Discussion.objects.filter(related_project=OuterRef('pk'))
+    messages = DiscussionMessage.objects.filter(related_discussion__related_project=OuterRef('pk'))
+    tasks = Task.objects.filter(related_project=OuterRef('pk'))
+
+    def counted(queryset, group_by):
+        return Coalesce(_aggregate(queryset, group_by, Count('*'), IntegerField()), 0)
+
+    def latest(queryset, group_by):
+        return Coalesce(_aggregate(queryset, group_by, Max('time_create'), DateTimeField()), F('time_create'))
+
+    return {
+        'expected_member_count': counted(ProjectMembership.objects.filter(project=OuterRef('pk')), 'project'),
+        'expected_discussion_count': counted(discussions, 'related_project'),
+        'expected_message_count': counted(messages, 'related_discussion__related_project'),
+        'expected_open_task_count': counted(tasks.filter(is_solved=False), 'related_project'),
+        'expected_attachment_bytes': Coalesce(_aggregate(Attachments.objects.filter(related_project=OuterRef('pk')),
+                                                         'related_project', Sum('size'), BigIntegerField()), 0),
+        'expected_last_activity_at': Greatest(latest(discussions, 'related_project'),
+                                              latest(messages, 'related_discussion__related_project'),
+                                              latest(tasks, 'related_project')),
+    }
+
+
+def reconcile_counters(queryset=None, apps=global_apps, batch_size=500):
+    """Recompute the stored counters and save the projects that drifted, returning how many did."""
+    Project = apps.get_model('basecamp', 'Project')
+    queryset = Project.objects.all() if queryset is None else queryset
+    fields = COUNTERS + ('last_activity_at',)
+    repaired = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk').annotate(**counter_annotations(apps))
+                     .only('pk', 'time_create', *fields)[:batch_size])
+        if not batch:
+            return repaired
+        drifted = []
+        for project in batch:
+            expected = {field: getattr(project, 'expected_' + field) for field in fields}
+            # activity that left no rows behind (membership changes) must not move the clock backwards
+            if project.last_activity_at and project.last_activity_at > expected['last_activity_at']:
+                expected['last_activity_at'] = project.last_activity_at
+            if any(getattr(project, field) != value for field, value in expected.items()):
+                for field, value in expected.items():
+                    setattr(project, field, value)
+                drifted.append(project)
+        Project.objects.bulk_update(drifted, fields)
+        repaired += len(drifted)
+        last_pk = batch[-1].pk
@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .access import invalidate_project_roles
+from .blobs import release_blobs
+from .counters import bump_counters
+from .jobs import enqueue, job
+from .models import (Attachments, Discussion, DiscussionMessage, Project, ProjectEvent, ProjectMembership, Task,
+                     UploadSession)
+from .storage import attachment_storage
+from .uploads import abort_upload
+
+DELETE_BATCH_SIZE = 500
+
+
+def revoke_project_access(project_id):
+    """Remove every membership at once so the project disappears before its rows are deleted."""
+    memberships = ProjectMembership.objects.filter(project_id=project_id)
+    user_ids = list(memberships.values_list('user_id', flat=True))
+    memberships._raw_delete(memberships.db)
+    invalidate_project_roles(*user_ids)
+    return len(user_ids)
+
+
+def _delete_batches(queryset, batch_size):
+    # every queryset here filters on one foreign key, whose index walks the rows in primary key order
+    queryset = queryset.order_by('pk')
+    while True:
+        with transaction.atomic(using=queryset.db):
+            bound = list(queryset.values_list('pk', flat=True)[batch_size - 1:batch_size])
+            batch = queryset.filter(pk__lte=bound[0]) if bound else queryset
+            deleted = batch._raw_delete(batch.db)
+        if deleted:
+            yield deleted
+        if not bound:
+            return
+
+
+def _delete_attachments(project_id, batch_size):
+    storage = attachment_storage()
+    attachments = Attachments.objects.filter(related_project_id=project_id).order_by('pk')
+    while True:
+        rows = list(attachments.values_list('pk', 'files', 'checksum')[:batch_size])
+        if not rows:
+            return
+        # files are removed by jobs enqueued in this transaction, so a rollback keeps rows and files together
+        with transaction.atomic():
+            deleted = attachments.filter(pk__lte=rows[-1][0])._raw_delete(attachments.db)
+            release_blobs([checksum for pk, name, checksum in rows if checksum and storage.is_blob_name(name)])
+            names = [name for pk, name, checksum in rows if name and not storage.is_blob_name(name)]
+            if names:
+                enqueue('delete_attachment_files', names=names)
+        yield deleted
+
+
+def iter_delete_project(project_id, batch_size=DELETE_BATCH_SIZE):
+    """
+    Delete a project bottom-up in short transactions without loading its rows or sending per-row
+    signals, yielding (model label, rows deleted) after every batch.
+    """
+    if not Project.objects.filter(pk=project_id).exists():
+        return
+    with transaction.atomic():
+        revoked = revoke_project_access(project_id)
+    if revoked:
+        yield ProjectMembership._meta.label, revoked
+
+    discussions = Discussion.objects.filter(related_project_id=project_id).order_by('pk')
+    while True:
+        discussion_ids = list(discussions.values_list('pk', flat=True)[:batch_size])
+        if not discussion_ids:
+            break
+        for discussion_id in discussion_ids:
+            for deleted in _delete_batches(DiscussionMessage.objects.filter(related_discussion_id=discussion_id),
+                                           batch_size):
+                yield DiscussionMessage._meta.label, deleted
+        with transaction.atomic():
+            deleted = discussions.filter(pk__lte=discussion_ids[-1])._raw_delete(discussions.db)
+        yield Discussion._meta.label, deleted
+
+    for deleted in _delete_batches(Task.objects.filter(related_project_id=project_id), batch_size):
+        yield Task._meta.label, deleted
+    for deleted in _delete_attachments(project_id, batch_size):
+        yield Attachments._meta.label, deleted
+    for session in UploadSession.objects.filter(related_project_id=project_id):
+        abort_upload(session)
+    for deleted in _delete_batches(ProjectEvent.objects.filter(project_id=project_id), batch_size):
+        yield ProjectEvent._meta.label, deleted
+
+    # whatever is left is small; the collector also sends the project's own signals
+    with transaction.atomic():
+        deleted = Project.objects.filter(pk=project_id).delete()[0]
+    yield Project._meta.label, deleted
+
+
+def delete_project_steps(project_id):
+    """Run a bounded number of batches and report whether the project still exists."""
+    batches = getattr(settings, 'BASECAMP_DELETE_BATCHES_PER_JOB', 20)
+    batch_size = getattr(settings, 'BASECAMP_DELETE_BATCH_SIZE', DELETE_BATCH_SIZE)
+    for count, _ in enumerate(iter_delete_project(project_id, batch_size), 1):
+        if count == batches:
+            return Project.objects.filter(pk=project_id).exists()
+    return False
+
+
+@job('delete_project')
+def delete_project(project_id):
+    return delete_project_steps(project_id)
+
+
+@job('delete_user')
+def delete_user(user_id):
+    project_id = Project.objects.filter(created_by_id=user_id).order_by('pk').values_list('pk', flat=True).first()
+    if project_id is not None:
+        delete_project_steps(project_id)
+        return True
+    with transaction.atomic():
+        for project_id in ProjectMembership.objects.filter(user_id=user_id).values_list('project_id', flat=True):
+            bump_counters(project_id, member_count=-1)
+        User.objects.filter(pk=user_id).delete()
+    return False
+
+
+@job('delete_attachment_files')
+def delete_attachment_files(names):
+    storage = attachment_storage()
+    # a file another attachment row still points at stays
+    kept = set(Attachments.objects.filter(files__in=names).values_list('files', flat=True))
+    for name in names:
+        if name not in kept:
+            storage.delete(name)
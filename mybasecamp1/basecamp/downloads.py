@@ -0,0 +1,141 @@
+import mimetypes
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import escape_uri_path
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+READ_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def attachment_etag(attachment, modified):
+    if attachment.checksum:
+        return quote_etag(attachment.checksum)
+    return quote_etag('%x-%x' % (int(modified.timestamp()), attachment.files.size))
+
+
+def parse_range(header, size):
+    match = RANGE_RE.match((header or '').strip())
+    if not match or size == 0:
+        return None
+    start, end = match.groups()
+    if start == '':
+        if end == '' or int(end) == 0:
+            return None
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified.timestamp())
+
+
+def iter_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def attachment_file_name(attachment):
+    return attachment.name or os.path.basename(attachment.files.name)
+
+
+def guess_content_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def sendfile_response(attachment):
+    mode = getattr(settings, 'BASECAMP_SENDFILE_MODE', None)
+    if mode == 'nginx':
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = escape_uri_path(settings.BASECAMP_SENDFILE_URL + attachment.files.name)
+    elif mode == 'apache':
+        response = HttpResponse()
+        response['X-Sendfile'] = attachment.files.path
+    else:
+        return None
+    # the proxy streams the body and answers Range requests itself
+    response['Content-Type'] = guess_content_type(attachment_file_name(attachment))
+    return response
+
+
+def serve_attachment(request, attachment):
+    storage = attachment.files.storage
+    name = attachment.files.name
+    modified = storage.get_modified_time(name)
+    etag = attachment_etag(attachment, modified)
+    last_modified = http_date(modified.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=modified.timestamp())
+    if response is None:
+        response = sendfile_response(attachment)
+    if response is None:
+        size = storage.size(name)
+        byte_range = None
+        if request.method == 'GET' and if_range_matches(request, etag, modified):
+            byte_range = parse_range(request.headers.get('Range'), size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(iter_range(storage.open(name, 'rb'), start, end - start + 1),
+                                             status=206)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            response = FileResponse(storage.open(name, 'rb'))
+        if response.status_code != 416:
+            response['Content-Type'] = guess_content_type(attachment_file_name(attachment))
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = 'private'
+    if response.status_code in (200, 206):
+        response['Content-Disposition'] = "attachment; filename*=UTF-8''%s" % escape_uri_path(
+            attachment_file_name(attachment))
+    return response
+
+
+async def _async_chunks(chunks):
+    next_chunk = sync_to_async(next)
+    done = object()
+    while True:
+        chunk = await next_chunk(chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+def streaming_download(request, chunks, file_name, content_type):
+    # under ASGI a synchronous iterator would be collected into a list before the first byte is sent
+    if isinstance(request, ASGIRequest):
+        chunks = _async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = "attachment; filename*=UTF-8''%s" % escape_uri_path(file_name)
+    response['Cache-Control'] = 'private'
+    return response
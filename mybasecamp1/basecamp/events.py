@@ -0,0 +1,34 @@
+from .middleware import get_current_user
+from .models import ProjectEvent
+
+EVENT_BATCH_SIZE = 1000
+
+
+def new_event(project_id, kind, target_id=None, actor=None, **data):
+    """An unsaved change log entry; the actor defaults to the user of the current request."""
+    if actor is None:
+        user = get_current_user()
+        actor = user.username if user is not None and user.is_authenticated else ''
+    return ProjectEvent(project_id=project_id, kind=kind, actor=actor, target_id=target_id, data=data)
+
+
+def record_event(project_id, kind, target_id=None, actor=None, **data):
+    """Append to the project's change log."""
+    event = new_event(project_id, kind, target_id, actor, **data)
+    event.save()
+    return event
+
+
+def record_events(events, batch_size=EVENT_BATCH_SIZE):
+    """Append events built with new_event() in batched INSERTs, for writes that skip the per-row paths."""
+    return ProjectEvent.objects.bulk_create(events, batch_size=batch_size)
+
+
+def member_event(membership, kind, username):
+    return new_event(membership.project_id, kind, membership.user_id, username=username, role=membership.role)
+
+
+def record_member_event(membership, kind, user):
+    event = member_event(membership, kind, user.username)
+    event.save()
+    return event
@@ -1,75 +1,231 @@
-from importlib.resources import _
+import csv
+import io
+
+from django.utils.translation import gettext as _
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.db import transaction
 
+from . import fragments
+from .access import invalidate_project_roles
+from .counters import bump_counters
+from .events import member_event, new_event, record_event, record_events, record_member_event
+from .lookups import get_lookups
 from .models import *
-
-
-def validate_project_title(input_title):
-    if Project.objects.filter(title=input_title):
-        raise ValidationError(_('%(input_name)s is exist'),
-                              params={'input_name': input_title},
-                              )
+from .blobs import create_attachment
 
 
 def validate_user(input_name):
-    if not User.objects.filter(username=input_name):
+    if get_lookups().user(input_name) is None:
         raise ValidationError(_('%(input_name)s is not exist'),
                               params={'input_name': input_name},
                               )
 
 
-class AddUserForm(forms.Form):
+class ProjectForm(forms.Form):
+    """A form acting on one project, the one the view authorized; posted data never picks it."""
+
+    def __init__(self, *args, project_id, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.project_id = project_id
+
+
+def make_admin(project_id, user):
+    """Add the user as an admin or promote them, returning (membership, created, promoted)."""
+    membership, created = ProjectMembership.objects.get_or_create(
+        project_id=project_id, user=user, defaults={'role': ProjectMembership.ADMIN})
+    promoted = not created and membership.role != ProjectMembership.ADMIN
+    if promoted:
+        membership.role = ProjectMembership.ADMIN
+        membership.save(update_fields=['role'])
+    return membership, created, promoted
+
+
+class AddUserForm(ProjectForm):
     user = forms.CharField(max_length=50, validators=[validate_user])
-    project_pk = forms.IntegerField()
     option = forms.CharField(max_length=30)
 
     user.widget.attrs.update({'class': 'form-widget', 'size': '54'})
 
     def change_user_status(self):
-        received_user = User.objects.get(username=self.cleaned_data['user'])
-        project = Project.objects.get(id=self.cleaned_data['project_pk'])
-        project_group = list(project.related_groups.exclude(name__endswith='-admin'))[0]
-        project_admin_group = project.related_groups.get(name__endswith='-admin')
+        lookups = get_lookups()
+        # validate_user already loaded the user for this request
+        received_user = lookups.user(self.cleaned_data['user'])
+        project_id = self.project_id
         option = self.cleaned_data['option']
         if option == 'Add user':
-            received_user.groups.add(project_group)
-        elif option == 'Add to admins':
-            received_user.groups.add(project_admin_group)
-        elif option == 'Delete user':
-            if project.created_by != received_user:
-                received_user.groups.remove(project_group, project_admin_group)
+            membership, created = ProjectMembership.objects.get_or_create(project_id=project_id, user=received_user)
+            bump_counters(project_id, member_count=int(created))
+            if created:
+                record_member_event(membership, ProjectEvent.MEMBER_ADDED, received_user)
+            return
+        if option == 'Add to admins':
+            membership, created, promoted = make_admin(project_id, received_user)
+            bump_counters(project_id, member_count=int(created))
+            if created or promoted:
+                kind = ProjectEvent.MEMBER_ADDED if created else ProjectEvent.MEMBER_ROLE_CHANGED
+                record_member_event(membership, kind, received_user)
+            return
+        membership = lookups.membership(project_id, received_user.id)
+        if membership and membership.project.created_by_id != received_user.id:
+            if option == 'Delete user':
+                membership.delete()
+                bump_counters(project_id, member_count=-1)
+                record_member_event(membership, ProjectEvent.MEMBER_REMOVED, received_user)
+            elif option == 'Remove from admins':
+                if membership.role == ProjectMembership.MEMBER:
+                    return
+                membership.role = ProjectMembership.MEMBER
+                membership.save(update_fields=['role'])
+                bump_counters(project_id)
+                record_member_event(membership, ProjectEvent.MEMBER_ROLE_CHANGED, received_user)
+
+
+class BulkMembershipForm(forms.Form):
+    users = forms.CharField(required=False, widget=forms.Textarea(attrs={'rows': 10, 'cols': 60, 'class': 'form-widget'}))
+    file = forms.FileField(required=False)
+    role = forms.ChoiceField(choices=ProjectMembership.ROLE_CHOICES, initial=ProjectMembership.MEMBER)
+    option = forms.ChoiceField(choices=[('Add users', 'Add users'), ('Remove users', 'Remove users')])
+
+    file.widget.attrs.update({'class': 'form-widget'})
+
+    def clean(self):
+        cleaned_data = super().clean()
+        text = cleaned_data.get('users') or ''
+        if cleaned_data.get('file'):
+            try:
+                text += '\n' + cleaned_data['file'].read().decode('utf-8-sig')
+            except UnicodeDecodeError:
+                raise ValidationError(_('The file must be UTF-8 encoded CSV'))
+        roles = dict(ProjectMembership.ROLE_CHOICES)
+        entries = {}
+        for row in csv.reader(io.StringIO(text)):
+            row = [cell.strip() for cell in row if cell.strip()]
+            if len(row) == 2 and row[1].lower() in roles:
+                entries[row[0]] = row[1].lower()
+            else:
+                for username in row:
+                    entries[username] = cleaned_data.get('role', ProjectMembership.MEMBER)
+        if not entries:
+            raise ValidationError(_('Enter at least one username'))
+        cleaned_data['entries'] = entries
+        return cleaned_data
+
+    @transaction.atomic
+    def apply_changes(self, project):
+        entries = self.cleaned_data['entries']
+        user_ids = dict(User.objects.filter(username__in=entries).values_list('username', 'id'))
+        result = {'added': [], 'updated': [], 'removed': [],
+                  'not_found': sorted(set(entries) - set(user_ids))}
+        usernames = {user_id: username for username, user_id in user_ids.items()}
+        memberships = ProjectMembership.objects.filter(project=project, user_id__in=user_ids.values())
+        events = []
+        if self.cleaned_data['option'] == 'Remove users':
+            removed = list(memberships.exclude(user_id=project.created_by_id).only('project_id', 'user_id', 'role'))
+            memberships.filter(pk__in=[membership.pk for membership in removed]).delete()
+            bump_counters(project.pk, member_count=-len(removed))
+            result['removed'] = sorted(usernames[membership.user_id] for membership in removed)
+            events = [member_event(membership, ProjectEvent.MEMBER_REMOVED, usernames[membership.user_id])
+                      for membership in removed]
         else:
-            if project.created_by != received_user:
-                received_user.groups.remove(project_admin_group)
+            existing = dict(memberships.values_list('user_id', 'role'))
+            new_memberships = []
+            changed = {ProjectMembership.MEMBER: [], ProjectMembership.ADMIN: []}
+            for username, user_id in user_ids.items():
+                role = entries[username]
+                if user_id == project.created_by_id:
+                    role = ProjectMembership.ADMIN
+                if user_id not in existing:
+                    new_memberships.append(ProjectMembership(project=project, user_id=user_id, role=role))
+                    result['added'].append(username)
+                elif existing[user_id] != role:
+                    changed[role].append(user_id)
+                    result['updated'].append(username)
+                    events.append(member_event(ProjectMembership(project=project, user_id=user_id, role=role),
+                                               ProjectEvent.MEMBER_ROLE_CHANGED, username))
+            ProjectMembership.objects.bulk_create(new_memberships, batch_size=500)
+            events += [member_event(membership, ProjectEvent.MEMBER_ADDED, usernames[membership.user_id])
+                       for membership in new_memberships]
+            for role, ids in changed.items():
+                if ids:
+                    memberships.filter(user_id__in=ids).update(role=role)
+            result['added'].sort()
+            result['updated'].sort()
+            bump_counters(project.pk, member_count=len(new_memberships))
+        # bulk_create and queryset updates send no signals, so the feed gets its events here
+        record_events(events)
+        transaction.on_commit(lambda: invalidate_project_roles(*user_ids.values()))
+        fragments.bump_sections(project.pk, fragments.MEMBERS)
+        return result
+
 
+class TaskBulkSolveForm(forms.Form):
+    max_tasks = 1000
 
-class AddDiscussionForm(forms.Form):
+    tasks = forms.Field(widget=forms.MultipleHiddenInput)
+    is_solved = forms.TypedChoiceField(choices=[('1', 'Solved'), ('0', 'Open')], coerce=lambda value: value == '1')
+
+    def clean_tasks(self):
+        try:
+            task_ids = {int(task_id) for task_id in self.cleaned_data['tasks']}
+        except (TypeError, ValueError):
+            raise ValidationError(_('Task ids must be integers'))
+        if len(task_ids) > self.max_tasks:
+            raise ValidationError(_('Select at most %(max)d tasks'), params={'max': self.max_tasks})
+        return task_ids
+
+    @transaction.atomic
+    def apply_changes(self, project_id):
+        is_solved = self.cleaned_data['is_solved']
+        tasks = (Task.objects.filter(related_project_id=project_id, id__in=self.cleaned_data['tasks'])
+                 .exclude(is_solved=is_solved))
+        task_ids = list(tasks.values_list('pk', flat=True))
+        updated = tasks.filter(pk__in=task_ids).update(is_solved=is_solved)
+        if updated:
+            fragments.bump_sections(project_id, fragments.TASKS)
+            bump_counters(project_id, open_task_count=-updated if is_solved else updated)
+            record_events([new_event(project_id, ProjectEvent.TASK_UPDATED, task_id, is_solved=is_solved)
+                           for task_id in task_ids])
+        return updated
+
+
+class AddDiscussionForm(ProjectForm):
     title = forms.CharField(max_length=255)
     user_id = forms.IntegerField(required=False)
-    project_pk = forms.IntegerField()
     discussion_id = forms.IntegerField(required=False)
     file = forms.FileField(required=False)
     option = forms.CharField(max_length=30)
 
     file.widget.attrs.update({'class': 'form-widget'})
 
-    def serve_discussion_form(self):
-        project = Project.objects.get(id=self.cleaned_data['project_pk'])
+    def serve_discussion_form(self, user=None):
+        project = Project.objects.get(id=self.project_id)
         name = self.cleaned_data['title']
         option = self.cleaned_data['option']
         if option == 'Add discussion':
-            Discussion.objects.create(disc_name=name, related_project=project)
+            discussion = Discussion.objects.create(disc_name=name, related_project=project)
+            bump_counters(project.pk, discussion_count=1)
+            record_event(project.pk, ProjectEvent.DISCUSSION_ADDED, discussion.pk, name=name)
+            return discussion
         elif option == 'Send':
-            received_user = User.objects.get(id=self.cleaned_data['user_id'])
-            discussion = Discussion.objects.get(id=self.cleaned_data['discussion_id'])
-            DiscussionMessage.objects.create(user=received_user.username,
-                                             message_text=name, related_discussion=discussion)
+            received_user = user or User.objects.get(id=self.cleaned_data['user_id'])
+            discussion = Discussion.objects.get(id=self.cleaned_data['discussion_id'], related_project=project)
+            message = DiscussionMessage.objects.create(user=received_user.username,
+                                                       message_text=name, related_discussion=discussion)
+            bump_counters(project.pk, message_count=1)
+            record_event(project.pk, ProjectEvent.MESSAGE_ADDED, message.pk, actor=received_user.username,
+                         discussion=discussion.pk)
+            return message
         elif option == 'Add new task':
-            Task.objects.create(task_name=name, related_project=project)
+            task = Task.objects.create(task_name=name, related_project=project)
+            bump_counters(project.pk, open_task_count=1)
+            record_event(project.pk, ProjectEvent.TASK_ADDED, task.pk, name=name)
+            return task
         elif option == 'Add attachment':
-            file = self.cleaned_data['file']
-            Attachments.objects.create(files=file, related_project=project)
+            attachment = create_attachment(project, self.cleaned_data['file'])
+            record_event(project.pk, ProjectEvent.ATTACHMENT_ADDED, attachment.pk, name=attachment.name,
+                         size=attachment.size)
+            return attachment
 
 
 class CustomUserCreationForm(UserCreationForm):
@@ -103,12 +259,20 @@ class UserInfoForm(forms.ModelForm):
         fields = ['username', 'first_name', 'last_name', 'email']
 
 
-class EditProjectForm(forms.Form):
+class EditProjectForm(ProjectForm):
     title = forms.CharField(max_length=255, required=False, widget=forms.Textarea(attrs={'rows': 2, 'cols': 80, 'class': 'form-widget'}))
     description = forms.CharField(max_length=255, required=False,
                                   widget=forms.Textarea(attrs={'rows': 3, 'cols': 80, 'class': 'form-widget'}))
-    project_pk = forms.IntegerField()
     option = forms.CharField(max_length=30)
     member = forms.CharField(max_length=100, required=False, validators=[validate_user],
                              widget=forms.TextInput(attrs={'class': 'form-widget', 'size': '60'}))
     admin = forms.BooleanField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('option') == 'Update_name':
+            try:
+                validate_project_title(cleaned_data.get('title', ''), exclude_pk=self.project_id)
+            except ValidationError as error:
+                self.add_error('title', error)
+        return cleaned_data
@@ -0,0 +1,99 @@
+import time
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.utils.html import format_html
+
+MEMBERS = 'members'
+DISCUSSIONS = 'discussions'
+TASKS = 'tasks'
+FILES = 'files'
+SECTIONS = (MEMBERS, DISCUSSIONS, TASKS, FILES)
+
+# cached fragments are shared between users, so their forms carry this marker instead of a CSRF token
+CSRF_SLOT = '<!--basecamp-csrf-slot-->'
+
+
+def _version_key(project_id, section):
+    return 'basecamp:project:%s:%s:version' % (project_id, section)
+
+
+def fragments_cached():
+    # a bump reaches only the cache of the process that made the change, so with a per-process
+    # cache the other workers would keep serving the old sections; render them every time instead
+    return getattr(settings, 'BASECAMP_CACHE_SHARED', False)
+
+
+def fragment_timeout():
+    if not fragments_cached():
+        return 0
+    return getattr(settings, 'BASECAMP_FRAGMENT_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_section_versions(project_id):
+    if not fragments_cached():
+        return dict.fromkeys(SECTIONS, 0)
+    keys = {section: _version_key(project_id, section) for section in SECTIONS}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for section, key in keys.items():
+        if key not in found:
+            # start from the clock so a re-created key never reuses an older version
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            found[key] = cache.get(key)
+        versions[section] = found[key]
+    return versions
+
+
+async def aget_section_versions(project_id):
+    if not fragments_cached():
+        return dict.fromkeys(SECTIONS, 0)
+    keys = {section: _version_key(project_id, section) for section in SECTIONS}
+    found = await cache.aget_many(keys.values())
+    versions = {}
+    for section, key in keys.items():
+        if key not in found:
+            await cache.aadd(key, int(time.time() * 1000), timeout=None)
+            found[key] = await cache.aget(key)
+        versions[section] = found[key]
+    return versions
+
+
+def _fragment_cache():
+    # the same lookup the {% cache %} tag does
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+async def amissing_sections(project_id, versions):
+    """Sections of the project page whose {% cache %} fragment has to be rendered again."""
+    if not fragments_cached():
+        return list(SECTIONS)
+    keys = {section: make_template_fragment_key('project_' + section, [project_id, versions[section]])
+            for section in SECTIONS}
+    found = await _fragment_cache().aget_many(keys.values())
+    return [section for section, key in keys.items() if key not in found]
+
+
+def _bump(project_id, sections):
+    if not fragments_cached():
+        return
+    for section in sections:
+        try:
+            cache.incr(_version_key(project_id, section))
+        except ValueError:
+            pass
+
+
+def bump_sections(project_id, *sections):
+    transaction.on_commit(lambda: _bump(project_id, sections))
+
+
+def fill_csrf_slots(request, content):
+    token_input = format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', get_token(request))
+    return content.replace(CSRF_SLOT.encode(), token_input.encode())
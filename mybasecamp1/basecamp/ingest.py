@@ -0,0 +1,131 @@
+import datetime
+import json
+from collections import Counter
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import fragments, search
+from .archive import bulk_create_with_times
+from .counters import bump_counters
+from .events import new_event, record_events
+from .models import Discussion, DiscussionMessage, ProjectEvent, Task
+
+INGEST_BATCH_SIZE = 1000
+INGEST_MAX_BATCH_SIZE = 5000
+MESSAGE = 'message'
+TASK = 'task'
+
+
+def _time_create(value):
+    if value in (None, ''):
+        return None
+    try:
+        moment = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        # well formed but not a real date, such as February 30th
+        moment = None
+    if moment is None:
+        raise ValidationError('Enter an ISO 8601 date and time')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, datetime.timezone.utc)
+    return moment
+
+
+def _build(project, row, discussions, default_user):
+    """Turn one input row into an unsaved message or task and its time_create, or raise ValidationError."""
+    if not isinstance(row, dict):
+        raise ValidationError({'row': ['Each row must be a JSON object']})
+    errors = {}
+    try:
+        time_create = _time_create(row.get('time_create'))
+    except ValidationError as error:
+        errors['time_create'] = error.messages
+    kind = row.get('type')
+    if kind == MESSAGE:
+        discussion_id = row.get('discussion')
+        if type(discussion_id) is not int or discussion_id not in discussions:
+            errors['discussion'] = ['No discussion %r in this project' % (discussion_id,)]
+        obj = DiscussionMessage(user=row.get('user') or default_user, message_text=row.get('text') or '',
+                                related_discussion_id=discussion_id)
+        exclude = ['related_discussion', 'time_create']
+    elif kind == TASK:
+        is_solved = row.get('is_solved', False)
+        if not isinstance(is_solved, bool):
+            errors['is_solved'] = ['Must be true or false']
+        obj = Task(task_name=row.get('name') or '', is_solved=is_solved is True, related_project=project)
+        exclude = ['related_project', 'time_create']
+    else:
+        raise ValidationError({'type': ['Must be "%s" or "%s"' % (MESSAGE, TASK)]})
+    # field validators only: the foreign keys were checked above for the whole batch
+    try:
+        obj.clean_fields(exclude=exclude)
+    except ValidationError as error:
+        errors.update(error.message_dict)
+    if errors:
+        raise ValidationError(errors)
+    return obj, time_create
+
+
+def ingest_rows(project, rows, default_user='', batch_size=INGEST_BATCH_SIZE):
+    """
+    Validate message and task rows and insert the valid ones into the project, one transaction per
+    `batch_size` rows. Returns the number created per type and the rejected rows as (row number, errors).
+    """
+    backend = search.get_search_backend()
+    created = Counter()
+    rejected = []
+    numbered = enumerate(rows, 1)
+    while True:
+        batch = list(islice(numbered, batch_size))
+        if not batch:
+            break
+        referenced = [row.get('discussion') for number, row in batch
+                      if isinstance(row, dict) and row.get('type') == MESSAGE]
+        discussions = dict(Discussion.objects.filter(related_project=project,
+                                                     pk__in=[pk for pk in referenced if type(pk) is int])
+                           .values_list('pk', 'disc_name'))
+        messages, tasks = [], []
+        for number, row in batch:
+            try:
+                obj, time_create = _build(project, row, discussions, default_user)
+            except ValidationError as error:
+                rejected.append((number, error.message_dict))
+                continue
+            (messages if isinstance(obj, DiscussionMessage) else tasks).append((obj, time_create))
+        if not messages and not tasks:
+            continue
+
+        with transaction.atomic():
+            for model, pairs in ((DiscussionMessage, messages), (Task, tasks)):
+                if pairs:
+                    bulk_create_with_times(model, [obj for obj, _ in pairs], [moment for _, moment in pairs],
+                                           batch_size)
+            bump_counters(project.pk, message_count=len(messages),
+                          open_task_count=sum(not task.is_solved for task, _ in tasks))
+            # bulk_create sends no post_save, so the new rows are indexed here
+            backend.bulk_index([(search.MESSAGE, message.pk, project.pk, discussions[message.related_discussion_id],
+                                 message.message_text) for message, _ in messages] +
+                               [(search.TASK, task.pk, project.pk, task.task_name, '') for task, _ in tasks])
+            record_events([new_event(project.pk, ProjectEvent.MESSAGE_ADDED, message.pk, actor=message.user,
+                                     discussion=message.related_discussion_id) for message, _ in messages] +
+                          [new_event(project.pk, ProjectEvent.TASK_ADDED, task.pk, name=task.task_name)
+                           for task, _ in tasks], batch_size)
+        created['messages'] += len(messages)
+        created['tasks'] += len(tasks)
+
+    if created['messages'] or created['tasks']:
+        fragments.bump_sections(project.pk, fragments.DISCUSSIONS, fragments.TASKS)
+    return created, rejected
+
+
+def read_ndjson(lines):
+    """One row per line; a line that is not JSON becomes a row that is rejected with its line number."""
+    for line in lines:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
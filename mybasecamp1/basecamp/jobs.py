@@ -0,0 +1,101 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Blob, Job
+from .storage import attachment_storage
+
+logger = logging.getLogger('basecamp.jobs')
+
+handlers = {}
+
+
+def job(name):
+    """
+    Register a job handler; a handler that returns True has more batches to run and is queued again.
+    Handlers run outside a transaction and keep their own atomic blocks short, and may run again after
+    a failure, so every step has to be safe to repeat.
+    """
+    def register(func):
+        handlers[name] = func
+        return func
+    return register
+
+
+def enqueue(name, delay=0, max_attempts=None, **payload):
+    # created in the caller's transaction, so the job only exists if the write that asked for it commits
+    if name not in handlers:
+        raise LookupError('No job handler registered as %r' % name)
+    fields = {'max_attempts': max_attempts} if max_attempts else {}
+    return Job.objects.create(name=name, payload=payload, run_at=timezone.now() + timedelta(seconds=delay),
+                              **fields)
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'BASECAMP_JOB_RETRY_DELAY', 30)
+    return min(base * 2 ** (attempts - 1), getattr(settings, 'BASECAMP_JOB_MAX_RETRY_DELAY', 60 * 60))
+
+
+def claim_jobs(limit=10):
+    now = timezone.now()
+    # a worker that died mid-job leaves it running; it becomes due again once its lock expires
+    expired = now - timedelta(seconds=getattr(settings, 'BASECAMP_JOB_LOCK_TIMEOUT', 10 * 60))
+    Job.objects.filter(status=Job.RUNNING, locked_at__lt=expired).update(status=Job.QUEUED, locked_at=None)
+    due = list(Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'pk')
+               .values_list('pk', flat=True)[:limit])
+    claimed = [pk for pk in due
+               if Job.objects.filter(pk=pk, status=Job.QUEUED).update(status=Job.RUNNING, locked_at=now,
+                                                                       attempts=F('attempts') + 1)]
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_at', 'pk'))
+
+
+def run_job(job):
+    """Run one claimed job and return the status it ends in, None once it is finished and removed."""
+    try:
+        handler = handlers.get(job.name)
+        if handler is None:
+            raise LookupError('No job handler registered as %r' % job.name)
+        more = handler(**job.payload)
+    except Exception:
+        now = timezone.now()
+        changes = {'status': Job.QUEUED, 'locked_at': None, 'last_error': traceback.format_exc()}
+        if job.attempts >= job.max_attempts:
+            changes['status'] = Job.FAILED
+            logger.exception('Job %s failed after %d attempts', job, job.attempts)
+        else:
+            changes['run_at'] = now + timedelta(seconds=retry_delay(job.attempts))
+            logger.warning('Job %s failed, retrying', job, exc_info=True)
+        Job.objects.filter(pk=job.pk).update(**changes)
+        return changes['status']
+    if more:
+        # a finished batch is progress, not a failed attempt
+        Job.objects.filter(pk=job.pk).update(status=Job.QUEUED, locked_at=None, attempts=0, last_error='')
+        return Job.QUEUED
+    Job.objects.filter(pk=job.pk).delete()
+    return None
+
+
+def run_pending(limit=10):
+    """Run due jobs until none are left and return how many runs that took."""
+    runs = 0
+    while True:
+        claimed = claim_jobs(limit)
+        if not claimed:
+            return runs
+        for claimed_job in claimed:
+            run_job(claimed_job)
+            runs += 1
+
+
+@job('delete_blob_files')
+def delete_blob_files(digests):
+    storage = attachment_storage()
+    # a digest uploaded again after it was released has a row again and keeps its file
+    alive = set(Blob.objects.filter(digest__in=digests).values_list('digest', flat=True))
+    for digest in digests:
+        if digest not in alive:
+            storage.delete(storage.blob_name(digest))
@@ -0,0 +1,38 @@
+from django.contrib.auth.models import User
+
+from .middleware import get_current_request
+from .models import ProjectMembership
+
+
+class Lookups:
+    """Users and memberships resolved once per request, shared by form validators and form actions."""
+
+    def __init__(self):
+        self._users = {}
+        self._memberships = {}
+
+    def user(self, username):
+        """The user with this username, or None; only the columns a membership change needs are loaded."""
+        if username not in self._users:
+            self._users[username] = User.objects.only('id', 'username').filter(username=username).first()
+        return self._users[username]
+
+    def membership(self, project_id, user_id):
+        """The membership with its project's creator, or None."""
+        key = (project_id, user_id)
+        if key not in self._memberships:
+            self._memberships[key] = (ProjectMembership.objects.select_related('project')
+                                      .only('role', 'user_id', 'project__created_by_id')
+                                      .filter(project_id=project_id, user_id=user_id).first())
+        return self._memberships[key]
+
+
+def get_lookups():
+    """The lookups of the request being handled; outside a request every call starts empty."""
+    request = get_current_request()
+    if request is None:
+        return Lookups()
+    lookups = getattr(request, '_basecamp_lookups', None)
+    if lookups is None:
+        lookups = request._basecamp_lookups = Lookups()
+    return lookups
@@ -0,0 +1,64 @@
+import itertools
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from basecamp.search import MESSAGE, SQLiteFTS5Backend
+
+ALIAS = 'search_benchmark'
+VOCABULARY_SIZE = 20000
+
+
+class Command(BaseCommand):
+    help = 'Time full-text searches against a scratch SQLite index filled with synthetic messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000000)
+        parser.add_argument('--projects', type=int, default=1000)
+        parser.add_argument('--accessible', type=int, default=50,
+                            help='Number of projects the searching user can access')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(VOCABULARY_SIZE)]
+        # zipf-like weights so a few words are common and most are rare, as in real text
+        weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(VOCABULARY_SIZE)))
+        path = os.path.join(tempfile.mkdtemp(), 'search.sqlite3')
+        databases = dict(connections.settings, **{ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}})
+        connections.settings[ALIAS] = connections.configure_settings(databases)[ALIAS]
+        try:
+            with connections[ALIAS].schema_editor() as schema_editor:
+                SQLiteFTS5Backend.create_table(schema_editor)
+            backend = SQLiteFTS5Backend(ALIAS)
+
+            started = time.perf_counter()
+            for offset in range(0, options['messages'], options['batch_size']):
+                count = min(options['batch_size'], options['messages'] - offset)
+                backend.bulk_index(
+                    (MESSAGE, offset + i + 1, rng.randint(1, options['projects']), 'Discussion',
+                     ' '.join(rng.choices(words, cum_weights=weights, k=12)))
+                    for i in range(count))
+            self.stdout.write('Indexed %d messages in %.1fs' % (options['messages'], time.perf_counter() - started))
+
+            project_ids = rng.sample(range(1, options['projects'] + 1), min(options['accessible'], options['projects']))
+            timings = []
+            for _ in range(options['queries']):
+                query = ' '.join(rng.choices(words, cum_weights=weights, k=2))
+                started = time.perf_counter()
+                backend.search(query, project_ids)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write('%d queries: p50 %.2fms, p95 %.2fms, max %.2fms' % (
+                len(timings), statistics.median(timings), timings[int(len(timings) * 0.95) - 1], timings[-1]))
+        finally:
+            connections[ALIAS].close()
+            del connections.settings[ALIAS]
+            os.remove(path)
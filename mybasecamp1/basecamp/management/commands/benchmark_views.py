@@ -0,0 +1,59 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from basecamp.benchmarks import Scale, generate_data, report, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Fill a throwaway test database with synthetic data, request every basecamp view and '
+            'fail when a view exceeds its query budget')
+
+    def add_arguments(self, parser):
+        defaults = Scale()
+        for name in ('users', 'projects', 'members', 'discussions', 'messages', 'tasks', 'attachments'):
+            parser.add_argument('--%s' % name, type=int, default=getattr(defaults, name))
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        scale = Scale(**{name: options[name] for name in Scale.__dataclass_fields__})
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        databases = runner.setup_databases()
+        try:
+            with override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BASECAMP_UPLOAD_TEMP_DIR=tempfile.mkdtemp()):
+                data = generate_data(scale)
+                result = report(data, run_benchmarks(data, options['repeat']))
+        finally:
+            runner.teardown_databases(databases)
+            teardown_test_environment()
+
+        output = json.dumps(result, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['baseline']:
+            self.compare(result, options['baseline'])
+        if result['failed']:
+            for entry in result['results']:
+                for failure in entry['failures']:
+                    self.stderr.write('%s: %s' % (entry['view'], failure))
+            raise CommandError('%d views failed their budgets' % len(result['failed']))
+
+    def compare(self, result, baseline_path):
+        with open(baseline_path) as file:
+            baseline = {entry['view']: entry for entry in json.load(file)['results']}
+        for entry in result['results']:
+            before = baseline.get(entry['view'])
+            if before is None:
+                continue
+            self.stderr.write('%-26s queries %3d -> %3d   median %8.2fms -> %8.2fms   peak %8.1fKB -> %8.1fKB' % (
+                entry['view'], before['queries'], entry['queries'], before['median_ms'] or 0,
+                entry['median_ms'] or 0, before['peak_kb'], entry['peak_kb']))
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from basecamp.models import UploadSession
+from basecamp.uploads import abort_upload
+
+
+class Command(BaseCommand):
+    help = 'Remove chunked upload sessions that were not completed in time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        removed = 0
+        for session in UploadSession.objects.filter(time_create__lt=cutoff).iterator():
+            abort_upload(session)
+            removed += 1
+        self.stdout.write('Removed %d stale upload sessions' % removed)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from basecamp.deletion import DELETE_BATCH_SIZE, iter_delete_project
+from basecamp.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Delete projects with everything in them in small batches, reporting progress'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_ids', nargs='+', type=int)
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        missing = set(options['project_ids']) - set(Project.objects.filter(pk__in=options['project_ids'])
+                                                    .values_list('pk', flat=True))
+        if missing:
+            raise CommandError('No project with id %s' % ', '.join(map(str, sorted(missing))))
+        for project_id in options['project_ids']:
+            totals = {}
+            for label, deleted in iter_delete_project(project_id, options['batch_size']):
+                totals[label] = totals.get(label, 0) + deleted
+                if options['verbosity'] > 1:
+                    self.stdout.write('Project %d: %s %d deleted' % (project_id, label, totals[label]))
+            self.stdout.write('Deleted project %d: %s' % (
+                project_id, ', '.join('%d %s' % (count, label) for label, count in totals.items())))
@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from basecamp.archive import iter_export
+from basecamp.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Write a project with its discussions, tasks and files to a zip archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int)
+        parser.add_argument('output', help="archive path, '-' for standard output")
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(pk=options['project_id'])
+        except Project.DoesNotExist:
+            raise CommandError('No project with id %s' % options['project_id'])
+        if options['output'] == '-':
+            for chunk in iter_export(project):
+                sys.stdout.buffer.write(chunk)
+            return
+        written = 0
+        with open(options['output'], 'wb') as output:
+            for chunk in iter_export(project):
+                output.write(chunk)
+                written += len(chunk)
+        self.stderr.write('Exported project %d to %s (%d bytes)' % (project.pk, options['output'], written))
@@ -0,0 +1,29 @@
+import zipfile
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from basecamp.archive import IMPORT_BATCH_SIZE, ArchiveError, import_project
+
+
+class Command(BaseCommand):
+    help = 'Create a project from an archive written by export_project'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive')
+        parser.add_argument('--owner', required=True, help='username of the new project creator')
+        parser.add_argument('--title', help='title for the new project, defaults to the exported one')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError('No user named %s' % options['owner'])
+        try:
+            with open(options['archive'], 'rb') as archive:
+                project, counts = import_project(archive, owner, options['title'], options['batch_size'])
+        except (ArchiveError, zipfile.BadZipFile, OSError) as error:
+            raise CommandError(error)
+        self.stdout.write('Imported project %d "%s": %s' % (
+            project.pk, project.title, ', '.join('%d %s' % (count, name) for name, count in counts.items())))
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from basecamp.ingest import INGEST_BATCH_SIZE, ingest_rows, read_ndjson
+from basecamp.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Add messages and tasks to a project from NDJSON rows, reporting the rows that were rejected'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int)
+        parser.add_argument('input', help="NDJSON path, '-' for standard input")
+        parser.add_argument('--user', default='', help='author of messages whose row names none')
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(pk=options['project_id'])
+        except Project.DoesNotExist:
+            raise CommandError('No project with id %s' % options['project_id'])
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if options['input'] == '-':
+            created, rejected = self.ingest(project, sys.stdin, options)
+        else:
+            try:
+                with open(options['input'], encoding='utf-8') as source:
+                    created, rejected = self.ingest(project, source, options)
+            except OSError as error:
+                raise CommandError(error)
+        for number, errors in rejected:
+            self.stderr.write('Row %d rejected: %s' % (number, '; '.join(
+                '%s: %s' % (field, ' '.join(messages)) for field, messages in errors.items())))
+        self.stdout.write('Project %d: %d messages and %d tasks created, %d rows rejected' % (
+            project.pk, created['messages'], created['tasks'], len(rejected)))
+
+    def ingest(self, project, source, options):
+        return ingest_rows(project, read_ndjson(source), options['user'], options['batch_size'])
@@ -0,0 +1,41 @@
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from basecamp.blobs import acquire_blob
+from basecamp.models import Attachments
+from basecamp.storage import attachment_storage
+
+
+class Command(BaseCommand):
+    help = 'Move attachments saved under files/%Y/%m/%d/ into content-addressed blob storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-originals', action='store_true',
+                            help='Leave the original files in place after copying them')
+
+    def handle(self, *args, **options):
+        storage = attachment_storage()
+        legacy_storage = FileSystemStorage(location=storage.location)
+        migrated = missing = 0
+        for attachment in Attachments.objects.exclude(files__startswith=storage.blob_prefix + '/').iterator():
+            old_name = attachment.files.name
+            if not legacy_storage.exists(old_name):
+                missing += 1
+                self.stderr.write('Missing file for attachment %d: %s' % (attachment.pk, old_name))
+                continue
+            with legacy_storage.open(old_name, 'rb') as file:
+                new_name = storage.save(old_name, file)
+            with transaction.atomic():
+                attachment.files.name = new_name
+                attachment.checksum = os.path.basename(new_name)
+                attachment.size = storage.size(new_name)
+                attachment.name = attachment.name or os.path.basename(old_name)
+                attachment.save(update_fields=['files', 'checksum', 'size', 'name'])
+                acquire_blob(attachment.checksum, attachment.size)
+            if not options['keep_originals']:
+                legacy_storage.delete(old_name)
+            migrated += 1
+        self.stdout.write('Migrated %d attachments, %d files missing' % (migrated, missing))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from basecamp.counters import reconcile_counters
+from basecamp.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized activity counters on projects and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_ids', nargs='*', type=int)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        projects = Project.objects.all()
+        if options['project_ids']:
+            projects = projects.filter(pk__in=options['project_ids'])
+        repaired = reconcile_counters(projects, batch_size=options['batch_size'])
+        self.stdout.write('Repaired counters on %d projects' % repaired)
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from basecamp.jobs import claim_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs, retrying failures with exponential backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='exit once no job is due instead of polling')
+        parser.add_argument('--batch', type=int, default=10, help='jobs claimed per round')
+        parser.add_argument('--sleep', type=float, default=5, help='seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        runs = 0
+        try:
+            while True:
+                claimed = claim_jobs(options['batch'])
+                if not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                for job in claimed:
+                    status = run_job(job)
+                    runs += 1
+                    if options['verbosity'] > 1:
+                        self.stdout.write('%s: %s' % (job, status or 'finished'))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Ran %d jobs' % runs)
@@ -0,0 +1,109 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('basecamp.metrics')
+
+PLACEHOLDER_LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+PERCENTILES = (50, 90, 99)
+
+
+def fingerprint(sql):
+    # IN lists of any length and inlined literals collapse so the same query shape groups together
+    sql = PLACEHOLDER_LIST_RE.sub('(...)', sql)
+    return LITERAL_RE.sub('?', sql)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.render_started = None
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def capture(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    def duplicates(self, threshold=2):
+        return {sql: count for sql, count in self.fingerprints.most_common() if count >= threshold}
+
+    def sample(self, response_size):
+        return {'total_ms': (time.perf_counter() - self.started) * 1000, 'db_ms': self.db_time * 1000,
+                'queries': self.queries, 'render_ms': self.render_time * 1000, 'size': response_size}
+
+
+class MetricsRegistry:
+    """Rolling per-view window of request samples kept in this process."""
+
+    fields = ('total_ms', 'db_ms', 'queries', 'render_ms', 'size')
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._duplicates = {}
+
+    def record(self, view, sample, duplicates):
+        with self._lock:
+            self._samples.setdefault(view, deque(maxlen=self.window)).append(sample)
+            counter = self._duplicates.setdefault(view, Counter())
+            counter.update(duplicates.keys())
+
+    def snapshot(self):
+        with self._lock:
+            samples = {view: list(values) for view, values in self._samples.items()}
+            duplicates = {view: counter.most_common(5) for view, counter in self._duplicates.items()}
+        report = {}
+        for view, values in samples.items():
+            stats = {'requests': len(values)}
+            for name in self.fields:
+                column = [sample[name] for sample in values if sample[name] is not None]
+                if column:
+                    stats[name] = {'p%d' % pct: round(percentile(column, pct), 3) for pct in PERCENTILES}
+            stats['duplicate_queries'] = [{'sql': sql, 'requests': count} for sql, count in duplicates.get(view, [])]
+            report[view] = stats
+        return report
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._duplicates.clear()
+
+
+registry = MetricsRegistry(getattr(settings, 'BASECAMP_METRICS_WINDOW', 500))
+
+
+def server_timing(sample):
+    return ', '.join([
+        'db;dur=%.1f;desc="%d queries"' % (sample['db_ms'], sample['queries']),
+        'render;dur=%.1f' % sample['render_ms'],
+        'total;dur=%.1f' % sample['total_ms'],
+    ])
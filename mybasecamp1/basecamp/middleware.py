@@ -0,0 +1,109 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .metrics import RequestProfile, logger, registry, server_timing
+
+# holds the request rather than the lazy request.user: asgiref inspects context values when it
+# switches threads, which would load the user from inside the event loop
+_current_request = ContextVar('basecamp_current_request', default=None)
+
+
+def get_current_request():
+    """The request being handled, or None outside a request."""
+    return _current_request.get()
+
+
+def get_current_user():
+    """The user of the request being handled, or None outside a request."""
+    return getattr(get_current_request(), 'user', None)
+
+
+class CurrentUserMiddleware:
+    """Makes the request user available through a context variable, which follows a request across
+    threads and tasks unlike the thread-local it replaces."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+
+class RequestMetricsMiddleware:
+    """Opt-in profiling of every request: queries, DB and render time, response size."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.duplicate_threshold = getattr(settings, 'BASECAMP_METRICS_DUPLICATE_THRESHOLD', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = request.basecamp_profile = RequestProfile()
+        with profile.capture():
+            response = self.get_response(request)
+        return self.record(request, profile, response)
+
+    async def __acall__(self, request):
+        profile = request.basecamp_profile = RequestProfile()
+        # connections belong to the thread the request's ORM calls run in, so the wrappers go on there
+        capture = await sync_to_async(profile.capture)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(capture.close)()
+        return self.record(request, profile, response)
+
+    def record(self, request, profile, response):
+        if response.streaming:
+            size = int(response['Content-Length']) if response.has_header('Content-Length') else None
+        else:
+            size = len(response.content)
+        sample = profile.sample(size)
+        response['Server-Timing'] = server_timing(sample)
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        duplicates = profile.duplicates(self.duplicate_threshold)
+        if duplicates:
+            logger.warning('%s ran %d queries; repeated: %s', view, profile.queries,
+                           '; '.join('%dx %s' % (count, sql[:200]) for sql, count in duplicates.items()))
+        registry.record(view, sample, duplicates)
+        return response
+
+    def process_template_response(self, request, response):
+        # runs right before the response is rendered; the callback fires right after
+        profile = request.basecamp_profile
+        profile.render_started = time.perf_counter()
+
+        def rendered(response):
+            profile.render_time += time.perf_counter() - profile.render_started
+
+        response.add_post_render_callback(rendered)
+        return response
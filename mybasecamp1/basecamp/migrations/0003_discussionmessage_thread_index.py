@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basecamp', '0002_auto_20220510_1602'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='discussionmessage',
+            index=models.Index(fields=['related_discussion', 'time_create', 'id'], name='basecamp_message_thread_idx'),
+        ),
+    ]
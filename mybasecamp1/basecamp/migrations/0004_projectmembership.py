@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('basecamp', '0003_discussionmessage_thread_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('member', 'Member'), ('admin', 'Admin')], default='member', max_length=10)),
+                ('time_create', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='basecamp.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'project', 'role'], name='basecamp_membership_user_idx'), models.Index(fields=['project', 'role'], name='basecamp_membership_role_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='projectmembership',
+            constraint=models.UniqueConstraint(fields=('project', 'user'), name='basecamp_membership_unique'),
+        ),
+    ]
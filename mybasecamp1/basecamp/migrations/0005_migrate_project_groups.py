@@ -0,0 +1,70 @@
+from django.db import migrations
+
+
+def groups_to_memberships(apps, schema_editor):
+    Project = apps.get_model('basecamp', 'Project')
+    ProjectMembership = apps.get_model('basecamp', 'ProjectMembership')
+    Group = apps.get_model('auth', 'Group')
+    Permission = apps.get_model('auth', 'Permission')
+    User = apps.get_model('auth', 'User')
+
+    group_ids = []
+    codenames = []
+    for project in Project.objects.only('id', 'created_by_id').iterator():
+        roles = {}
+        for group in project.related_groups.all():
+            group_ids.append(group.id)
+            role = 'admin' if group.name.endswith('-admin') else 'member'
+            for user_id in User.objects.filter(groups=group).values_list('id', flat=True):
+                if roles.get(user_id) != 'admin':
+                    roles[user_id] = role
+        if project.created_by_id:
+            roles[project.created_by_id] = 'admin'
+        ProjectMembership.objects.bulk_create(
+            [ProjectMembership(project_id=project.id, user_id=user_id, role=role) for user_id, role in roles.items()]
+        )
+        codenames += ['view_%s' % project.id, 'change_%s' % project.id]
+
+    for start in range(0, len(group_ids), 500):
+        Group.objects.filter(id__in=group_ids[start:start + 500]).delete()
+    for start in range(0, len(codenames), 500):
+        Permission.objects.filter(content_type__app_label='basecamp', content_type__model='project',
+                                  codename__in=codenames[start:start + 500]).delete()
+
+
+def memberships_to_groups(apps, schema_editor):
+    Project = apps.get_model('basecamp', 'Project')
+    ProjectMembership = apps.get_model('basecamp', 'ProjectMembership')
+    Group = apps.get_model('auth', 'Group')
+    Permission = apps.get_model('auth', 'Permission')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    content_type, _ = ContentType.objects.get_or_create(app_label='basecamp', model='project')
+    for project in Project.objects.only('id').iterator():
+        group_admin = Group.objects.create(name=str(project.id) + '-admin')
+        group = Group.objects.create(name=str(project.id))
+        project.related_groups.add(group, group_admin)
+        group.permissions.add(Permission.objects.create(codename='view_' + str(project.id),
+                                                        name='Can view ' + str(project.id),
+                                                        content_type=content_type))
+        group_admin.permissions.add(Permission.objects.create(codename='change_' + str(project.id),
+                                                              name='Can change ' + str(project.id),
+                                                              content_type=content_type))
+        for membership in ProjectMembership.objects.filter(project_id=project.id):
+            group.user_set.add(membership.user_id)
+            if membership.role == 'admin':
+                group_admin.user_set.add(membership.user_id)
+    ProjectMembership.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('basecamp', '0004_projectmembership'),
+    ]
+
+    operations = [
+        migrations.RunPython(groups_to_memberships, memberships_to_groups),
+    ]
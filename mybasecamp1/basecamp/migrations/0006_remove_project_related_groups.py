@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basecamp', '0005_migrate_project_groups'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='project',
+            name='related_groups',
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('basecamp', '0006_remove_project_related_groups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachments',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='attachments',
+            name='size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(max_length=255)),
+                ('total_size', models.BigIntegerField()),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('received_size', models.BigIntegerField(default=0)),
+                ('checksum', models.CharField(blank=True, max_length=64)),
+                ('time_create', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('related_project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='basecamp.project')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:00
+
+import basecamp.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basecamp', '0007_attachment_metadata_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('time_create', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='attachments',
+            name='name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='attachments',
+            name='files',
+            field=models.FileField(storage=basecamp.storage.attachment_storage, upload_to='files/%Y/%m/%d/'),
+        ),
+    ]
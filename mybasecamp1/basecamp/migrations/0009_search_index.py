@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# frozen copy of the FTS5 schema at this point; the rowid is object id * 8 + the kind's code
+# (1 project, 2 discussion, 3 message, 4 task), as basecamp.search encodes it
+CREATE_INDEX = ("CREATE VIRTUAL TABLE IF NOT EXISTS basecamp_search USING fts5("
+                "project_id UNINDEXED, title, body, tokenize='unicode61 remove_diacritics 2')")
+
+BACKFILL = [
+    "INSERT INTO basecamp_search (rowid, project_id, title, body) "
+    "SELECT id * 8 + 1, id, title, description FROM basecamp_project",
+    "INSERT INTO basecamp_search (rowid, project_id, title, body) "
+    "SELECT id * 8 + 2, related_project_id, disc_name, '' FROM basecamp_discussion",
+    "INSERT INTO basecamp_search (rowid, project_id, title, body) "
+    "SELECT message.id * 8 + 3, discussion.related_project_id, discussion.disc_name, message.message_text "
+    "FROM basecamp_discussionmessage message "
+    "JOIN basecamp_discussion discussion ON discussion.id = message.related_discussion_id",
+    "INSERT INTO basecamp_search (rowid, project_id, title, body) "
+    "SELECT id * 8 + 4, related_project_id, task_name, '' FROM basecamp_task",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_INDEX)
+    schema_editor.execute('DELETE FROM basecamp_search')
+    for statement in BACKFILL:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS basecamp_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basecamp', '0008_content_addressed_attachments'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
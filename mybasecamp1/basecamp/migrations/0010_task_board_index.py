@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basecamp', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['related_project', 'is_solved', 'time_create'], name='basecamp_task_board_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:17
+
+from django.db import migrations, models
+
+# frozen copy of what basecamp.counters.reconcile_counters computed when the counters were added
+FILL_COUNTERS = '''
+UPDATE basecamp_project SET
+    member_count = (SELECT COUNT(*) FROM basecamp_projectmembership m WHERE m.project_id = basecamp_project.id),
+    discussion_count = (SELECT COUNT(*) FROM basecamp_discussion d WHERE d.related_project_id = basecamp_project.id),
+    message_count = (SELECT COUNT(*) FROM basecamp_discussionmessage m
+                     JOIN basecamp_discussion d ON d.id = m.related_discussion_id
+                     WHERE d.related_project_id = basecamp_project.id),
+    open_task_count = (SELECT COUNT(*) FROM basecamp_task t
+                       WHERE t.related_project_id = basecamp_project.id AND NOT t.is_solved),
+    attachment_bytes = COALESCE((SELECT SUM(a.size) FROM basecamp_attachments a
+                                 WHERE a.related_project_id = basecamp_project.id), 0),
+    last_activity_at = %(greatest)s(
+        COALESCE((SELECT MAX(d.time_create) FROM basecamp_discussion d
+                  WHERE d.related_project_id = basecamp_project.id), time_create),
+        COALESCE((SELECT MAX(m.time_create) FROM basecamp_discussionmessage m
+                  JOIN basecamp_discussion d ON d.id = m.related_discussion_id
+                  WHERE d.related_project_id = basecamp_project.id), time_create),
+        COALESCE((SELECT MAX(t.time_create) FROM basecamp_task t
+                  WHERE t.related_project_id = basecamp_project.id), time_create))
+'''
+
+
+def fill_counters(apps, schema_editor):
+    # SQLite's multi-argument MAX is PostgreSQL's GREATEST
+    greatest = 'MAX' if schema_editor.connection.vendor == 'sqlite' else 'GREATEST'
+    schema_editor.execute(FILL_COUNTERS % {'greatest': greatest})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basecamp', '0010_task_board_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='attachment_bytes',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='discussion_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='open_task_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:47
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def rename_duplicate_titles(apps, schema_editor):
+    # the oldest project keeps its title, later ones get a numbered suffix
+    Project = apps.get_model('basecamp', 'Project')
+    projects = Project.objects.alias(title_key=Lower('title'))
+    duplicated = (Project.objects.values(title_key=Lower('title')).annotate(copies=Count('pk'))
+                  .filter(copies__gt=1).values_list('title_key', flat=True))
+    for title_key in list(duplicated):
+        for project in projects.filter(title_key=title_key).order_by('pk')[1:]:
+            number = 2
+            while True:
+                suffix = ' (%d)' % number
+                title = project.title[:255 - len(suffix)] + suffix
+                if not projects.filter(title_key=Lower(models.Value(title))).exists():
+                    break
+                number += 1
+            project.title = title
+            project.save(update_fields=['title'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basecamp', '0012_job_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_titles, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='project',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('title'),
+                                               name='basecamp_project_title_unique'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basecamp', '0013_project_title_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('discussion.added', 'Discussion added'), ('message.added', 'Message added'), ('task.added', 'Task added'), ('attachment.added', 'Attachment added'), ('member.added', 'Member added'), ('member.removed', 'Member removed'), ('member.role', 'Member role changed'), ('project.updated', 'Project updated')], max_length=30)),
+                ('actor', models.CharField(blank=True, max_length=150)),
+                ('target_id', models.BigIntegerField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('time_create', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='basecamp.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'id'], name='basecamp_event_cursor_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basecamp', '0014_project_events'),
+    ]
+
+    # auto_now_add and a default are both applied by Django, the columns stay as they are; only the
+    # state changes, so SQLite does not rebuild the tables
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='discussion',
+                name='time_create',
+                field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            ),
+            migrations.AlterField(
+                model_name='discussionmessage',
+                name='time_create',
+                field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            ),
+            migrations.AlterField(
+                model_name='task',
+                name='time_create',
+                field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            ),
+        ]),
+    ]
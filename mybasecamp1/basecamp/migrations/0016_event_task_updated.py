@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('basecamp', '0015_creation_time_defaults'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='projectevent',
+            name='kind',
+            field=models.CharField(choices=[('discussion.added', 'Discussion added'), ('message.added', 'Message added'), ('task.added', 'Task added'), ('task.updated', 'Task updated'), ('attachment.added', 'Attachment added'), ('member.added', 'Member added'), ('member.removed', 'Member removed'), ('member.role', 'Member role changed'), ('project.updated', 'Project updated')], max_length=30),
+        ),
+    ]
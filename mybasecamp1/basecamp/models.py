@@ -1,45 +1,67 @@
-from importlib.resources import _
+import uuid
 
-from django.contrib.auth.models import Group, User, Permission
-from django.contrib.contenttypes.models import ContentType
+from django.utils.translation import gettext as _
+
+from django.contrib.auth.models import User, Permission
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Lower
 from django.urls import reverse
+from django.utils import timezone
+
+from .storage import attachment_storage
+
+
+PROJECT_TITLE_CONSTRAINT = 'basecamp_project_title_unique'
+
 
+def validate_project_title(input_title, exclude_pk=None):
+    # answered by the unique index on lower(title): one index lookup however many projects exist
+    projects = Project.objects.alias(title_key=Lower('title')).filter(title_key=Lower(Value(input_title)))
+    if exclude_pk is not None:
+        projects = projects.exclude(pk=exclude_pk)
+    if projects.exists():
+        raise title_taken(input_title)
 
-def validate_project_title(input_title):
-    if Project.objects.filter(title=input_title):
-        raise ValidationError(_('%(input_name)s is exist'),
-                              params={'input_name': input_title},
-                              )
+
+def title_taken(input_title):
+    return ValidationError(_('%(input_name)s is exist'),
+                           params={'input_name': input_title},
+                           )
+
+
+def is_title_conflict(error):
+    """Whether an IntegrityError came from a concurrent write that took the same project title."""
+    return PROJECT_TITLE_CONSTRAINT in str(error)
 
 
 class Project(models.Model):
     title = models.CharField(max_length=255, validators=[validate_project_title])
     description = models.CharField(max_length=255, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
-    related_groups = models.ManyToManyField(Group)
     time_create = models.DateTimeField(auto_now_add=True)
+    member_count = models.PositiveIntegerField(default=0, editable=False)
+    discussion_count = models.PositiveIntegerField(default=0, editable=False)
+    message_count = models.PositiveIntegerField(default=0, editable=False)
+    open_task_count = models.PositiveIntegerField(default=0, editable=False)
+    attachment_bytes = models.PositiveBigIntegerField(default=0, editable=False)
+    last_activity_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(Lower('title'), name=PROJECT_TITLE_CONSTRAINT),
+        ]
 
     def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if adding:
+            self.member_count = 1 if self.created_by_id else 0
+            self.last_activity_at = timezone.now()
         super().save(*args, **kwargs)
-        if not Permission.objects.filter(codename=('view_'+str(self.id))):
-            group_admin = Group.objects.create(name=str(self.id) + '-admin')
-            group = Group.objects.create(name=str(self.id))
-            self.related_groups.add(group, group_admin)
-            user_permission = Permission.objects.create(
-                codename='view_' + str(self.id),
-                name='Can view ' + str(self.id),
-                content_type=ContentType.objects.get_for_model(Project)
-            )
-            admin_permission = Permission.objects.create(
-                codename='change_' + str(self.id),
-                name='Can change ' + str(self.id),
-                content_type=ContentType.objects.get_for_model(Project)
-            )
-            group.permissions.add(user_permission)
-            group_admin.permissions.add(admin_permission)
-            self.created_by.groups.add(group_admin, group)
+        if adding and self.created_by_id:
+            ProjectMembership.objects.create(project=self, user_id=self.created_by_id,
+                                             role=ProjectMembership.ADMIN)
 
     def __str__(self):
         return self.title
@@ -48,9 +70,34 @@ class Project(models.Model):
         return reverse('basecamp:detail', kwargs={'pk': self.pk})
 
 
+class ProjectMembership(models.Model):
+    MEMBER = 'member'
+    ADMIN = 'admin'
+    ROLE_CHOICES = [(MEMBER, 'Member'), (ADMIN, 'Admin')]
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='project_memberships')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default=MEMBER)
+    time_create = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'user'], name='basecamp_membership_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'project', 'role'], name='basecamp_membership_user_idx'),
+            models.Index(fields=['project', 'role'], name='basecamp_membership_role_idx'),
+        ]
+
+    def __str__(self):
+        return '%s: %s (%s)' % (self.project_id, self.user_id, self.role)
+
+
+# discussions, messages and tasks take their creation time as a default rather than auto_now_add, so
+# imports and bulk ingestion can insert the original times in the same statement
 class Discussion(models.Model):
     disc_name = models.CharField(max_length=255)
-    time_create = models.DateTimeField(auto_now_add=True)
+    time_create = models.DateTimeField(default=timezone.now, editable=False)
     related_project = models.ForeignKey(Project, on_delete=models.CASCADE)
 
     def __str__(self):
@@ -60,26 +107,121 @@ class Discussion(models.Model):
 class DiscussionMessage(models.Model):
     user = models.CharField(max_length=100)
     message_text = models.CharField(max_length=255)
-    time_create = models.DateTimeField(auto_now_add=True)
+    time_create = models.DateTimeField(default=timezone.now, editable=False)
     related_discussion = models.ForeignKey(Discussion, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['related_discussion', 'time_create', 'id'], name='basecamp_message_thread_idx'),
+        ]
+
     def __str__(self):
         return self.message_text
 
 
 class Task(models.Model):
     task_name = models.CharField(max_length=255)
-    time_create = models.DateTimeField(auto_now_add=True)
+    time_create = models.DateTimeField(default=timezone.now, editable=False)
     is_solved = models.BooleanField(default=False)
     related_project = models.ForeignKey(Project, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['related_project', 'is_solved', 'time_create'], name='basecamp_task_board_idx'),
+        ]
+
     def __str__(self):
         return self.task_name
 
 
 class Attachments(models.Model):
-    files = models.FileField(upload_to="files/%Y/%m/%d/")
+    files = models.FileField(upload_to="files/%Y/%m/%d/", storage=attachment_storage)
+    name = models.CharField(max_length=255, blank=True)
     related_project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    size = models.BigIntegerField(null=True, blank=True)
+    checksum = models.CharField(max_length=64, blank=True)
+
+    def __str__(self):
+        return self.name or self.files.name
+
+
+class Blob(models.Model):
+    digest = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    time_create = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
+
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received_size = models.BigIntegerField(default=0)
+    checksum = models.CharField(max_length=64, blank=True)
+    related_project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    time_create = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.file_name
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    time_create = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='basecamp_job_due_idx'),
+        ]
+
+    def __str__(self):
+        return '%s #%s (%s)' % (self.name, self.pk, self.status)
+
+
+class ProjectEvent(models.Model):
+    DISCUSSION_ADDED = 'discussion.added'
+    MESSAGE_ADDED = 'message.added'
+    TASK_ADDED = 'task.added'
+    TASK_UPDATED = 'task.updated'
+    ATTACHMENT_ADDED = 'attachment.added'
+    MEMBER_ADDED = 'member.added'
+    MEMBER_REMOVED = 'member.removed'
+    MEMBER_ROLE_CHANGED = 'member.role'
+    PROJECT_UPDATED = 'project.updated'
+    KIND_CHOICES = [(DISCUSSION_ADDED, 'Discussion added'), (MESSAGE_ADDED, 'Message added'),
+                    (TASK_ADDED, 'Task added'), (TASK_UPDATED, 'Task updated'), (ATTACHMENT_ADDED, 'Attachment added'),
+                    (MEMBER_ADDED, 'Member added'), (MEMBER_REMOVED, 'Member removed'),
+                    (MEMBER_ROLE_CHANGED, 'Member role changed'), (PROJECT_UPDATED, 'Project updated')]
+
+    # the (project, id) index below covers lookups by project on its own
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='events', db_index=False)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    actor = models.CharField(max_length=150, blank=True)
+    target_id = models.BigIntegerField(blank=True, null=True)
+    data = models.JSONField(default=dict, blank=True)
+    time_create = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'id'], name='basecamp_event_cursor_idx'),
+        ]
 
     def __str__(self):
-        return self.files.name
+        return '%s #%s' % (self.kind, self.target_id)
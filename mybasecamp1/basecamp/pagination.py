@@ -0,0 +1,56 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def encode_cursor(obj, fields=('time_create', 'id')):
+    values = []
+    for field in fields:
+        # rows from values() querysets are dicts
+        value = obj[field] if isinstance(obj, dict) else getattr(obj, field)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, fields=('time_create', 'id')):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValidationError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValidationError('Invalid cursor')
+    try:
+        values = [model._meta.get_field(field).to_python(value) for field, value in zip(fields, values)]
+    except (TypeError, ValidationError):
+        raise ValidationError('Invalid cursor')
+    if None in values:
+        raise ValidationError('Invalid cursor')
+    return values
+
+
+def keyset_filter(queryset, cursor, fields=('time_create', 'id'), descending=True):
+    lookup = 'lt' if descending else 'gt'
+    values = decode_cursor(cursor, queryset.model, fields)
+    condition = Q()
+    for i, field in enumerate(fields):
+        step = Q(**{'%s__%s' % (field, lookup): values[i]})
+        for previous, value in zip(fields[:i], values[:i]):
+            step &= Q(**{previous: value})
+        condition |= step
+    return queryset.filter(condition)
+
+
+def keyset_page(queryset, cursor=None, size=50, fields=('time_create', 'id'), descending=True):
+    ordering = [('-' if descending else '') + field for field in fields]
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = keyset_filter(queryset, cursor, fields, descending)
+    items = list(queryset[:size + 1])
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        next_cursor = encode_cursor(items[-1], fields)
+    return items, next_cursor
@@ -0,0 +1,68 @@
+from django.db.models import Prefetch
+
+from .models import *
+from .pagination import encode_cursor, keyset_page
+
+THREAD_PAGE_SIZE = 20
+TASK_PAGE_SIZE = 50
+EVENT_PAGE_SIZE = 100
+TASK_STATUSES = {'open': False, 'solved': True}
+
+
+def project_dashboard(user):
+    return Project.objects.filter(memberships__user=user).select_related('created_by').order_by('pk')
+
+
+def split_dashboard(user, projects):
+    my_projects = []
+    shared_projects = []
+    for project in projects:
+        if project.created_by_id == user.id:
+            my_projects.append(project)
+        else:
+            shared_projects.append(project)
+    return my_projects, shared_projects
+
+
+def _threads_queryset(project, size):
+    recent = DiscussionMessage.objects.order_by('-time_create', '-id')[:size + 1]
+    return (Discussion.objects.filter(related_project=project).order_by('time_create', 'id')
+            .prefetch_related(Prefetch('discussionmessage_set', queryset=recent, to_attr='recent_messages')))
+
+
+def _split_threads(discussions, size):
+    for discussion in discussions:
+        messages = discussion.recent_messages[:size]
+        discussion.older_cursor = encode_cursor(messages[-1]) if len(discussion.recent_messages) > size else None
+        discussion.thread = messages[::-1]
+    return discussions
+
+
+def discussion_threads(project, size=THREAD_PAGE_SIZE):
+    return _split_threads(list(_threads_queryset(project, size)), size)
+
+
+async def adiscussion_threads(project, size=THREAD_PAGE_SIZE):
+    return _split_threads([discussion async for discussion in _threads_queryset(project, size)], size)
+
+
+def discussion_history(discussion, cursor=None, size=THREAD_PAGE_SIZE):
+    messages, next_cursor = keyset_page(DiscussionMessage.objects.filter(related_discussion=discussion),
+                                        cursor, size)
+    return messages[::-1], next_cursor
+
+
+def task_board(project_id, status=None, cursor=None, size=TASK_PAGE_SIZE, newest_first=True):
+    tasks = Task.objects.filter(related_project_id=project_id)
+    if status in TASK_STATUSES:
+        tasks = tasks.filter(is_solved=TASK_STATUSES[status])
+    return keyset_page(tasks, cursor, size, descending=newest_first)
+
+
+def project_events(project_id, since=None, size=EVENT_PAGE_SIZE):
+    """Events after the `since` cursor, oldest first, with the cursor to poll next and whether more are waiting."""
+    events, next_cursor = keyset_page(ProjectEvent.objects.filter(project_id=project_id), since, size,
+                                      fields=('id',), descending=False)
+    if events:
+        since = encode_cursor(events[-1], ('id',))
+    return events, since, next_cursor is not None
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import re
+import threading
+from http.cookies import SimpleCookie
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http import HttpRequest
+from django.http.request import split_domain_port, validate_host
+from django.template.loader import render_to_string
+from django.utils.http import is_same_domain
+from django.utils.module_loading import import_string
+
+from .access import has_project_role
+from .models import Discussion
+
+DISCUSSION_SOCKET_RE = re.compile(r'^/ws/project/(?P<pk>\d+)/discussion/(?P<discussion_id>\d+)/$')
+
+
+class PubSub:
+    """Channel fan-out used by the websocket endpoint; a Redis-backed class can replace it."""
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+    def unsubscribe(self, channel, subscription):
+        raise NotImplementedError
+
+    async def get(self, subscription):
+        raise NotImplementedError
+
+
+class InProcessPubSub(PubSub):
+    queue_size = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, message)
+
+    @staticmethod
+    def _deliver(queue, message):
+        if not queue.full():
+            queue.put_nowait(message)
+
+    def subscribe(self, channel):
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, channel, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(channel, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(channel, None)
+
+    async def get(self, subscription):
+        return await subscription[1].get()
+
+
+_pubsub = None
+
+
+def get_pubsub():
+    global _pubsub
+    if _pubsub is None:
+        backend = getattr(settings, 'BASECAMP_PUBSUB_BACKEND', 'basecamp.realtime.InProcessPubSub')
+        _pubsub = import_string(backend)()
+    return _pubsub
+
+
+def discussion_channel(discussion_id):
+    return 'discussion:%s' % discussion_id
+
+
+def access_channel(user_id):
+    return 'access:%s' % user_id
+
+
+def render_message(message):
+    return render_to_string('basecamp/includes/discussion_message.html', {'message': message})
+
+
+def publish_message(message):
+    get_pubsub().publish(discussion_channel(message.related_discussion_id),
+                         {'type': 'message', 'id': message.id, 'html': render_message(message)})
+
+
+def publish_access_changed(*user_ids):
+    pubsub = get_pubsub()
+    for user_id in user_ids:
+        pubsub.publish(access_channel(user_id), {'type': 'access'})
+
+
+def _socket_origin_allowed(scope):
+    # browsers send Origin with every websocket handshake; the session cookie alone does not prove the page is ours
+    origin = next((value.decode('latin-1') for name, value in scope.get('headers', []) if name == b'origin'), None)
+    if not origin or origin == 'null':
+        return False
+    if origin in settings.CSRF_TRUSTED_ORIGINS:
+        return True
+    parsed = urlsplit(origin)
+    if parsed.scheme not in ('http', 'https'):
+        return False
+    for trusted in settings.CSRF_TRUSTED_ORIGINS:
+        trusted = urlsplit(trusted)
+        if '*' in trusted.netloc and trusted.scheme == parsed.scheme and \
+                is_same_domain(parsed.netloc, trusted.netloc.lstrip('*')):
+            return True
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+    domain, port = split_domain_port(parsed.netloc)
+    return bool(domain) and validate_host(domain, allowed_hosts)
+
+
+def _socket_reader(scope, project_id, discussion_id):
+    """The id of the session's user if they may read the discussion, else None."""
+    cookies = SimpleCookie()
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value)
+    user = get_user(request)
+    if not has_project_role(user, project_id):
+        return None
+    if not Discussion.objects.filter(id=discussion_id, related_project_id=project_id).exists():
+        return None
+    return user.pk
+
+
+async def websocket_application(scope, receive, send):
+    match = DISCUSSION_SOCKET_RE.match(scope['path'])
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    if not match or not _socket_origin_allowed(scope):
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    project_id, discussion_id = int(match['pk']), int(match['discussion_id'])
+    user_id = await sync_to_async(_socket_reader)(scope, project_id, discussion_id)
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    pubsub = get_pubsub()
+    subscriptions = {channel: pubsub.subscribe(channel)
+                     for channel in (discussion_channel(discussion_id), access_channel(user_id))}
+    receiving = asyncio.ensure_future(receive())
+    try:
+        await send({'type': 'websocket.accept'})
+        while True:
+            publishing = {asyncio.ensure_future(pubsub.get(subscription)) for subscription in subscriptions.values()}
+            done, pending = await asyncio.wait({receiving, *publishing}, return_when=asyncio.FIRST_COMPLETED)
+            for future in publishing - done:
+                future.cancel()
+            for future in publishing & done:
+                message = future.result()
+                if message['type'] != 'access':
+                    await send({'type': 'websocket.send', 'text': json.dumps(message)})
+                elif await sync_to_async(_socket_reader)(scope, project_id, discussion_id) != user_id:
+                    await send({'type': 'websocket.close', 'code': 4403})
+                    return
+            if receiving in done:
+                if receiving.result()['type'] == 'websocket.disconnect':
+                    break
+                receiving = asyncio.ensure_future(receive())
+    finally:
+        receiving.cancel()
+        for channel, subscription in subscriptions.items():
+            pubsub.unsubscribe(channel, subscription)
@@ -0,0 +1,217 @@
+import json
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from .models import Discussion, DiscussionMessage, Project, Task
+
+PROJECT = 'project'
+DISCUSSION = 'discussion'
+MESSAGE = 'message'
+TASK = 'task'
+KIND_CODES = {PROJECT: 1, DISCUSSION: 2, MESSAGE: 3, TASK: 4}
+KINDS_BY_CODE = {code: kind for kind, code in KIND_CODES.items()}
+
+FTS_TABLE = 'basecamp_search'
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+@dataclass
+class SearchHit:
+    kind: str
+    object_id: int
+    project_id: int
+    title: str
+    snippet: str
+    rank: float = 0.0
+
+    def get_absolute_url(self):
+        url = reverse('basecamp:detail', kwargs={'pk': self.project_id})
+        return url + '#message-%d' % self.object_id if self.kind == MESSAGE else url
+
+
+def document_for(instance):
+    if isinstance(instance, Project):
+        return PROJECT, instance.pk, instance.pk, instance.title, instance.description
+    if isinstance(instance, Discussion):
+        return DISCUSSION, instance.pk, instance.related_project_id, instance.disc_name, ''
+    if isinstance(instance, DiscussionMessage):
+        return (MESSAGE, instance.pk, instance.related_discussion.related_project_id,
+                instance.related_discussion.disc_name, instance.message_text)
+    if isinstance(instance, Task):
+        return TASK, instance.pk, instance.related_project_id, instance.task_name, ''
+    return None
+
+
+class SearchBackend:
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def index(self, kind, object_id, project_id, title, body):
+        raise NotImplementedError
+
+    def bulk_index(self, documents):
+        for document in documents:
+            self.index(*document)
+
+    def remove(self, kind, object_id):
+        raise NotImplementedError
+
+    def remove_project(self, project_id):
+        raise NotImplementedError
+
+    def search(self, query, project_ids, offset=0, limit=20):
+        raise NotImplementedError
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """Ranked search over an FTS5 table whose rowid encodes the indexed object."""
+
+    @staticmethod
+    def rowid(kind, object_id):
+        return object_id * 8 + KIND_CODES[kind]
+
+    @staticmethod
+    def match_expression(query):
+        # quoted terms keep user input out of the FTS5 query syntax; the last one matches as a prefix
+        terms = ['"%s"' % term for term in TERM_RE.findall(query)]
+        if not terms:
+            return None
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    @staticmethod
+    def create_table(schema_editor):
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5("
+            "project_id UNINDEXED, title, body, tokenize='unicode61 remove_diacritics 2')" % FTS_TABLE)
+
+    def index(self, kind, object_id, project_id, title, body):
+        self.bulk_index([(kind, object_id, project_id, title, body)])
+
+    def bulk_index(self, documents):
+        rows = [(self.rowid(kind, object_id), project_id, title, body)
+                for kind, object_id, project_id, title, body in documents]
+        with transaction.atomic(using=self.using), connections[self.using].cursor() as cursor:
+            cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [(row[0],) for row in rows])
+            cursor.executemany('INSERT INTO %s (rowid, project_id, title, body) VALUES (%%s, %%s, %%s, %%s)'
+                               % FTS_TABLE, rows)
+
+    def remove(self, kind, object_id):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [self.rowid(kind, object_id)])
+
+    def remove_project(self, project_id):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE project_id = %%s' % FTS_TABLE, [project_id])
+
+    def search(self, query, project_ids, offset=0, limit=20):
+        expression = self.match_expression(query)
+        if not expression or not project_ids:
+            return []
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid, project_id, title, snippet(%(table)s, 2, '', '', '...', 12), "
+                "bm25(%(table)s, 0, 4.0, 1.0) AS rank FROM %(table)s "
+                "WHERE %(table)s MATCH %%s AND project_id IN (SELECT value FROM json_each(%%s)) "
+                "ORDER BY rank LIMIT %%s OFFSET %%s" % {'table': FTS_TABLE},
+                [expression, json.dumps(list(project_ids)), limit, offset])
+            rows = cursor.fetchall()
+        return [SearchHit(KINDS_BY_CODE[rowid % 8], rowid // 8, project_id, title, snippet, rank)
+                for rowid, project_id, title, snippet, rank in rows]
+
+
+class BasicSearchBackend(SearchBackend):
+    """Substring search through the ORM for databases without a full-text index."""
+
+    def index(self, kind, object_id, project_id, title, body):
+        pass
+
+    def bulk_index(self, documents):
+        pass
+
+    def remove(self, kind, object_id):
+        pass
+
+    def remove_project(self, project_id):
+        pass
+
+    def search(self, query, project_ids, offset=0, limit=20):
+        terms = TERM_RE.findall(query)
+        if not terms or not project_ids:
+            return []
+        querysets = [
+            (Project.objects.filter(pk__in=project_ids), ['title', 'description']),
+            (Discussion.objects.filter(related_project__in=project_ids), ['disc_name']),
+            (DiscussionMessage.objects.filter(related_discussion__related_project__in=project_ids)
+             .select_related('related_discussion'), ['message_text']),
+            (Task.objects.filter(related_project__in=project_ids), ['task_name']),
+        ]
+        hits = []
+        for queryset, fields in querysets:
+            for term in terms:
+                condition = Q()
+                for field in fields:
+                    condition |= Q(**{field + '__icontains': term})
+                queryset = queryset.filter(condition)
+            for instance in queryset.using(self.using).order_by('-time_create')[:offset + limit]:
+                kind, object_id, project_id, title, body = document_for(instance)
+                hits.append((instance.time_create, SearchHit(kind, object_id, project_id, title, body[:120])))
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        return [hit for time_create, hit in hits[offset:offset + limit]]
+
+
+def default_backend_class(using=DEFAULT_DB_ALIAS):
+    if connections[using].vendor == 'sqlite':
+        return SQLiteFTS5Backend
+    return BasicSearchBackend
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    backend = getattr(settings, 'BASECAMP_SEARCH_BACKEND', None)
+    backend_class = import_string(backend) if backend else default_backend_class(using)
+    return backend_class(using)
+
+
+def index_instance(instance):
+    document = document_for(instance)
+    if document:
+        get_search_backend().index(*document)
+
+
+MODEL_KINDS = {Project: PROJECT, Discussion: DISCUSSION, DiscussionMessage: MESSAGE, Task: TASK}
+
+
+def remove_instance(instance):
+    if isinstance(instance, Project):
+        get_search_backend().remove_project(instance.pk)
+    else:
+        get_search_backend().remove(MODEL_KINDS[type(instance)], instance.pk)
+
+
+def index_projects(projects, batch_size=1000):
+    """Index whole projects after rows were written without signals, e.g. by bulk_create."""
+    backend = get_search_backend()
+    backend.bulk_index((PROJECT, project.pk, project.pk, project.title, project.description) for project in projects)
+    backend.bulk_index((DISCUSSION, pk, project_id, name, '') for pk, project_id, name in
+                       Discussion.objects.filter(related_project__in=projects)
+                       .values_list('pk', 'related_project_id', 'disc_name').iterator())
+    backend.bulk_index((TASK, pk, project_id, name, '') for pk, project_id, name in
+                       Task.objects.filter(related_project__in=projects)
+                       .values_list('pk', 'related_project_id', 'task_name').iterator())
+    messages = (DiscussionMessage.objects.filter(related_discussion__related_project__in=projects)
+                .values_list('pk', 'related_discussion__related_project_id', 'related_discussion__disc_name',
+                             'message_text'))
+    batch = []
+    for pk, project_id, name, text in messages.iterator(chunk_size=batch_size):
+        batch.append((MESSAGE, pk, project_id, name, text))
+        if len(batch) == batch_size:
+            backend.bulk_index(batch)
+            batch = []
+    backend.bulk_index(batch)
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import fragments
+from .access import invalidate_project_roles, project_roles_changed
+from .blobs import acquire_blob, release_blobs
+from .models import Attachments, Discussion, DiscussionMessage, Project, ProjectMembership, Task
+from .realtime import publish_access_changed, publish_message
+from .search import index_instance, remove_instance
+from .storage import attachment_storage
+
+
+def deleted_directly(instance, origin):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin is None or model is type(instance)
+
+
+def deleted_with_project(origin):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Project, User)
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'BASECAMP_SQLITE_PRAGMAS', {}).items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+@receiver(post_save, sender=ProjectMembership)
+@receiver(post_delete, sender=ProjectMembership)
+def membership_changed(sender, instance, **kwargs):
+    invalidate_project_roles(instance.user_id)
+    fragments.bump_sections(instance.project_id, fragments.MEMBERS)
+
+
+@receiver(project_roles_changed)
+def roles_changed(sender, user_ids, **kwargs):
+    # open sockets re-check their access once the change is visible to other connections
+    transaction.on_commit(lambda: publish_access_changed(*user_ids))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_project_roles(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    for project_id in ProjectMembership.objects.filter(user=instance).values_list('project_id', flat=True):
+        fragments.bump_sections(project_id, fragments.MEMBERS)
+
+
+@receiver(post_save, sender=Attachments)
+def attachment_saved(sender, instance, created, **kwargs):
+    fragments.bump_sections(instance.related_project_id, fragments.FILES)
+    if created and instance.checksum and attachment_storage().is_blob_name(instance.files.name):
+        acquire_blob(instance.checksum, instance.size or 0)
+
+
+@receiver(post_delete, sender=Attachments)
+def attachment_deleted(sender, instance, origin=None, **kwargs):
+    if deleted_directly(instance, origin):
+        fragments.bump_sections(instance.related_project_id, fragments.FILES)
+    if instance.checksum and attachment_storage().is_blob_name(instance.files.name):
+        release_blobs([instance.checksum])
+
+
+@receiver(post_save, sender=DiscussionMessage)
+def message_created(sender, instance, created, **kwargs):
+    fragments.bump_sections(instance.related_discussion.related_project_id, fragments.DISCUSSIONS)
+    if created:
+        transaction.on_commit(lambda: publish_message(instance))
+
+
+@receiver(post_delete, sender=DiscussionMessage)
+def message_deleted(sender, instance, origin=None, **kwargs):
+    # deleting a discussion or project bumps the section once for all its messages
+    if deleted_directly(instance, origin):
+        project_id = Discussion.objects.filter(pk=instance.related_discussion_id).values_list(
+            'related_project_id', flat=True).first()
+        if project_id:
+            fragments.bump_sections(project_id, fragments.DISCUSSIONS)
+
+
+@receiver(post_save, sender=Discussion)
+@receiver(post_delete, sender=Discussion)
+def discussion_changed(sender, instance, **kwargs):
+    fragments.bump_sections(instance.related_project_id, fragments.DISCUSSIONS)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_changed(sender, instance, **kwargs):
+    fragments.bump_sections(instance.related_project_id, fragments.TASKS)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Discussion)
+@receiver(post_save, sender=DiscussionMessage)
+@receiver(post_save, sender=Task)
+def searchable_saved(sender, instance, **kwargs):
+    index_instance(instance)
+
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Discussion)
+@receiver(post_delete, sender=DiscussionMessage)
+@receiver(post_delete, sender=Task)
+def searchable_deleted(sender, instance, origin=None, **kwargs):
+    # a deleted project drops its whole index partition in one statement
+    if sender is Project or not deleted_with_project(origin):
+        remove_instance(instance)
@@ -0,0 +1,62 @@
+// Uploads attachments in fixed-size chunks and resumes from the server offset after a failure.
+(function () {
+    function csrfToken(form) {
+        return form.querySelector('input[name=csrfmiddlewaretoken]').value;
+    }
+
+    async function sendChunks(form, file, session) {
+        let offset = session.received_size;
+        while (offset < file.size) {
+            const end = Math.min(offset + session.chunk_size, file.size);
+            const response = await fetch(session.url, {
+                method: 'PUT',
+                headers: {
+                    'X-CSRFToken': csrfToken(form),
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Range': 'bytes ' + offset + '-' + (end - 1) + '/' + file.size
+                },
+                body: file.slice(offset, end)
+            });
+            const state = await response.json();
+            // 409 means the server holds a different offset; continue from there
+            if (!response.ok && response.status !== 409) {
+                throw new Error(state.error);
+            }
+            offset = state.received_size;
+        }
+    }
+
+    async function upload(form, file) {
+        const data = new FormData();
+        data.append('file_name', file.name);
+        data.append('total_size', file.size);
+        data.append('csrfmiddlewaretoken', csrfToken(form));
+        const session = await (await fetch(form.dataset.uploadUrl, {method: 'POST', body: data})).json();
+        for (let attempt = 0; ; attempt++) {
+            try {
+                await sendChunks(form, file, session);
+                break;
+            } catch (error) {
+                if (attempt >= 5) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+                const state = await (await fetch(session.url)).json();
+                session.received_size = state.received_size;
+            }
+        }
+        await fetch(session.url, {method: 'POST', headers: {'X-CSRFToken': csrfToken(form)}});
+    }
+
+    document.querySelectorAll('form[data-upload-url]').forEach(function (form) {
+        form.addEventListener('submit', async function (event) {
+            const input = form.querySelector('input[type=file]');
+            if (!input.files.length || !window.fetch) {
+                return;
+            }
+            event.preventDefault();
+            await upload(form, input.files[0]);
+            window.location.reload();
+        });
+    });
+})();
@@ -0,0 +1,35 @@
+// Appends new discussion messages pushed over the websocket and posts messages without a page reload.
+(function () {
+    function append(thread, id, html) {
+        if (!document.getElementById('message-' + id)) {
+            thread.insertAdjacentHTML('beforeend', html);
+        }
+    }
+
+    document.querySelectorAll('[data-socket-path]').forEach(function (thread) {
+        const scheme = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+        const socket = new WebSocket(scheme + window.location.host + thread.dataset.socketPath);
+        socket.addEventListener('message', function (event) {
+            const data = JSON.parse(event.data);
+            append(thread, data.id, data.html);
+        });
+
+        const form = thread.parentElement.querySelector('button[value=Send]').form;
+        form.addEventListener('submit', async function (event) {
+            event.preventDefault();
+            const data = new FormData(form);
+            data.append('option', 'Send');
+            const response = await fetch(form.action, {
+                method: 'POST',
+                headers: {'X-Requested-With': 'XMLHttpRequest'},
+                body: data
+            });
+            if (response.status === 201) {
+                const html = await response.text();
+                const id = /id="message-(\d+)"/.exec(html)[1];
+                append(thread, id, html);
+                form.querySelector('textarea').value = '';
+            }
+        });
+    });
+})();
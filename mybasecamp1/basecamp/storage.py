@@ -0,0 +1,74 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+READ_SIZE = 64 * 1024
+
+
+def file_digest(file, read_size=READ_SIZE):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(read_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    blob_prefix = 'blobs'
+
+    def blob_name(self, digest):
+        return '/'.join([self.blob_prefix, digest[:2], digest[2:4], digest])
+
+    def is_blob_name(self, name):
+        return name.startswith(self.blob_prefix + '/')
+
+    def get_available_name(self, name, max_length=None):
+        # _save chooses the final name from the content digest
+        return name
+
+    def _place(self, source, digest):
+        name = self.blob_name(digest)
+        path = self.path(name)
+        if os.path.exists(path):
+            os.remove(source)
+            return name
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            file_move_safe(source, path)
+        except FileExistsError:
+            os.remove(source)
+        else:
+            os.chmod(path, self.file_permissions_mode or 0o644)
+        return name
+
+    def _save(self, name, content):
+        digest = getattr(content, 'checksum', None)
+        if hasattr(content, 'temporary_file_path'):
+            source = content.temporary_file_path()
+            if not digest:
+                with open(source, 'rb') as file:
+                    digest = file_digest(file)
+            return self._place(source, digest)
+
+        temp_dir = self.path(os.path.join(self.blob_prefix, 'tmp'))
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        hasher = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    temp_file.write(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return self._place(temp_path, hasher.hexdigest())
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def attachment_storage():
+    return content_addressed_storage
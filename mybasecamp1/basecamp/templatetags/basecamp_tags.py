@@ -0,0 +1,11 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from basecamp.fragments import CSRF_SLOT
+
+register = template.Library()
+
+
+@register.simple_tag
+def csrf_slot():
+    return mark_safe(CSRF_SLOT)
@@ -1,3 +1,1222 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+import zipfile
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, RequestFactory, TestCase, modify_settings, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import jobs
+from .access import ROLE_ADMIN, ROLE_MEMBER, get_project_roles
+from .archive import ArchiveError, import_project, iter_export
+from .benchmarks import Scale, generate_data, run_benchmarks
+from .blobs import create_attachment
+from .jobs import enqueue, run_pending
+from .metrics import fingerprint, registry
+from .middleware import CurrentUserMiddleware, get_current_user
+from .counters import reconcile_counters
+from .realtime import websocket_application
+from .search import MESSAGE, PROJECT, BasicSearchBackend, get_search_backend
+from .storage import attachment_storage
+from .uploads import abort_upload, start_upload, upload_temp_path
+from .models import *
+from mybasecamp1.caches import cache_from_env, cache_shared_from_env
+from mybasecamp1.database import database_from_env
+
+
+# one test process shares its locmem cache with itself, like workers sharing redis or memcached
+@override_settings(BASECAMP_CACHE_SHARED=True)
+class BasecampTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+
+class MediaTestCase(BasecampTestCase):
+    """Keeps attachments and upload parts in a temporary directory that is removed after the class."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=cls.media_root,
+                                  BASECAMP_UPLOAD_TEMP_DIR=os.path.join(cls.media_root, 'uploads'))
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
+
+
+class ProjectListTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='pass')
+        cls.other = User.objects.create_user('other', password='pass')
+        for i in range(5):
+            project = Project.objects.create(title='mine %d' % i, created_by=cls.user)
+            discussion = Discussion.objects.create(disc_name='talk', related_project=project)
+            for j in range(i):
+                DiscussionMessage.objects.create(user='owner', message_text=str(j), related_discussion=discussion)
+        for i in range(3):
+            project = Project.objects.create(title='shared %d' % i, created_by=cls.other)
+            ProjectMembership.objects.create(project=project, user=cls.user)
+        Project.objects.create(title='hidden', created_by=cls.other)
+        reconcile_counters()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_counts_and_split(self):
+        response = self.client.get(reverse('basecamp:project'))
+        my_projects = response.context['my_project_list']
+        shared_projects = response.context['shared_project_list']
+        self.assertEqual([p.title for p in my_projects], ['mine %d' % i for i in range(5)])
+        self.assertEqual([p.message_count for p in my_projects], [0, 1, 2, 3, 4])
+        self.assertEqual([p.title for p in shared_projects], ['shared %d' % i for i in range(3)])
+        self.assertEqual([p.member_count for p in shared_projects], [2, 2, 2])
+
+    def test_query_count_does_not_grow_with_projects(self):
+        # session, user and the dashboard query itself
+        with self.assertNumQueries(3):
+            self.client.get(reverse('basecamp:project'))
+        for i in range(10):
+            Project.objects.create(title='more %d' % i, created_by=self.user)
+        with self.assertNumQueries(3):
+            self.client.get(reverse('basecamp:project'))
+
+
+class ProjectCountersTest(MediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.member = User.objects.create_user('member', password='pass')
+        cls.project = Project.objects.create(title='counters', created_by=cls.owner)
+
+    def post(self, option, title='x', **data):
+        return self.client.post(reverse('basecamp:add_info_project_detail', kwargs={'pk': self.project.pk}),
+                                dict(title=title, option=option, **data))
+
+    def test_write_paths_keep_counters_and_reconcile_repairs_drift(self):
+        self.client.force_login(self.owner)
+        self.post('Add discussion')
+        discussion = Discussion.objects.get()
+        self.post('Send', discussion_id=discussion.pk)
+        self.post('Add new task')
+        self.post('Add attachment', file=ContentFile(b'12345', name='a.txt'))
+        self.client.post(reverse('basecamp:membership', kwargs={'pk': self.project.pk}),
+                         {'user': 'member', 'option': 'Add user'})
+        project = Project.objects.get()
+        counters = (project.member_count, project.discussion_count, project.message_count,
+                    project.open_task_count, project.attachment_bytes)
+        self.assertEqual(counters, (2, 1, 1, 1, 5))
+        self.assertIsNotNone(project.last_activity_at)
+        self.assertEqual(reconcile_counters(), 0)
+
+        Task.objects.create(task_name='outside the form', related_project=self.project)
+        self.assertEqual(reconcile_counters(), 1)
+        self.assertEqual(Project.objects.get().open_task_count, 2)
+
+
+class DiscussionThreadTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='pass')
+        cls.project = Project.objects.create(title='threads', created_by=cls.user)
+        cls.discussion = Discussion.objects.create(disc_name='long', related_project=cls.project)
+        cls.quiet = Discussion.objects.create(disc_name='quiet', related_project=cls.project)
+        for i in range(45):
+            DiscussionMessage.objects.create(user='owner', message_text='m%d' % i, related_discussion=cls.discussion)
+        DiscussionMessage.objects.create(user='owner', message_text='hello', related_discussion=cls.quiet)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_detail_groups_recent_messages_per_discussion(self):
+        response = self.client.get(reverse('basecamp:detail', kwargs={'pk': self.project.pk}))
+        long, quiet = response.context['discussions']
+        self.assertEqual([m.message_text for m in long.thread], ['m%d' % i for i in range(25, 45)])
+        self.assertIsNotNone(long.older_cursor)
+        self.assertEqual([m.message_text for m in quiet.thread], ['hello'])
+        self.assertIsNone(quiet.older_cursor)
+
+    def test_history_walks_back_with_cursor(self):
+        url = reverse('basecamp:discussion_history', kwargs={'pk': self.project.pk,
+                                                             'discussion_id': self.discussion.pk})
+        seen = []
+        cursor = self.client.get(reverse('basecamp:detail', kwargs={'pk': self.project.pk})
+                                 ).context['discussions'][0].older_cursor
+        while cursor:
+            response = self.client.get(url, {'before': cursor})
+            seen = [m.message_text for m in response.context['messages']] + seen
+            cursor = response.context['older_cursor']
+        self.assertEqual(seen, ['m%d' % i for i in range(25)])
+
+    def test_history_rejects_bad_cursor(self):
+        url = reverse('basecamp:discussion_history', kwargs={'pk': self.project.pk,
+                                                             'discussion_id': self.discussion.pk})
+        self.assertEqual(self.client.get(url, {'before': 'garbage'}).status_code, 400)
+        cursor = base64.urlsafe_b64encode(json.dumps([[1], 2]).encode()).decode()
+        self.assertEqual(self.client.get(url, {'before': cursor}).status_code, 400)
+
+
+class ProjectAccessTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.guest = User.objects.create_user('guest', password='pass')
+        cls.project = Project.objects.create(title='access', created_by=cls.owner)
+
+    def test_roles_are_cached_and_invalidated_on_membership_change(self):
+        self.assertEqual(get_project_roles(User.objects.get(pk=self.guest.pk)), {})
+        ProjectMembership.objects.create(project=self.project, user=self.guest)
+        self.assertEqual(get_project_roles(User.objects.get(pk=self.guest.pk)), {self.project.pk: ROLE_MEMBER})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_project_roles(User(pk=self.guest.pk)), {self.project.pk: ROLE_MEMBER})
+        ProjectMembership.objects.filter(user=self.guest).get().delete()
+        self.assertEqual(get_project_roles(User.objects.get(pk=self.guest.pk)), {})
+        self.assertEqual(get_project_roles(User.objects.get(pk=self.owner.pk)), {self.project.pk: ROLE_ADMIN})
+
+    @override_settings(BASECAMP_CACHE_SHARED=False)
+    def test_roles_are_not_cached_in_a_per_process_cache(self):
+        ProjectMembership.objects.create(project=self.project, user=self.guest)
+        # another worker could not invalidate this process's copy, so every request reads the roles
+        for request in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(get_project_roles(User(pk=self.guest.pk)), {self.project.pk: ROLE_MEMBER})
+
+    def test_views_check_roles(self):
+        detail = reverse('basecamp:detail', kwargs={'pk': self.project.pk})
+        edit = reverse('basecamp:edit_project', kwargs={'pk': self.project.pk})
+        self.client.force_login(self.guest)
+        self.assertEqual(self.client.get(detail).status_code, 403)
+        ProjectMembership.objects.create(project=self.project, user=self.guest)
+        self.assertEqual(self.client.get(detail).status_code, 200)
+        self.assertEqual(self.client.get(edit).status_code, 403)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(edit).status_code, 200)
+
+    def forged_post(self, name, data):
+        # the guest administers their own project and posts another project's id alongside its URL
+        own = Project.objects.create(title='own', created_by=self.guest)
+        self.client.force_login(self.guest)
+        self.client.post(reverse(name, kwargs={'pk': own.pk}), dict(data, project_pk=self.project.pk))
+        return own
+
+    def test_edit_project_ignores_posted_project(self):
+        own = self.forged_post('basecamp:edit_project', {'title': 'pwned', 'option': 'Update_name'})
+        self.assertEqual(Project.objects.get(pk=self.project.pk).title, 'access')
+        self.assertEqual(Project.objects.get(pk=own.pk).title, 'pwned')
+
+    def test_membership_ignores_posted_project(self):
+        own = self.forged_post('basecamp:membership', {'user': 'guest', 'option': 'Add to admins'})
+        self.assertFalse(ProjectMembership.objects.filter(project=self.project, user=self.guest).exists())
+        self.assertTrue(ProjectMembership.objects.filter(project=own, user=self.guest, role=ROLE_ADMIN).exists())
+
+    def test_add_info_ignores_posted_project(self):
+        own = self.forged_post('basecamp:add_info_project_detail', {'title': 'planted', 'option': 'Add new task'})
+        self.assertFalse(Task.objects.filter(related_project=self.project).exists())
+        self.assertTrue(Task.objects.filter(related_project=own, task_name='planted').exists())
+
+
+class ProjectTitleTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.project = Project.objects.create(title='Roadmap', created_by=cls.owner)
+        cls.other = Project.objects.create(title='Backlog', created_by=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.owner)
+
+    def test_titles_are_unique_ignoring_case(self):
+        response = self.client.post(reverse('basecamp:create_project'), {'title': 'ROADMAP', 'description': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('title', response.context['form'].errors)
+        edit = reverse('basecamp:edit_project', kwargs={'pk': self.other.pk})
+        response = self.client.post(edit, {'title': 'roadmap', 'option': 'Update_name'})
+        self.assertIn('title', response.context['form'].errors)
+        # keeping its own title in another case is not a conflict
+        self.client.post(edit, {'title': 'BACKLOG', 'option': 'Update_name'})
+        self.assertEqual(Project.objects.get(pk=self.other.pk).title, 'BACKLOG')
+
+    def test_concurrent_create_becomes_form_error(self):
+        # another request took the title between the pre-check and the insert
+        with unittest.mock.patch.object(Project._meta.get_field('title'), 'validators', []), \
+                unittest.mock.patch('django.db.models.UniqueConstraint.validate'):
+            response = self.client.post(reverse('basecamp:create_project'), {'title': 'roadmap', 'description': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('title', response.context['form'].errors)
+        self.assertEqual(Project.objects.count(), 2)
+
+
+class MembershipChangeTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.member = User.objects.create_user('member', password='pass')
+        cls.project = Project.objects.create(title='team', created_by=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.owner)
+        self.url = reverse('basecamp:membership', kwargs={'pk': self.project.pk})
+
+    def change(self, option, username='member'):
+        return self.client.post(self.url, {'user': username, 'option': option})
+
+    def test_membership_change_runs_fixed_queries(self):
+        # warms the owner's cached roles
+        self.client.get(self.url)
+        # session, user, username lookup shared by validator and action, get_or_create in a savepoint,
+        # counters, event
+        with self.assertNumQueries(9):
+            self.change('Add user')
+        # session, user, username lookup, membership, role update, counters, event
+        with self.assertNumQueries(7):
+            self.change('Add to admins')
+        # already an admin: nothing changes and the feed stays quiet
+        self.change('Add to admins')
+        self.assertEqual(ProjectEvent.objects.filter(kind=ProjectEvent.MEMBER_ROLE_CHANGED).count(), 1)
+        # session, user, username lookup, membership with its project's creator, update, counters, event
+        with self.assertNumQueries(7):
+            self.change('Remove from admins')
+        self.assertEqual(ProjectMembership.objects.get(user=self.member).role, ProjectMembership.MEMBER)
+        # already a member, or an option nobody offers: nothing changes and the feed stays quiet
+        self.change('Remove from admins')
+        self.change('Add to owners')
+        self.assertEqual(ProjectEvent.objects.filter(kind=ProjectEvent.MEMBER_ROLE_CHANGED).count(), 2)
+        self.change('Add to admins')
+        self.change('Add to owners')
+        self.assertEqual(ProjectMembership.objects.get(user=self.member).role, ProjectMembership.ADMIN)
+        self.change('Remove from admins')
+        with self.assertNumQueries(7):
+            self.change('Delete user')
+        self.assertFalse(ProjectMembership.objects.filter(user=self.member).exists())
+        self.change('Delete user', username='owner')
+        self.assertTrue(ProjectMembership.objects.filter(user=self.owner).exists())
+        self.assertIn('user', self.change('Add user', username='ghost').context['form'].errors)
+
+
+class BulkMembershipTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.project = Project.objects.create(title='team', created_by=cls.owner)
+        User.objects.bulk_create([User(username='user%d' % i) for i in range(30)])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.owner)
+        self.url = reverse('basecamp:membership_bulk', kwargs={'pk': self.project.pk})
+
+    def test_bulk_add_with_roles_reports_missing(self):
+        users = '\n'.join('user%d' % i for i in range(30)) + '\nuser0,admin\nghost, nobody\n'
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(11):
+                response = self.client.post(self.url, {'users': users, 'role': 'member', 'option': 'Add users'})
+        self.assertEqual(response.context['result']['not_found'], ['ghost', 'nobody'])
+        self.assertEqual(len(response.context['result']['added']), 30)
+        memberships = ProjectMembership.objects.filter(project=self.project)
+        self.assertEqual(memberships.count(), 31)
+        self.assertEqual(memberships.get(user__username='user0').role, ProjectMembership.ADMIN)
+        self.assertEqual(ProjectEvent.objects.filter(project=self.project, kind=ProjectEvent.MEMBER_ADDED).count(), 30)
+
+    def test_bulk_remove_keeps_creator(self):
+        ProjectMembership.objects.create(project=self.project, user=User.objects.get(username='user1'))
+        self.client.post(self.url, {'users': 'owner, user1', 'role': 'member', 'option': 'Remove users'})
+        self.assertEqual(list(ProjectMembership.objects.filter(project=self.project)
+                              .values_list('user__username', flat=True)), ['owner'])
+        self.assertEqual(list(ProjectEvent.objects.values_list('kind', 'data__username')),
+                         [(ProjectEvent.MEMBER_REMOVED, 'user1')])
+
+
+@override_settings(BASECAMP_UPLOAD_CHUNK_SIZE=4)
+class ChunkedUploadTest(MediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.project = Project.objects.create(title='files', created_by=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.owner)
+
+    def put_chunk(self, url, data, start, total):
+        return self.client.put(url, data, content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE='bytes %d-%d/%d' % (start, start + len(data) - 1, total))
+
+    def test_resumable_upload(self):
+        content = b'0123456789'
+        response = self.client.post(reverse('basecamp:start_upload', kwargs={'pk': self.project.pk}),
+                                    {'file_name': 'spec.txt', 'total_size': len(content),
+                                     'checksum': hashlib.sha256(content).hexdigest()})
+        url = response.json()['url']
+        self.assertEqual(self.put_chunk(url, content[:4], 0, 10).status_code, 200)
+        conflict = self.put_chunk(url, content[8:], 8, 10)
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict.json()['received_size'], 4)
+        self.assertEqual(self.client.get(url).json()['received_size'], 4)
+        self.put_chunk(url, content[4:8], 4, 10)
+        self.put_chunk(url, content[8:], 8, 10)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachments.objects.get()
+        self.assertEqual(attachment.size, 10)
+        self.assertEqual(attachment.files.read(), content)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_checksum_mismatch_is_rejected(self):
+        response = self.client.post(reverse('basecamp:start_upload', kwargs={'pk': self.project.pk}),
+                                    {'file_name': 'spec.txt', 'total_size': 2, 'checksum': '0' * 64})
+        url = response.json()['url']
+        self.put_chunk(url, b'ab', 0, 2)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertFalse(Attachments.objects.exists())
+
+    def test_aborted_part_file_survives_a_rollback(self):
+        session = start_upload(self.project, self.owner, 'spec.txt', 2)
+        path = Path(upload_temp_path(session))
+        path.write_bytes(b'a')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            abort_upload(session)
+            raise RuntimeError('later step failed')
+        session = UploadSession.objects.get()
+        self.assertTrue(path.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            abort_upload(session)
+        self.assertFalse(path.exists())
+
+
+class AttachmentDownloadTest(MediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.stranger = User.objects.create_user('stranger', password='pass')
+        cls.project = Project.objects.create(title='files', created_by=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.attachment = Attachments(related_project=self.project, size=10,
+                                      checksum=hashlib.sha256(b'0123456789').hexdigest())
+        self.attachment.files.save('data.bin', ContentFile(b'0123456789'))
+        self.url = reverse('basecamp:attachment_download', kwargs={'pk': self.project.pk,
+                                                                   'attachment_id': self.attachment.pk})
+
+    def test_requires_project_access(self):
+        self.client.force_login(self.stranger)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_full_range_and_conditional_requests(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=20-').status_code, 416)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    @override_settings(BASECAMP_SENDFILE_MODE='nginx', BASECAMP_SENDFILE_URL='/protected-media/')
+    def test_sendfile_mode_hands_off_to_proxy(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.attachment.files.name)
+        self.assertEqual(response.content, b'')
+
+
+class ContentAddressedStorageTest(MediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+
+    def test_identical_files_share_one_blob_until_last_reference_goes(self):
+        first = Project.objects.create(title='first', created_by=self.owner)
+        second = Project.objects.create(title='second', created_by=self.owner)
+        a = create_attachment(first, ContentFile(b'same spec', name='spec.pdf'))
+        b = create_attachment(second, ContentFile(b'same spec', name='copy.pdf'))
+        self.assertEqual(a.files.name, b.files.name)
+        self.assertEqual(a.checksum, hashlib.sha256(b'same spec').hexdigest())
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertEqual(str(b), 'copy.pdf')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(a.files.storage.exists(a.files.name))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            b.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertTrue(a.files.storage.exists(a.files.name))
+        run_pending()
+        self.assertFalse(a.files.storage.exists(a.files.name))
+
+
+class JobQueueTest(MediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('leaving', password='pass')
+        cls.other = User.objects.create_user('staying', password='pass')
+        cls.shared = Project.objects.create(title='shared', created_by=cls.other)
+        ProjectMembership.objects.create(project=cls.shared, user=cls.user)
+        reconcile_counters()
+
+    def test_user_delete_returns_at_once_and_the_worker_cascades(self):
+        projects = [Project.objects.create(title='own %d' % i, created_by=self.user) for i in range(3)]
+        attachment = create_attachment(projects[0], ContentFile(b'notes', name='notes.txt'))
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('basecamp:delete', kwargs={'pk': self.user.pk}))
+        self.assertRedirects(response, reverse('basecamp:logout'), fetch_redirect_response=False)
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        self.assertEqual(Project.objects.filter(created_by=self.user).count(), 3)
+
+        self.assertEqual(run_pending(), 5)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Project.objects.filter(pk__in=[p.pk for p in projects]).exists())
+        self.assertFalse(attachment.files.storage.exists(attachment.files.name))
+        self.assertEqual(Project.objects.get(pk=self.shared.pk).member_count, 1)
+        self.assertFalse(Job.objects.exists())
+
+    def test_failures_back_off_and_give_up(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            raise RuntimeError('storage offline')
+
+        with unittest.mock.patch.dict(jobs.handlers, {'flaky': flaky}):
+            job = enqueue('flaky', max_attempts=2)
+            with self.assertLogs('basecamp.jobs', 'WARNING'):
+                self.assertEqual(run_pending(), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+            self.assertIn('storage offline', job.last_error)
+            self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=20))
+
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            with self.assertLogs('basecamp.jobs', 'ERROR'):
+                self.assertEqual(run_pending(), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+            self.assertEqual(run_pending(), 0)
+        self.assertEqual(len(calls), 2)
+
+    def test_handlers_run_outside_a_transaction(self):
+        # batched handlers commit as they go instead of holding one transaction for the whole job
+        depths = []
+        with unittest.mock.patch.dict(jobs.handlers, {'probe': lambda: depths.append(len(connection.savepoint_ids))}):
+            enqueue('probe')
+            outside = len(connection.savepoint_ids)
+            run_pending()
+        self.assertEqual(depths, [outside])
+
+
+@override_settings(BASECAMP_DELETE_BATCH_SIZE=2, BASECAMP_DELETE_BATCHES_PER_JOB=3)
+class ProjectDeletionTest(MediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.project = Project.objects.create(title='doomed', created_by=cls.owner)
+        cls.kept = Project.objects.create(title='kept', created_by=cls.owner)
+        ProjectMembership.objects.create(project=cls.project, user=User.objects.create_user('member'))
+        for i in range(2):
+            discussion = Discussion.objects.create(disc_name='talk %d' % i, related_project=cls.project)
+            for j in range(3):
+                DiscussionMessage.objects.create(user='owner', message_text=str(j), related_discussion=discussion)
+        for i in range(5):
+            Task.objects.create(task_name='task %d' % i, related_project=cls.project)
+
+    def setUp(self):
+        super().setUp()
+        self.shared = create_attachment(self.project, ContentFile(b'shared', name='shared.txt'))
+        create_attachment(self.kept, ContentFile(b'shared', name='shared.txt'))
+        self.own = create_attachment(self.project, ContentFile(b'own', name='own.txt'))
+
+    def assertProjectGone(self):
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+        self.assertFalse(DiscussionMessage.objects.filter(related_discussion__related_project=self.project).exists())
+        self.assertFalse(Attachments.objects.filter(related_project=self.project).exists())
+        self.assertTrue(self.shared.files.storage.exists(self.shared.files.name))
+        self.assertFalse(self.own.files.storage.exists(self.own.files.name))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+    def test_delete_view_hides_the_project_and_a_job_deletes_it_in_batches(self):
+        self.client.force_login(self.owner)
+        detail = reverse('basecamp:detail', kwargs={'pk': self.project.pk})
+        response = self.client.post(reverse('basecamp:delete_project', kwargs={'pk': self.project.pk}))
+        self.assertRedirects(response, reverse('basecamp:project'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(detail).status_code, 403)
+        self.assertEqual(Task.objects.filter(related_project=self.project).count(), 5)
+
+        self.assertGreater(run_pending(), 3)
+        self.assertProjectGone()
+
+    def test_command_reports_progress(self):
+        out = io.StringIO()
+        call_command('delete_project', self.project.pk, batch_size=2, stdout=out)
+        self.assertIn('6 basecamp.DiscussionMessage, 2 basecamp.Discussion, 5 basecamp.Task, '
+                      '2 basecamp.Attachments, 1 basecamp.Project', out.getvalue())
+        run_pending()
+        self.assertProjectGone()
+
+
+class ProjectArchiveTest(MediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.member = User.objects.create_user('member', password='pass')
+        cls.project = Project.objects.create(title='Roadmap', description='plans', created_by=cls.owner)
+        ProjectMembership.objects.create(project=cls.project, user=cls.member)
+        for i in range(3):
+            discussion = Discussion.objects.create(disc_name='talk %d' % i, related_project=cls.project)
+            for j in range(4):
+                DiscussionMessage.objects.create(user='owner', message_text='%d.%d' % (i, j),
+                                                 related_discussion=discussion)
+        Task.objects.create(task_name='done', is_solved=True, related_project=cls.project)
+        Task.objects.create(task_name='open', related_project=cls.project)
+
+    def setUp(self):
+        super().setUp()
+        create_attachment(self.project, ContentFile(b'spec', name='spec.txt'))
+        create_attachment(self.project, ContentFile(b'spec', name='copy.txt'))
+        create_attachment(self.project, ContentFile(b'logo', name='logo.png'))
+
+    def test_download_round_trips_through_import(self):
+        url = reverse('basecamp:export_project', kwargs={'pk': self.project.pk})
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.owner)
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        self.assertIn('project-%d.zip' % self.project.pk, response['Content-Disposition'])
+        archive = io.BytesIO(b''.join(response.streaming_content))
+
+        with self.assertRaises(ArchiveError):
+            import_project(archive, self.member)
+        copy, counts = import_project(archive, self.member, title='Roadmap copy', batch_size=5)
+        self.assertEqual(counts, {'discussions': 3, 'messages': 12, 'tasks': 2, 'attachments': 3})
+
+        def snapshot(project):
+            return ([(m.related_discussion.disc_name, m.message_text, m.time_create) for m in
+                     DiscussionMessage.objects.filter(related_discussion__related_project=project)
+                     .select_related('related_discussion').order_by('pk')],
+                    list(Task.objects.filter(related_project=project).order_by('pk')
+                         .values_list('task_name', 'is_solved', 'time_create')),
+                    sorted(Attachments.objects.filter(related_project=project).values_list('name', 'files')))
+        self.assertEqual(snapshot(copy), snapshot(self.project))
+        self.assertEqual(copy.created_by, self.member)
+        self.assertEqual(Blob.objects.get(digest=hashlib.sha256(b'spec').hexdigest()).ref_count, 4)
+        copy.refresh_from_db()
+        self.assertEqual((copy.message_count, copy.open_task_count), (12, 1))
+        self.assertEqual(dict(Counter(ProjectEvent.objects.filter(project=copy).values_list('kind', flat=True))),
+                         {ProjectEvent.DISCUSSION_ADDED: 3, ProjectEvent.MESSAGE_ADDED: 12, ProjectEvent.TASK_ADDED: 2,
+                          ProjectEvent.ATTACHMENT_ADDED: 3})
+
+    def test_failed_import_leaves_no_files_behind(self):
+        archive = io.BytesIO(b''.join(iter_export(self.project)))
+        for attachment in Attachments.objects.all():
+            attachment.delete()
+        run_pending()
+        storage = attachment_storage()
+        name = storage.blob_name(hashlib.sha256(b'spec').hexdigest())
+        with unittest.mock.patch('basecamp.archive.index_projects', side_effect=RuntimeError('disk full')), \
+                self.assertRaises(RuntimeError):
+            import_project(archive, self.member, title='Broken copy')
+        self.assertFalse(Project.objects.filter(title='Broken copy').exists())
+        self.assertTrue(storage.exists(name))
+        run_pending()
+        self.assertFalse(storage.exists(name))
+
+    def test_damaged_archive_is_an_archive_error(self):
+        exported = zipfile.ZipFile(io.BytesIO(b''.join(iter_export(self.project))))
+        for attachment in Attachments.objects.all():
+            attachment.delete()
+        run_pending()
+
+        def damaged(member, row):
+            archive = io.BytesIO()
+            with zipfile.ZipFile(archive, 'w') as output:
+                for name in exported.namelist():
+                    extra = (json.dumps(row) + '\n').encode() if name == member else b''
+                    output.writestr(name, exported.read(name) + extra)
+                output.writestr('files/../evil.txt', b'evil')
+            return archive
+
+        for archive in (damaged('tasks.ndjson', {'task_name': 'leap', 'is_solved': False,
+                                                 'time_create': '2020-02-30T00:00:00'}),
+                        damaged('attachments.ndjson', {'name': 'evil.txt', 'file': '../evil.txt', 'size': 4,
+                                                       'checksum': ''})):
+            with self.assertRaises(ArchiveError):
+                import_project(archive, self.member, title='Damaged copy')
+        self.assertFalse(Project.objects.filter(title='Damaged copy').exists())
+        # the blob restored before the bad file name goes with the rolled back rows
+        run_pending()
+        storage = attachment_storage()
+        self.assertFalse(storage.exists(storage.blob_name(hashlib.sha256(b'spec').hexdigest())))
+
+    def test_commands(self):
+        path = Path(self.media_root) / 'roadmap.zip'
+        call_command('export_project', self.project.pk, str(path), stderr=io.StringIO())
+        out = io.StringIO()
+        call_command('import_project', str(path), owner='member', title='Imported', stdout=out)
+        self.assertIn('12 messages', out.getvalue())
+        self.assertEqual(Project.objects.get(title='Imported').attachments_set.count(), 3)
+
+
+class DiscussionLiveUpdateTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.project = Project.objects.create(title='live', created_by=cls.owner)
+        cls.discussion = Discussion.objects.create(disc_name='chat', related_project=cls.project)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.owner)
+
+    def post_message(self, text):
+        return self.client.post(reverse('basecamp:add_info_project_detail', kwargs={'pk': self.project.pk}),
+                                {'title': text, 'user_id': self.owner.pk,
+                                 'discussion_id': self.discussion.pk, 'option': 'Send'},
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_post_returns_only_the_new_message(self):
+        response = self.post_message('hi there')
+        self.assertEqual(response.status_code, 201)
+        message = DiscussionMessage.objects.get()
+        self.assertContains(response, 'id="message-%d"' % message.pk, status_code=201)
+        self.assertNotContains(response, '<html', status_code=201)
+
+    def socket_scope(self, origin='http://testserver'):
+        cookie = '%s=%s' % (settings.SESSION_COOKIE_NAME, self.client.cookies[settings.SESSION_COOKIE_NAME].value)
+        return {'type': 'websocket', 'headers': [(b'cookie', cookie.encode()), (b'origin', origin.encode())],
+                'path': '/ws/project/%d/discussion/%d/' % (self.project.pk, self.discussion.pk)}
+
+    def socket_session(self, scope, on_accept=None):
+        async def session():
+            incoming = asyncio.Queue()
+            sent = []
+
+            async def send(event):
+                sent.append(event)
+                if event['type'] == 'websocket.accept' and on_accept:
+                    await sync_to_async(on_accept)()
+                elif event['type'] == 'websocket.accept':
+                    await incoming.put({'type': 'websocket.disconnect'})
+                elif event['type'] == 'websocket.send':
+                    await incoming.put({'type': 'websocket.disconnect'})
+
+            await incoming.put({'type': 'websocket.connect'})
+            await asyncio.wait_for(websocket_application(scope, incoming.get, send), 5)
+            return sent
+
+        return async_to_sync(session)()
+
+    def test_websocket_receives_published_messages(self):
+        def post_and_commit():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post_message('pushed')
+
+        sent = self.socket_session(self.socket_scope(), post_and_commit)
+        self.assertEqual(sent[0]['type'], 'websocket.accept')
+        self.assertIn('pushed', json.loads(sent[1]['text'])['html'])
+
+    def test_websocket_closes_when_access_is_revoked(self):
+        member = User.objects.create_user('member', password='pass')
+        ProjectMembership.objects.create(project=self.project, user=member)
+        self.client.force_login(member)
+
+        def revoke():
+            with self.captureOnCommitCallbacks(execute=True):
+                ProjectMembership.objects.filter(user=member).delete()
+
+        sent = self.socket_session(self.socket_scope(), revoke)
+        self.assertEqual(sent, [{'type': 'websocket.accept'}, {'type': 'websocket.close', 'code': 4403}])
+
+    def test_websocket_rejects_foreign_origins(self):
+        for origin in ('https://evil.example', 'null', ''):
+            sent = self.socket_session(self.socket_scope(origin))
+            self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4403}])
+        with self.settings(CSRF_TRUSTED_ORIGINS=['https://*.example.com']):
+            sent = self.socket_session(self.socket_scope('https://app.example.com'))
+        self.assertEqual(sent[0]['type'], 'websocket.accept')
+
+    def test_websocket_rejects_strangers(self):
+        scope = {'type': 'websocket', 'headers': [(b'origin', b'http://testserver')],
+                 'path': '/ws/project/%d/discussion/%d/' % (self.project.pk, self.discussion.pk)}
+        sent = []
+
+        async def receive():
+            return {'type': 'websocket.connect'}
+
+        async def send(event):
+            sent.append(event)
+
+        async_to_sync(websocket_application)(scope, receive, send)
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4403}])
+
+
+class AsyncViewsTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.guest = User.objects.create_user('guest', password='pass')
+        cls.project = Project.objects.create(title='async', created_by=cls.owner)
+        discussion = Discussion.objects.create(disc_name='chat', related_project=cls.project)
+        DiscussionMessage.objects.create(user='owner', message_text='from the loop', related_discussion=discussion)
+
+    async def test_read_views_run_on_the_asgi_handler(self):
+        await sync_to_async(self.async_client.force_login)(self.owner)
+        detail = await self.async_client.get(reverse('basecamp:detail', kwargs={'pk': self.project.pk}))
+        self.assertContains(detail, 'from the loop')
+        projects = await self.async_client.get(reverse('basecamp:project'))
+        self.assertEqual([p.title for p in projects.context['my_project_list']], ['async'])
+        membership = await self.async_client.get(reverse('basecamp:membership', kwargs={'pk': self.project.pk}))
+        self.assertEqual([admin.username for admin in membership.context['admins']], ['owner'])
+
+        await sync_to_async(self.async_client.force_login)(self.guest)
+        response = await self.async_client.get(reverse('basecamp:detail', kwargs={'pk': self.project.pk}))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_current_user_follows_the_request_into_threads(self):
+        request = RequestFactory().get('/')
+        request.user = self.owner
+
+        async def view(request):
+            return await sync_to_async(get_current_user)()
+
+        self.assertEqual(await CurrentUserMiddleware(view)(request), self.owner)
+        self.assertIsNone(get_current_user())
+
+
+class ProjectDetailFragmentCacheTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.member = User.objects.create_user('member', password='pass')
+        cls.project = Project.objects.create(title='cached', created_by=cls.owner)
+        ProjectMembership.objects.create(project=cls.project, user=cls.member)
+        discussion = Discussion.objects.create(disc_name='chat', related_project=cls.project)
+        DiscussionMessage.objects.create(user='owner', message_text='first', related_discussion=discussion)
+        Task.objects.create(task_name='ship it', related_project=cls.project)
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('basecamp:detail', kwargs={'pk': self.project.pk})
+
+    def test_unchanged_sections_render_without_queries(self):
+        self.client.force_login(self.owner)
+        self.client.get(self.url)
+        # session, user and the project row; every section comes from the cache
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'ship it')
+        self.assertContains(response, 'first')
+
+    def test_writes_invalidate_only_their_section(self):
+        self.client.force_login(self.owner)
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(task_name='write docs', related_project=self.project)
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'write docs')
+
+    @override_settings(BASECAMP_CACHE_SHARED=False)
+    def test_sections_are_rendered_fresh_without_a_shared_cache(self):
+        self.client.force_login(self.owner)
+        self.client.get(self.url)
+        # written by another worker, whose version bump this process would never see
+        Task.objects.filter(task_name='ship it').update(task_name='shipped')
+        self.assertContains(self.client.get(self.url), 'shipped')
+
+    def test_cached_forms_get_the_current_users_csrf_token(self):
+        self.client.force_login(self.owner)
+        self.client.get(self.url)
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.member)
+        response = client.get(self.url)
+        self.assertNotContains(response, 'basecamp-csrf-slot')
+        send_form = response.content.decode().split('data-socket-path')[1]
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', send_form).group(1)
+        response = client.post(reverse('basecamp:add_info_project_detail', kwargs={'pk': self.project.pk}),
+                               {'title': 'hello', 'option': 'Send',
+                                'discussion_id': Discussion.objects.get().pk, 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(DiscussionMessage.objects.latest('id').user, 'member')
+
+
+class SearchTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.other = User.objects.create_user('other', password='pass')
+        cls.project = Project.objects.create(title='Launch plan', description='Quarterly roadmap', created_by=cls.owner)
+        cls.hidden = Project.objects.create(title='Secret roadmap', created_by=cls.other)
+        cls.discussion = Discussion.objects.create(disc_name='Kickoff', related_project=cls.project)
+        cls.message = DiscussionMessage.objects.create(user='owner', message_text='Budget approved for the launch',
+                                                       related_discussion=cls.discussion)
+        Task.objects.create(task_name='Prepare budget slides', related_project=cls.project)
+
+    def search(self, query, project_ids=None):
+        backend = get_search_backend()
+        hits = backend.search(query, project_ids or [self.project.pk, self.hidden.pk])
+        return {(hit.kind, hit.object_id) for hit in hits}
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.search('budg'), {(MESSAGE, self.message.pk), ('task', Task.objects.get().pk)})
+        self.assertEqual(self.search('roadmap', [self.project.pk]), {(PROJECT, self.project.pk)})
+        self.message.message_text = 'Approved'
+        self.message.save()
+        self.assertEqual(self.search('budget'), {('task', Task.objects.get().pk)})
+        self.discussion.delete()
+        self.assertEqual(self.search('approved'), set())
+        self.project.delete()
+        self.assertEqual(self.search('budget'), set())
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search('"budget" OR NEAR( *'), set())
+        self.assertEqual(self.search('budget AND'), set())
+
+    @override_settings(BASECAMP_SEARCH_BACKEND='basecamp.search.BasicSearchBackend')
+    def test_basic_backend(self):
+        self.assertIsInstance(get_search_backend(), BasicSearchBackend)
+        self.assertEqual(self.search('launch budget'), {(MESSAGE, self.message.pk)})
+
+    def test_view_only_shows_accessible_projects(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('basecamp:search'), {'q': 'roadmap'})
+        self.assertEqual([hit.object_id for hit in response.context['results']], [self.project.pk])
+        self.assertIsNone(response.context['next_page'])
+
+
+class ProjectEventTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.member = User.objects.create_user('member', password='pass')
+        cls.project = Project.objects.create(title='feed', created_by=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.owner)
+        self.url = reverse('basecamp:project_events', kwargs={'pk': self.project.pk})
+
+    def post(self, option, title='x', **data):
+        return self.client.post(reverse('basecamp:add_info_project_detail', kwargs={'pk': self.project.pk}),
+                                dict(title=title, option=option, **data))
+
+    def test_poll_returns_only_new_events(self):
+        self.post('Add discussion', 'plans')
+        self.post('Send', 'hello', discussion_id=Discussion.objects.get().pk)
+        self.client.post(reverse('basecamp:membership', kwargs={'pk': self.project.pk}),
+                         {'user': 'member', 'option': 'Add user'})
+        feed = self.client.get(self.url, {'limit': 2}).json()
+        self.assertEqual([event['kind'] for event in feed['events']],
+                         [ProjectEvent.DISCUSSION_ADDED, ProjectEvent.MESSAGE_ADDED])
+        self.assertEqual(feed['events'][1]['actor'], 'owner')
+        self.assertTrue(feed['more'])
+        feed = self.client.get(self.url, {'since': feed['since']}).json()
+        self.assertEqual([(event['kind'], event['data']['username']) for event in feed['events']],
+                         [(ProjectEvent.MEMBER_ADDED, 'member')])
+        self.assertFalse(feed['more'])
+
+        self.post('Add new task', 'ship it')
+        # session, user, cached roles and one range scan over (project, id)
+        with self.assertNumQueries(3):
+            feed = self.client.get(self.url, {'since': feed['since']}).json()
+        self.assertEqual([event['data'] for event in feed['events']], [{'name': 'ship it'}])
+        since = feed['since']
+        self.assertEqual(self.client.get(self.url, {'since': since}).json(), {'events': [], 'since': since,
+                                                                            'more': False})
+        self.assertEqual(self.client.get(self.url, {'since': 'garbage'}).status_code, 400)
+
+
+class ReadApiTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.guest = User.objects.create_user('guest', password='pass')
+        cls.project = Project.objects.create(title='api', created_by=cls.owner)
+        Project.objects.create(title='elsewhere', created_by=cls.guest)
+        cls.discussion = Discussion.objects.create(disc_name='talk', related_project=cls.project)
+        for i in range(5):
+            DiscussionMessage.objects.create(user='owner', message_text='m%d' % i, related_discussion=cls.discussion)
+            Task.objects.create(task_name='task %d' % i, related_project=cls.project)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.owner)
+
+    def test_sparse_fields_and_cursor_pages(self):
+        url = reverse('basecamp:api_tasks', kwargs={'pk': self.project.pk})
+        page = self.client.get(url, {'fields': 'name', 'limit': 3}).json()
+        self.assertEqual(page['tasks'], [{'name': 'task %d' % i} for i in range(3)])
+        page = self.client.get(url, {'fields': 'name', 'limit': 3, 'after': page['next']}).json()
+        self.assertEqual(page, {'tasks': [{'name': 'task 3'}, {'name': 'task 4'}], 'next': None})
+        self.assertEqual(self.client.get(url, {'fields': 'name,secret'}).status_code, 400)
+
+        messages = self.client.get(reverse('basecamp:api_messages', kwargs={
+            'pk': self.project.pk, 'discussion_id': self.discussion.pk}), {'fields': 'text'}).json()
+        self.assertEqual([message['text'] for message in messages['messages']], ['m%d' % i for i in range(5)])
+        projects = self.client.get(reverse('basecamp:api_projects'), {'fields': 'title,created_by'}).json()
+        self.assertEqual(projects['projects'], [{'title': 'api', 'created_by': 'owner'}])
+
+    def test_unchanged_project_answers_not_modified_without_querying_rows(self):
+        url = reverse('basecamp:api_discussions', kwargs={'pk': self.project.pk})
+        response = self.client.get(url)
+        etag = response['ETag']
+        # session, user, cached roles and the project's version
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(reverse('basecamp:add_info_project_detail', kwargs={'pk': self.project.pk}),
+                         {'title': 'more', 'option': 'Add discussion'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['discussions']), 2)
+
+    def test_anonymous_clients_get_json_401(self):
+        self.client.logout()
+        for url in (reverse('basecamp:api_projects'), reverse('basecamp:api_project', kwargs={'pk': self.project.pk})):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 401)
+            self.assertIn('error', response.json())
+
+    def test_requires_membership(self):
+        self.client.force_login(self.guest)
+        response = self.client.get(reverse('basecamp:api_project', kwargs={'pk': self.project.pk}))
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('error', response.json())
+        other = self.client.get(reverse('basecamp:api_messages', kwargs={
+            'pk': Project.objects.get(title='elsewhere').pk, 'discussion_id': self.discussion.pk}))
+        self.assertEqual(other.status_code, 404)
+
+
+class BulkIngestTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.project = Project.objects.create(title='ingest', created_by=cls.owner)
+        cls.discussion = Discussion.objects.create(disc_name='imported', related_project=cls.project)
+        cls.foreign = Discussion.objects.create(disc_name='elsewhere', related_project=Project.objects.create(
+            title='other', created_by=cls.owner))
+
+    def test_endpoint_inserts_valid_rows_and_reports_the_rest(self):
+        self.client.force_login(self.owner)
+        rows = [{'type': 'message', 'discussion': self.discussion.pk, 'text': 'm%d' % i, 'user': 'alice',
+                 'time_create': '2020-01-01T00:00:%02d+00:00' % i} for i in range(5)]
+        rows += [{'type': 'task', 'name': 'ported task'}, {'type': 'task', 'name': 'done', 'is_solved': True},
+                 {'type': 'message', 'discussion': self.foreign.pk, 'text': 'wrong project'},
+                 {'type': 'task', 'name': ''}, {'type': 'task', 'name': 'x', 'time_create': 'yesterday'},
+                 {'type': 'task', 'name': 'x', 'time_create': '2020-02-30T00:00:00'}, 'oops']
+        response = self.client.post(reverse('basecamp:bulk_ingest', kwargs={'pk': self.project.pk}) + '?batch_size=3',
+                                    {'rows': rows}, content_type='application/json')
+        result = response.json()
+        self.assertEqual(result['created'], {'messages': 5, 'tasks': 2})
+        self.assertEqual([(row['row'], sorted(row['errors'])) for row in result['rejected']],
+                         [(8, ['discussion']), (9, ['task_name']), (10, ['time_create']), (11, ['time_create']),
+                          (12, ['row'])])
+        messages = DiscussionMessage.objects.filter(related_discussion=self.discussion).order_by('time_create')
+        self.assertEqual([(m.message_text, m.user, m.time_create.second) for m in messages],
+                         [('m%d' % i, 'alice', i) for i in range(5)])
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertEqual((project.message_count, project.open_task_count), (5, 1))
+        self.assertEqual(sorted(ProjectEvent.objects.filter(project=self.project).values_list('kind', 'actor')),
+                         [(ProjectEvent.MESSAGE_ADDED, 'alice')] * 5 + [(ProjectEvent.TASK_ADDED, 'owner')] * 2)
+        hits = get_search_backend().search('ported', [self.project.pk])
+        self.assertEqual([(hit.kind, hit.object_id) for hit in hits],
+                         [('task', Task.objects.get(task_name='ported task').pk)])
+
+    def test_command_reads_ndjson(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as source:
+            source.write(json.dumps({'type': 'message', 'discussion': self.discussion.pk, 'text': 'hi'}) + '\n')
+            source.write('{not json\n')
+        out, err = io.StringIO(), io.StringIO()
+        call_command('ingest_rows', self.project.pk, source.name, user='bot', stdout=out, stderr=err)
+        Path(source.name).unlink()
+        self.assertIn('1 messages and 0 tasks created, 1 rows rejected', out.getvalue())
+        self.assertIn('Row 2 rejected: row: Each row must be a JSON object', err.getvalue())
+        self.assertEqual(DiscussionMessage.objects.get().user, 'bot')
+
+
+class TaskBoardTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.member = User.objects.create_user('member', password='pass')
+        cls.project = Project.objects.create(title='tasks', created_by=cls.owner)
+        ProjectMembership.objects.create(project=cls.project, user=cls.member)
+        cls.tasks = [Task.objects.create(task_name='task %d' % i, is_solved=i % 3 == 0, related_project=cls.project)
+                     for i in range(7)]
+
+    def test_api_filters_and_pages(self):
+        self.client.force_login(self.member)
+        url = reverse('basecamp:task_list_api', kwargs={'pk': self.project.pk})
+        seen = []
+        params = {'status': 'open', 'order': 'oldest', 'limit': 2}
+        while True:
+            data = self.client.get(url, params).json()
+            seen += [task['id'] for task in data['tasks']]
+            if not data['next']:
+                break
+            params['after'] = data['next']
+        self.assertEqual(seen, [task.pk for task in self.tasks if not task.is_solved])
+        with self.assertNumQueries(3):
+            self.client.get(url, {'status': 'solved'})
+        self.assertEqual(self.client.get(url, {'after': 'garbage'}).status_code, 400)
+        board = reverse('basecamp:task_board', kwargs={'pk': self.project.pk})
+        self.assertEqual(self.client.get(board, {'after': 'garbage'}).status_code, 400)
+        for values in ([[1], 2], [None, 1], ['2020-02-30T00:00:00', 1], [self.tasks[0].time_create.isoformat(), 'x']):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            self.assertEqual(self.client.get(url, {'after': cursor}).status_code, 400)
+
+    def test_bulk_solve_is_one_update(self):
+        url = reverse('basecamp:task_bulk_solve', kwargs={'pk': self.project.pk})
+        ids = [task.pk for task in self.tasks[:4]]
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.post(url, {'tasks': ids, 'is_solved': '1'}).status_code, 403)
+        self.client.force_login(self.owner)
+        # session, user, roles, then in a savepoint the changing ids, one UPDATE, counters and the events
+        with self.assertNumQueries(9):
+            response = self.client.post(url, {'tasks': ids, 'is_solved': '1'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json(), {'updated': 2})
+        self.assertEqual(sorted(ProjectEvent.objects.filter(kind=ProjectEvent.TASK_UPDATED)
+                                .values_list('target_id', flat=True)), [self.tasks[1].pk, self.tasks[2].pk])
+        self.assertEqual(Task.objects.filter(pk__in=ids, is_solved=True).count(), 4)
+        response = self.client.get(reverse('basecamp:task_board', kwargs={'pk': self.project.pk}), {'status': 'open'})
+        self.assertEqual(len(response.context['tasks']), 2)
+        self.assertContains(response, 'Mark solved')
+
+
+class DatabaseConfigTest(BasecampTestCase):
+
+    def test_database_url(self):
+        base_dir = Path('/srv/basecamp')
+        config = database_from_env(base_dir, {})
+        self.assertEqual((config['NAME'], config['CONN_MAX_AGE']), ('/srv/basecamp/db.sqlite3', 0))
+        config = database_from_env(base_dir, {'DATABASE_URL': 'postgres://db/basecamp', 'DATABASE_POOL': 'pgbouncer'})
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        config = database_from_env(base_dir, {'DATABASE_URL': 'postgres://app:p%40ss@db:6432/basecamp',
+                                              'DATABASE_POOL': 'pgbouncer', 'DATABASE_CONN_MAX_AGE': '300'})
+        self.assertEqual((config['ENGINE'], config['USER'], config['PASSWORD'], config['HOST'], config['PORT']),
+                         ('django.db.backends.postgresql', 'app', 'p@ss', 'db', '6432'))
+        self.assertEqual((config['NAME'], config['CONN_MAX_AGE']), ('basecamp', 300))
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+        self.assertTrue(config['DISABLE_SERVER_SIDE_CURSORS'])
+        with self.assertRaises(ValueError):
+            database_from_env(base_dir, {'DATABASE_URL': 'mysql://db/basecamp'})
+
+    def test_cache_url(self):
+        config = cache_from_env({})
+        self.assertEqual(config['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+        self.assertFalse(cache_shared_from_env(config, {}))
+        self.assertTrue(cache_shared_from_env(config, {'BASECAMP_CACHE_SHARED': '1'}))
+        config = cache_from_env({'CACHE_URL': 'redis://cache:6379/1'})
+        self.assertEqual(config, {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                  'LOCATION': 'redis://cache:6379/1'})
+        self.assertTrue(cache_shared_from_env(config, {}))
+        with self.assertRaises(ValueError):
+            cache_from_env({'CACHE_URL': 'mongodb://cache'})
+
+    @unittest.skipUnless(connection.vendor == 'sqlite' and settings.BASECAMP_SQLITE_PRAGMAS, 'tuned SQLite only')
+    def test_sqlite_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.BASECAMP_SQLITE_PRAGMAS['busy_timeout'])
+
+
+class ViewBudgetTest(MediaTestCase):
+
+    def test_every_view_stays_within_its_query_budget(self):
+        data = generate_data(Scale(users=10, projects=4, members=3, discussions=3, messages=5, tasks=10,
+                                   attachments=2))
+        results = run_benchmarks(data, repeat=1)
+        self.assertEqual({result['view']: result['failures'] for result in results if result['failures']}, {})
+
+
+@modify_settings(MIDDLEWARE={'prepend': 'basecamp.middleware.RequestMetricsMiddleware'})
+class RequestMetricsTest(BasecampTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='pass')
+        cls.staff = User.objects.create_user('staff', password='pass', is_staff=True)
+        cls.project = Project.objects.create(title='metrics', created_by=cls.user)
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def test_fingerprint_groups_query_shapes(self):
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) AND x = 5'),
+                         fingerprint('SELECT * FROM t WHERE id IN (%s, %s) AND x = 12'))
+
+    def test_requests_are_timed_and_aggregated(self):
+        self.client.force_login(self.user)
+        for _ in range(3):
+            response = self.client.get(reverse('basecamp:detail', kwargs={'pk': self.project.pk}))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+, total')
+        self.assertEqual(self.client.get(reverse('basecamp:metrics')).status_code, 403)
+
+        self.client.force_login(self.staff)
+        stats = self.client.get(reverse('basecamp:metrics')).json()['views']['basecamp:detail']
+        self.assertEqual(stats['requests'], 3)
+        self.assertGreater(stats['render_ms']['p50'], 0)
+        self.assertEqual(stats['size']['p99'], len(response.content))
+        self.assertLessEqual(stats['queries']['p50'], stats['queries']['p99'])
+
+    async def test_async_requests_are_profiled_on_the_loop(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse('basecamp:detail', kwargs={'pk': self.project.pk}))
+        queries = int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertGreater(queries, 0)
+        stats = registry.snapshot()['basecamp:detail']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['queries']['p50'], queries)
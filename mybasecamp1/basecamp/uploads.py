@@ -0,0 +1,127 @@
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+
+from .blobs import create_attachment
+from .models import UploadSession
+from .storage import file_digest
+
+READ_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadConflict(Exception):
+
+    def __init__(self, received_size):
+        super().__init__('Upload is at offset %d' % received_size)
+        self.received_size = received_size
+
+
+class AssembledFile(File):
+    # storages move files exposing temporary_file_path() instead of copying them
+    def __init__(self, file, name, checksum):
+        super().__init__(file, name)
+        self.checksum = checksum
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def upload_temp_dir():
+    return getattr(settings, 'BASECAMP_UPLOAD_TEMP_DIR', os.path.join(settings.MEDIA_ROOT, 'uploads'))
+
+
+def upload_temp_path(session):
+    return os.path.join(upload_temp_dir(), '%s.part' % session.id)
+
+
+def start_upload(project, user, file_name, total_size, checksum=''):
+    if total_size < 0:
+        raise ValidationError('total_size must not be negative')
+    max_size = getattr(settings, 'BASECAMP_UPLOAD_MAX_SIZE', None)
+    if max_size is not None and total_size > max_size:
+        raise ValidationError('File is larger than %d bytes' % max_size)
+    session = UploadSession.objects.create(
+        related_project=project, created_by=user, file_name=os.path.basename(file_name),
+        total_size=total_size, checksum=checksum.lower(),
+        chunk_size=getattr(settings, 'BASECAMP_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024),
+    )
+    os.makedirs(upload_temp_dir(), exist_ok=True)
+    open(upload_temp_path(session), 'wb').close()
+    return session
+
+
+def parse_content_range(header, session):
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise ValidationError('Content-Range header "bytes <start>-<end>/<total>" is required')
+    start, end, total = (int(value) for value in match.groups())
+    if total != session.total_size or end < start or end >= total:
+        raise ValidationError('Content-Range does not match the upload')
+    if end - start + 1 > session.chunk_size:
+        raise ValidationError('Chunks must not be larger than %d bytes' % session.chunk_size)
+    if end + 1 < total and end - start + 1 != session.chunk_size:
+        raise ValidationError('Only the last chunk may be shorter than %d bytes' % session.chunk_size)
+    return start, end - start + 1
+
+
+def append_chunk(session, content_range, stream):
+    start, length = parse_content_range(content_range, session)
+    if start != session.received_size:
+        raise UploadConflict(session.received_size)
+    with open(upload_temp_path(session), 'r+b') as part:
+        # drop whatever a previously interrupted chunk left behind
+        part.truncate(start)
+        part.seek(start)
+        remaining = length
+        while remaining:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            part.write(data)
+            remaining -= len(data)
+        if remaining:
+            part.truncate(start)
+            raise ValidationError('Chunk body is shorter than its Content-Range')
+        part.flush()
+        os.fsync(part.fileno())
+    updated = UploadSession.objects.filter(pk=session.pk, received_size=start).update(
+        received_size=start + length)
+    if not updated:
+        raise UploadConflict(UploadSession.objects.get(pk=session.pk).received_size)
+    session.received_size = start + length
+    return session
+
+
+def complete_upload(session):
+    if session.received_size != session.total_size:
+        raise UploadConflict(session.received_size)
+    path = upload_temp_path(session)
+    with open(path, 'rb') as part:
+        checksum = file_digest(part)
+    if session.checksum and session.checksum != checksum:
+        abort_upload(session)
+        raise ValidationError('Checksum mismatch')
+    with transaction.atomic(), open(path, 'rb') as part:
+        attachment = create_attachment(session.related_project, AssembledFile(part, session.file_name, checksum))
+        session.delete()
+    return attachment
+
+
+def _remove_part(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def abort_upload(session):
+    path = upload_temp_path(session)
+    session.delete()
+    # a rolled back caller keeps the session, which must still find its part file
+    transaction.on_commit(lambda: _remove_part(path))
@@ -15,11 +15,32 @@ urlpatterns = [
          name='password_change'),
     path('userinfo/<int:pk>/', UserInfo.as_view(), name='userinfo'),
     path('project/', ProjectList.as_view(), name='project'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('metrics/', RequestMetrics.as_view(), name='metrics'),
     path('project/<int:pk>/', ProjectDetail.as_view(), name='detail'),
+    path('project/<int:pk>/discussion/<int:discussion_id>/messages/', DiscussionHistory.as_view(),
+         name='discussion_history'),
+    path('project/<int:pk>/tasks/', TaskBoard.as_view(), name='task_board'),
+    path('project/<int:pk>/tasks/api/', TaskListApi.as_view(), name='task_list_api'),
+    path('project/<int:pk>/events/', ProjectEvents.as_view(), name='project_events'),
+    path('api/projects/', ApiProjectList.as_view(), name='api_projects'),
+    path('api/projects/<int:pk>/', ApiProjectDetail.as_view(), name='api_project'),
+    path('api/projects/<int:pk>/discussions/', ApiDiscussionList.as_view(), name='api_discussions'),
+    path('api/projects/<int:pk>/discussions/<int:discussion_id>/messages/', ApiMessageList.as_view(),
+         name='api_messages'),
+    path('api/projects/<int:pk>/tasks/', ApiTaskList.as_view(), name='api_tasks'),
+    path('api/projects/<int:pk>/attachments/', ApiAttachmentList.as_view(), name='api_attachments'),
+    path('project/<int:pk>/tasks/solve/', TaskBulkSolve.as_view(), name='task_bulk_solve'),
     path('delete/<int:pk>/', UserDelete.as_view(), name='delete'),
     path('create_project/', CreateProject.as_view(), name='create_project'),
     path('delete_project/<int:pk>/', DeleteProject.as_view(), name='delete_project'),
-    path('project/<int:pk>/membership/', Membership.as_view(), name='membership'),
+    path('project/<int:pk>/membership/', membership, name='membership'),
+    path('project/<int:pk>/membership/bulk/', BulkMembership.as_view(), name='membership_bulk'),
     path('project/<int:pk>/add-info', CreateDiscussion.as_view(), name='add_info_project_detail'),
     path('edit_project/<int:pk>', EditProject.as_view(), name='edit_project'),
+    path('project/<int:pk>/export/', ProjectExport.as_view(), name='export_project'),
+    path('project/<int:pk>/bulk/', BulkIngest.as_view(), name='bulk_ingest'),
+    path('project/<int:pk>/files/<int:attachment_id>/', AttachmentDownload.as_view(), name='attachment_download'),
+    path('project/<int:pk>/uploads/', StartUpload.as_view(), name='start_upload'),
+    path('project/<int:pk>/uploads/<uuid:upload_id>/', UploadSessionView.as_view(), name='upload_session'),
 ]
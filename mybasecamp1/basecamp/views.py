@@ -1,15 +1,41 @@
+import json
 from abc import ABC
+from functools import partial
 
-from django.http import HttpResponseRedirect
+from asgiref.sync import sync_to_async
+from django.core.exceptions import BadRequest
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.contrib.auth import login
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.core.exceptions import ObjectDoesNotExist
-from django.shortcuts import render, redirect
+from django.contrib.auth.mixins import AccessMixin, LoginRequiredMixin, UserPassesTestMixin
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse_lazy
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
+from django.utils.cache import get_conditional_response, set_response_etag
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView, View
 from django.views.generic.edit import FormView
 
+from basecamp import api
+from basecamp.access import (ROLE_ADMIN, AsyncLoginRequiredMixin, AsyncProjectAccessMixin, ProjectAccessMixin,
+                             get_project_roles)
+from basecamp.counters import bump_counters
 from basecamp.forms import *
+from basecamp.deletion import revoke_project_access
+from basecamp.archive import iter_export
+from basecamp.downloads import serve_attachment, streaming_download
+from basecamp.events import record_event, record_member_event
+from basecamp.ingest import INGEST_BATCH_SIZE, INGEST_MAX_BATCH_SIZE, ingest_rows
+from basecamp.jobs import enqueue
+from basecamp.lookups import get_lookups
+from basecamp.metrics import registry
+from basecamp.fragments import (DISCUSSIONS, aget_section_versions, amissing_sections, fill_csrf_slots,
+                                fragment_timeout)
+from basecamp.uploads import UploadConflict, abort_upload, append_chunk, complete_upload, start_upload
+from basecamp.realtime import render_message
+from basecamp.search import get_search_backend
+from basecamp.queries import (EVENT_PAGE_SIZE, TASK_PAGE_SIZE, adiscussion_threads, discussion_history,
+                              discussion_threads, project_dashboard, project_events, split_dashboard, task_board)
 
 
 def home(request):
@@ -65,80 +91,312 @@ class UserDelete(UserPassesTestMixin, DeleteView, ABC):
         context.update(new_context)
         return context
 
-    def delete(self, request, *args, **kwargs):
-        user = User.objects.get(id=self.kwargs['pk'])
-        projects = Project.objects.filter(created_by=user)
-        for project in projects:
-            project.related_groups.all().delete()
-            Permission.objects.filter(codename=('view_' + str(project.id))).delete()
-            Permission.objects.filter(codename=('change_' + str(project.id))).delete()
-            project.delete()
-        return super().delete(self, request, *args, **kwargs)
+    def form_valid(self, form):
+        # the account is locked out now; its projects and everything in them go in a background job
+        self.object.is_active = False
+        self.object.save(update_fields=['is_active'])
+        enqueue('delete_user', user_id=self.object.pk)
+        return HttpResponseRedirect(self.get_success_url())
 
 
-class ProjectDetail(UserPassesTestMixin, DetailView, ABC):
-    model = Project
-    context_object_name = 'project'
+class ProjectDetail(AsyncProjectAccessMixin, TemplateView, ABC):
+    template_name = 'basecamp/project_detail.html'
 
-    def test_func(self, **kwargs):
+    async def get(self, request, *args, **kwargs):
+        try:
+            project = await Project.objects.select_related('created_by').aget(pk=self.kwargs['pk'])
+        except Project.DoesNotExist:
+            raise Http404('No project found matching the query')
+        user_admin = await self.aget_project_role() == ROLE_ADMIN
+        versions = await aget_section_versions(project.pk)
+
+        # sections whose fragment is cached stay lazy; if one expires before rendering it is
+        # evaluated synchronously in the render thread
+        sections = {'members': User.objects.filter(project_memberships__project=project),
+                    'discussions': partial(discussion_threads, project),
+                    'tasks': Task.objects.filter(related_project=project, is_solved=False)
+                    .order_by('-time_create', '-id')[:TASK_PAGE_SIZE],
+                    'files': Attachments.objects.filter(related_project=project)}
+        for section in await amissing_sections(project.pk, versions):
+            if section == DISCUSSIONS:
+                sections[section] = await adiscussion_threads(project)
+            else:
+                sections[section] = [row async for row in sections[section]]
+
+        context = self.get_context_data(project=project, creator=project.created_by, user_admin=user_admin,
+                                        title=project.title, pk=self.kwargs['pk'], versions=versions,
+                                        fragment_timeout=fragment_timeout(), **sections)
+        response = self.render_to_response(context)
+        response.add_post_render_callback(self.fill_csrf_slots)
+        return response
+
+    def fill_csrf_slots(self, response):
+        response.content = fill_csrf_slots(self.request, response.content)
+
+
+class DiscussionHistory(ProjectAccessMixin, ListView, ABC):
+    template_name = 'basecamp/discussion_history.html'
+    context_object_name = 'messages'
+
+    def get_queryset(self):
+        self.discussion = get_object_or_404(Discussion, id=self.kwargs['discussion_id'],
+                                            related_project_id=self.kwargs['pk'])
         try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-        except ObjectDoesNotExist:
-            return False
-        return self.request.user.has_perm('basecamp.view_' + str(project.id))
+            messages, self.older_cursor = discussion_history(self.discussion, self.request.GET.get('before'))
+        except ValidationError:
+            raise BadRequest('Invalid cursor')
+        return messages
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
+        new_context = {'title': self.discussion.disc_name, 'discussion': self.discussion,
+                       'older_cursor': self.older_cursor, 'pk': self.kwargs['pk']}
+        context.update(new_context)
+        return context
+
+
+def task_json(task):
+    return {'id': task.id, 'name': task.task_name, 'is_solved': task.is_solved,
+            'time_create': task.time_create.isoformat()}
+
+
+class TaskBoardMixin(ProjectAccessMixin):
 
-        project = context['project']
-        creator = project.created_by
-        user_admin = self.request.user.has_perm('basecamp.change_' + str(project.id))
-        user_group = list(project.related_groups.exclude(name__endswith='-admin'))[0]
+    max_page_size = 200
 
-        discussions = Discussion.objects.filter(related_project=project)
+    def get_task_page(self):
+        try:
+            size = min(max(int(self.request.GET.get('limit', TASK_PAGE_SIZE)), 1), self.max_page_size)
+        except ValueError:
+            size = TASK_PAGE_SIZE
+        newest_first = self.request.GET.get('order') != 'oldest'
+        return task_board(self.kwargs['pk'], self.request.GET.get('status'), self.request.GET.get('after'),
+                          size, newest_first)
+
+
+class TaskBoard(TaskBoardMixin, ListView, ABC):
+    template_name = 'basecamp/task_board.html'
+    context_object_name = 'tasks'
 
-        messages = list(DiscussionMessage.objects.filter(related_discussion__in=discussions).values('message_text',
-                                                                                                    'related_discussion', 'user'))
-        tasks = Task.objects.filter(related_project=project)
-        files = Attachments.objects.filter(related_project=project)
+    def get_queryset(self):
+        try:
+            tasks, self.next_cursor = self.get_task_page()
+        except ValidationError:
+            raise BadRequest('Invalid cursor')
+        return tasks
 
-        new_context = {'members': User.objects.filter(groups=user_group), 'creator': creator,
-                       'user_admin': user_admin, 'title': project.title, 'discussions': discussions,
-                       'messages': messages, 'tasks': tasks, 'pk': self.kwargs['pk'], 'files': files}
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super().get_context_data(**kwargs)
+        new_context = {'title': 'Tasks', 'pk': self.kwargs['pk'], 'next_cursor': self.next_cursor,
+                       'status': self.request.GET.get('status', ''), 'order': self.request.GET.get('order', ''),
+                       'user_admin': self.get_project_role() == ROLE_ADMIN}
         context.update(new_context)
         return context
 
 
-class ProjectList(LoginRequiredMixin, ListView):
-    model = Project
-    context_object_name = 'project'
+class TaskListApi(TaskBoardMixin, View):
 
-    def get_context_data(self, *, object_list=None, **kwargs):
+    def get(self, request, *args, **kwargs):
+        try:
+            tasks, next_cursor = self.get_task_page()
+        except ValidationError as error:
+            return JsonResponse({'error': error.messages}, status=400)
+        return JsonResponse({'tasks': [task_json(task) for task in tasks], 'next': next_cursor})
+
+
+def event_json(event):
+    return {'id': event.id, 'kind': event.kind, 'actor': event.actor, 'target_id': event.target_id,
+            'data': event.data, 'time_create': event.time_create.isoformat()}
+
+
+class ProjectEvents(ProjectAccessMixin, View):
+    max_page_size = 500
+
+    def get(self, request, *args, **kwargs):
+        try:
+            size = min(max(int(request.GET.get('limit', EVENT_PAGE_SIZE)), 1), self.max_page_size)
+        except ValueError:
+            size = EVENT_PAGE_SIZE
+        try:
+            events, since, more = project_events(self.kwargs['pk'], request.GET.get('since'), size)
+        except ValidationError as error:
+            return JsonResponse({'error': error.messages}, status=400)
+        return JsonResponse({'events': [event_json(event) for event in events], 'since': since, 'more': more})
+
+
+class ApiAccessMixin(AccessMixin):
+    """JSON clients get 401 or 403 instead of a redirect to the login page."""
+
+    def handle_no_permission(self):
+        if not self.request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        return JsonResponse({'error': 'You do not have access to this project'}, status=403)
+
+
+class ApiView(View):
+    resource = None
+    collection = None
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_version(self):
+        """A value that changes with every write behind the response, or None to hash the response body."""
+        return None
+
+    def get_page_size(self):
+        try:
+            return min(max(int(self.request.GET.get('limit', api.API_PAGE_SIZE)), 1), api.API_MAX_PAGE_SIZE)
+        except ValueError:
+            return api.API_PAGE_SIZE
+
+    def get_data(self, names):
+        rows, next_cursor = self.resource.page(self.get_queryset(), names, self.request.GET.get('after'),
+                                               self.get_page_size())
+        return {self.collection: rows, 'next': next_cursor}
+
+    def get(self, request, *args, **kwargs):
+        version = self.get_version()
+        etag = api.version_etag(request, version) if version else None
+        # a matching version answers 304 before the page is queried
+        if etag:
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
+        try:
+            data = self.get_data(self.resource.parse_fields(request.GET.get('fields')))
+        except ValidationError as error:
+            return JsonResponse({'error': error.messages}, status=400)
+        response = JsonResponse(data)
+        if etag:
+            response['ETag'] = etag
+        else:
+            set_response_etag(response)
+        return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+class ProjectApiView(ApiAccessMixin, ProjectAccessMixin, ApiView):
+
+    def get_version_queryset(self):
+        return Project.objects.filter(pk=self.kwargs['pk']).values_list('last_activity_at', flat=True)
+
+    def get_version(self):
+        # every write path bumps last_activity_at together with the project's counters
+        versions = list(self.get_version_queryset()[:1])
+        if not versions:
+            raise Http404
+        return versions[0]
+
+
+class ApiProjectList(ApiAccessMixin, LoginRequiredMixin, ApiView):
+    resource = api.PROJECTS
+    collection = 'projects'
+
+    def get_queryset(self):
+        return Project.objects.filter(memberships__user=self.request.user)
+
+
+class ApiProjectDetail(ProjectApiView):
+    resource = api.PROJECTS
+
+    def get_data(self, names):
+        row = self.resource.rows(Project.objects.filter(pk=self.kwargs['pk']), names).get()
+        return {'project': self.resource.serialize(row, names)}
+
+
+class ApiDiscussionList(ProjectApiView):
+    resource = api.DISCUSSIONS
+    collection = 'discussions'
+
+    def get_queryset(self):
+        return Discussion.objects.filter(related_project_id=self.kwargs['pk'])
+
+
+class ApiMessageList(ProjectApiView):
+    resource = api.MESSAGES
+    collection = 'messages'
+
+    def get_version_queryset(self):
+        return (Discussion.objects.filter(pk=self.kwargs['discussion_id'], related_project_id=self.kwargs['pk'])
+                .values_list('related_project__last_activity_at', flat=True))
+
+    def get_queryset(self):
+        return DiscussionMessage.objects.filter(related_discussion_id=self.kwargs['discussion_id'])
+
+
+class ApiTaskList(ProjectApiView):
+    resource = api.TASKS
+    collection = 'tasks'
+
+    def get_queryset(self):
+        return Task.objects.filter(related_project_id=self.kwargs['pk'])
+
+
+class ApiAttachmentList(ProjectApiView):
+    resource = api.ATTACHMENTS
+    collection = 'attachments'
+
+    def get_queryset(self):
+        return Attachments.objects.filter(related_project_id=self.kwargs['pk'])
+
+
+class TaskBulkSolve(ProjectAccessMixin, View):
+    project_role = ROLE_ADMIN
+
+    def post(self, request, *args, **kwargs):
+        form = TaskBulkSolveForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        updated = form.apply_changes(self.kwargs['pk'])
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'updated': updated})
+        next_url = request.POST.get('next', '')
+        if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+            next_url = reverse('basecamp:task_board', kwargs={'pk': self.kwargs['pk']})
+        return redirect(next_url)
+
+
+class ProjectList(AsyncLoginRequiredMixin, TemplateView):
+    template_name = 'basecamp/project_list.html'
+
+    async def get(self, request, *args, **kwargs):
+        project_list = [project async for project in project_dashboard(request.user)]
+        my_project_list, shared_project_list = split_dashboard(request.user, project_list)
+        context = self.get_context_data(project_list=project_list, my_project_list=my_project_list,
+                                        shared_project_list=shared_project_list, title='Projects list')
+        return self.render_to_response(context)
+
+
+class SearchView(LoginRequiredMixin, TemplateView):
+    template_name = 'basecamp/search.html'
+    paginate_by = 20
+
+    def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user_groups = self.request.user.groups.exclude(name__endswith='-admin')
-
-        project_list = []
-        my_project_list = []
-        shared_project_list = []
-        if user_groups:
-            for i in range(len(user_groups)):
-                project_list.append([])
-                project = Project.objects.get(related_groups=user_groups[i])
-                project_list[i].append(project)
-                project_list[i].append(len(User.objects.filter(groups=user_groups[i])))
-                discussions = set(Discussion.objects.filter(related_project=project))
-                project_list[i].append(len(DiscussionMessage.objects.filter(related_discussion__in=discussions)))
-        for project in project_list:
-            if project[0].created_by == self.request.user:
-                my_project_list.append(project)
-            else:
-                shared_project_list.append(project)
-        new_context = {'project_list': project_list, 'my_project_list': my_project_list,
-                       'shared_project_list': shared_project_list, 'title': 'Projects list'}
+        query = self.request.GET.get('q', '').strip()
+        try:
+            page = max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        # one extra hit tells whether a next page exists without counting every match
+        results = get_search_backend().search(query, list(get_project_roles(self.request.user)),
+                                              offset=(page - 1) * self.paginate_by, limit=self.paginate_by + 1)
+        new_context = {'title': 'Search', 'query': query, 'results': results[:self.paginate_by],
+                       'previous_page': page - 1 if page > 1 else None,
+                       'next_page': page + 1 if len(results) > self.paginate_by else None}
         context.update(new_context)
         return context
 
 
+class RequestMetrics(UserPassesTestMixin, View):
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({'window': registry.window, 'views': registry.snapshot()})
+
+
 class CreateProject(LoginRequiredMixin, CreateView):
     form_class = CreateProjectForm
     template_name = 'basecamp/project_create.html'
@@ -147,31 +405,42 @@ class CreateProject(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.created_by = self.request.user
-        return super().form_valid(form)
-
-
-class DeleteProject(UserPassesTestMixin, DeleteView, ABC):
+        try:
+            # the title check ran before the insert; the unique index settles a concurrent create
+            with transaction.atomic():
+                return super().form_valid(form)
+        except IntegrityError as error:
+            if not is_title_conflict(error):
+                raise
+            form.add_error('title', title_taken(form.instance.title))
+            return self.form_invalid(form)
+
+
+class DeleteProject(ProjectAccessMixin, DeleteView, ABC):
+    project_role = ROLE_ADMIN
     model = Project
     context_object_name = 'project'
     success_url = reverse_lazy('basecamp:project')
     extra_context = {'title': 'Delete project'}
 
-    def test_func(self, **kwargs):
-        try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-        except ObjectDoesNotExist:
-            return False
-        return self.request.user.has_perm('basecamp.change_' + str(project.id))
+    def form_valid(self, form):
+        # members lose access right away; the rows are deleted in batches by a background job
+        revoke_project_access(self.object.pk)
+        enqueue('delete_project', project_id=self.object.pk)
+        return HttpResponseRedirect(self.get_success_url())
 
-    def delete(self, request, *args, **kwargs):
-        project = Project.objects.get(id=self.kwargs['pk'])
-        project.related_groups.all().delete()
-        Permission.objects.filter(codename=('view_'+str(project.id))).delete()
-        Permission.objects.filter(codename=('change_'+str(project.id))).delete()
-        return super().delete(self, request, *args, **kwargs)
+
+class ProjectFormMixin:
+    """Hands the form the project the access check authorized from the URL."""
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['project_id'] = self.kwargs['pk']
+        return kwargs
 
 
-class Membership(UserPassesTestMixin, FormView, ABC):
+class Membership(ProjectAccessMixin, ProjectFormMixin, FormView, ABC):
+    project_role = ROLE_ADMIN
     form_class = AddUserForm
     template_name = 'basecamp/membership.html'
 
@@ -179,20 +448,11 @@ class Membership(UserPassesTestMixin, FormView, ABC):
         pk = self.kwargs['pk']
         return reverse('basecamp:membership', kwargs={'pk': pk})
 
-    def test_func(self, **kwargs):
-        try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-        except ObjectDoesNotExist:
-            return False
-        return self.request.user.has_perm('basecamp.change_' + str(project.id))
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        project = Project.objects.get(id=self.kwargs['pk'])
-        project_group = list(project.related_groups.exclude(name__endswith='-admin'))[0]
-        members = User.objects.filter(groups=project_group)
-        admins = [admin for admin in members if admin.has_perm('basecamp.change_' + str(project.id))]
+        members = User.objects.filter(project_memberships__project_id=self.kwargs['pk'])
+        admins = members.filter(project_memberships__role=ProjectMembership.ADMIN)
         new_context = {'members': members, 'admins': admins, 'title': 'Membership', 'pk': self.kwargs['pk']}
         context.update(new_context)
         return context
@@ -202,7 +462,48 @@ class Membership(UserPassesTestMixin, FormView, ABC):
         return super().form_valid(form)
 
 
-class CreateDiscussion(UserPassesTestMixin, FormView, ABC):
+class MembershipPage(AsyncProjectAccessMixin, TemplateView, ABC):
+    project_role = ROLE_ADMIN
+    template_name = 'basecamp/membership.html'
+
+    async def get(self, request, *args, **kwargs):
+        members = [member async for member in User.objects.filter(project_memberships__project_id=self.kwargs['pk'])
+                   .annotate(project_role=F('project_memberships__role'))]
+        admins = [member for member in members if member.project_role == ProjectMembership.ADMIN]
+        context = self.get_context_data(form=AddUserForm(project_id=self.kwargs['pk']), members=members,
+                                        admins=admins, title='Membership', pk=self.kwargs['pk'])
+        return self.render_to_response(context)
+
+
+membership_page = MembershipPage.as_view()
+membership_form = sync_to_async(Membership.as_view())
+
+
+async def membership(request, *args, **kwargs):
+    # the page is read asynchronously, the form posts keep the synchronous FormView
+    if request.method in ('GET', 'HEAD'):
+        return await membership_page(request, *args, **kwargs)
+    return await membership_form(request, *args, **kwargs)
+
+
+class BulkMembership(ProjectAccessMixin, FormView, ABC):
+    project_role = ROLE_ADMIN
+    form_class = BulkMembershipForm
+    template_name = 'basecamp/membership_bulk.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        new_context = {'title': 'Bulk membership', 'pk': self.kwargs['pk']}
+        context.update(new_context)
+        return context
+
+    def form_valid(self, form):
+        project = get_object_or_404(Project, id=self.kwargs['pk'])
+        result = form.apply_changes(project)
+        return self.render_to_response(self.get_context_data(form=self.form_class(), result=result))
+
+
+class CreateDiscussion(ProjectAccessMixin, ProjectFormMixin, FormView, ABC):
     form_class = AddDiscussionForm
     template_name = 'basecamp/project_detail.html'
 
@@ -210,44 +511,31 @@ class CreateDiscussion(UserPassesTestMixin, FormView, ABC):
         pk = self.kwargs['pk']
         return reverse('basecamp:detail', kwargs={'pk': pk})
 
-    def test_func(self, **kwargs):
-        try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-        except ObjectDoesNotExist:
-            return False
-        return self.request.user.has_perm('basecamp.view_' + str(project.id))
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        project = Project.objects.get(id=self.kwargs['pk'])
-        project_group = list(project.related_groups.exclude(name__endswith='-admin'))[0]
-        members = User.objects.filter(groups=project_group)
-        admins = [admin for admin in members if admin.has_perm('basecamp.change_' + str(project.id))]
+        members = User.objects.filter(project_memberships__project_id=self.kwargs['pk'])
+        admins = members.filter(project_memberships__role=ProjectMembership.ADMIN)
         new_context = {'members': members, 'admins': admins, 'title': 'Membership', 'pk': self.kwargs['pk']}
         context.update(new_context)
         return context
 
     def form_valid(self, form):
-        form.serve_discussion_form()
+        created = form.serve_discussion_form(self.request.user)
+        is_fetch = self.request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+        if is_fetch and isinstance(created, DiscussionMessage):
+            return HttpResponse(render_message(created), status=201)
         return super().form_valid(form)
 
     def form_invalid(self, form):
-        pk = form.cleaned_data['project_pk']
-        return HttpResponseRedirect(reverse('basecamp:detail', kwargs={'pk': pk}))
+        return HttpResponseRedirect(reverse('basecamp:detail', kwargs={'pk': self.kwargs['pk']}))
 
 
-class EditProject(UserPassesTestMixin, FormView, ABC):
+class EditProject(ProjectAccessMixin, ProjectFormMixin, FormView, ABC):
+    project_role = ROLE_ADMIN
     form_class = EditProjectForm
     template_name = 'basecamp/edit_project.html'
     success_url = reverse_lazy('basecamp:project')
 
-    def test_func(self, **kwargs):
-        try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-        except ObjectDoesNotExist:
-            return False
-        return self.request.user.has_perm('basecamp.change_' + str(project.id))
-
     def get_initial(self, **kwargs):
         project = Project.objects.get(id=self.kwargs['pk'])
         initial = {'title': project.title, 'description': project.description}
@@ -261,19 +549,131 @@ class EditProject(UserPassesTestMixin, FormView, ABC):
 
     def form_valid(self, form):
         option = form.cleaned_data['option']
-        project = Project.objects.get(id=form.cleaned_data['project_pk'])
-        group = Group.objects.get(name=str(form.cleaned_data['project_pk']))
-        admin_group = Group.objects.get(name=(str(form.cleaned_data['project_pk']) + '-admin'))
+        project_id = form.project_id
         if option == 'Add':
-            user = User.objects.get(username=form.cleaned_data['member'])
-            user.groups.add(group)
+            user = get_lookups().user(form.cleaned_data['member'])
             if form.cleaned_data['admin']:
-                user.groups.add(admin_group)
+                membership, created, promoted = make_admin(project_id, user)
+            else:
+                membership, created = ProjectMembership.objects.get_or_create(project_id=project_id, user=user)
+                promoted = False
+            bump_counters(project_id, member_count=int(created))
+            if created or promoted:
+                kind = ProjectEvent.MEMBER_ADDED if created else ProjectEvent.MEMBER_ROLE_CHANGED
+                record_member_event(membership, kind, user)
             return HttpResponseRedirect(reverse('basecamp:project'))
-        elif option == 'Update_description':
+        project = Project.objects.get(id=project_id)
+        if option == 'Update_description':
             project.description = form.cleaned_data['description']
-            project.save()
+            project.save(update_fields=['description'])
+            bump_counters(project.pk)
+            record_event(project.pk, ProjectEvent.PROJECT_UPDATED, project.pk, description=project.description)
         else:
             project.title = form.cleaned_data['title']
-            project.save()
+            try:
+                with transaction.atomic():
+                    project.save(update_fields=['title'])
+            except IntegrityError as error:
+                if not is_title_conflict(error):
+                    raise
+                form.add_error('title', title_taken(project.title))
+                return self.form_invalid(form)
+            bump_counters(project.pk)
+            record_event(project.pk, ProjectEvent.PROJECT_UPDATED, project.pk, title=project.title)
         return super().form_valid(form)
+
+
+class AttachmentDownload(ProjectAccessMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        attachment = get_object_or_404(Attachments, id=self.kwargs['attachment_id'],
+                                       related_project_id=self.kwargs['pk'])
+        return serve_attachment(request, attachment)
+
+
+class BulkIngest(ProjectAccessMixin, View):
+    project_role = ROLE_ADMIN
+
+    def post(self, request, *args, **kwargs):
+        try:
+            rows = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'The body must be JSON'}, status=400)
+        if isinstance(rows, dict):
+            rows = rows.get('rows')
+        if not isinstance(rows, list):
+            return JsonResponse({'error': 'Send a list of rows, or an object with one under "rows"'}, status=400)
+        try:
+            batch_size = min(max(int(request.GET.get('batch_size', INGEST_BATCH_SIZE)), 1), INGEST_MAX_BATCH_SIZE)
+        except ValueError:
+            batch_size = INGEST_BATCH_SIZE
+        project = get_object_or_404(Project, pk=self.kwargs['pk'])
+        created, rejected = ingest_rows(project, rows, request.user.username, batch_size)
+        return JsonResponse({'created': created, 'rejected': [{'row': number, 'errors': errors}
+                                                              for number, errors in rejected]})
+
+
+class ProjectExport(ProjectAccessMixin, View):
+    project_role = ROLE_ADMIN
+
+    def get(self, request, *args, **kwargs):
+        project = get_object_or_404(Project, pk=self.kwargs['pk'])
+        return streaming_download(request, iter_export(project), 'project-%d.zip' % project.pk, 'application/zip')
+
+
+def upload_session_json(session):
+    return {'id': str(session.id), 'file_name': session.file_name, 'total_size': session.total_size,
+            'chunk_size': session.chunk_size, 'received_size': session.received_size,
+            'url': reverse('basecamp:upload_session', kwargs={'pk': session.related_project_id,
+                                                              'upload_id': session.id})}
+
+
+class StartUpload(ProjectAccessMixin, View):
+    project_role = ROLE_ADMIN
+
+    def post(self, request, *args, **kwargs):
+        project = get_object_or_404(Project, id=self.kwargs['pk'])
+        try:
+            session = start_upload(project, request.user, request.POST.get('file_name', ''),
+                                   int(request.POST.get('total_size', '')), request.POST.get('checksum', ''))
+        except ValueError:
+            return JsonResponse({'error': 'total_size must be an integer'}, status=400)
+        except ValidationError as error:
+            return JsonResponse({'error': error.messages}, status=400)
+        return JsonResponse(upload_session_json(session), status=201)
+
+
+class UploadSessionView(ProjectAccessMixin, View):
+    project_role = ROLE_ADMIN
+
+    def get_session(self):
+        return get_object_or_404(UploadSession, id=self.kwargs['upload_id'], related_project_id=self.kwargs['pk'],
+                                 created_by=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(upload_session_json(self.get_session()))
+
+    def put(self, request, *args, **kwargs):
+        session = self.get_session()
+        try:
+            append_chunk(session, request.headers.get('Content-Range'), request)
+        except UploadConflict as conflict:
+            return JsonResponse({'error': str(conflict), 'received_size': conflict.received_size}, status=409)
+        except ValidationError as error:
+            return JsonResponse({'error': error.messages}, status=400)
+        return JsonResponse(upload_session_json(session))
+
+    def post(self, request, *args, **kwargs):
+        session = self.get_session()
+        try:
+            attachment = complete_upload(session)
+        except UploadConflict as conflict:
+            return JsonResponse({'error': str(conflict), 'received_size': conflict.received_size}, status=409)
+        except ValidationError as error:
+            return JsonResponse({'error': error.messages}, status=400)
+        return JsonResponse({'id': attachment.id, 'name': attachment.files.name, 'size': attachment.size,
+                             'checksum': attachment.checksum}, status=201)
+
+    def delete(self, request, *args, **kwargs):
+        abort_upload(self.get_session())
+        return HttpResponse(status=204)
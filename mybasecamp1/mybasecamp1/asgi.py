@@ -2,6 +2,9 @@
 ASGI config for mybasecamp1 project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; websocket connections go to the discussion live updates.
+The project list, project page and membership page are async views and only leave the
+event loop for database queries and template rendering.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
@@ -13,4 +16,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mybasecamp1.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from basecamp.realtime import websocket_application  # noqa: E402  needs the app registry
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,39 @@
+"""
+Cache settings read from the environment.
+
+CACHE_URL selects the default cache:
+    locmem://                        (default) private to each process
+    redis://host:6379/0              needs the redis package
+    memcached://host:11211           needs pymemcache
+    file:///absolute/path            shared by the processes of one host
+
+BASECAMP_CACHE_SHARED          whether every worker process sees the same default cache (default: any
+                               backend but locmem). Role maps and project page fragments are only cached
+                               when it is, because a change invalidates them in that cache alone; a single
+                               process deployment may set it on with locmem.
+"""
+import os
+from urllib.parse import urlsplit
+
+from .database import env_flag
+
+LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',
+                        'django.core.cache.backends.dummy.DummyCache')
+
+
+def cache_from_env(environ=os.environ):
+    url = environ.get('CACHE_URL') or 'locmem://'
+    parts = urlsplit(url)
+    if parts.scheme == 'locmem':
+        return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': parts.netloc}
+    if parts.scheme in ('redis', 'rediss'):
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url}
+    if parts.scheme == 'memcached':
+        return {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache', 'LOCATION': parts.netloc}
+    if parts.scheme == 'file':
+        return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': parts.path}
+    raise ValueError('Unsupported CACHE_URL scheme: %s' % parts.scheme)
+
+
+def cache_shared_from_env(cache, environ=os.environ):
+    return env_flag(environ, 'BASECAMP_CACHE_SHARED', cache['BACKEND'] not in LOCAL_CACHE_BACKENDS)
@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 import os
 from pathlib import Path
 
+from .caches import cache_from_env, cache_shared_from_env
+from .database import database_from_env, sqlite_pragmas_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,9 +49,15 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django_currentuser.middleware.ThreadLocalUserMiddleware',
+    'basecamp.middleware.CurrentUserMiddleware',
 ]
 
+# Per-request query/timing profiling with Server-Timing headers and a staff-only /metrics/ endpoint
+if os.environ.get('BASECAMP_REQUEST_METRICS'):
+    MIDDLEWARE.insert(0, 'basecamp.middleware.RequestMetricsMiddleware')
+BASECAMP_METRICS_WINDOW = 500
+BASECAMP_METRICS_DUPLICATE_THRESHOLD = 5
+
 ROOT_URLCONF = 'mybasecamp1.urls'
 
 TEMPLATES = [
@@ -71,13 +80,23 @@ WSGI_APPLICATION = 'mybasecamp1.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
+# Configured from DATABASE_URL and friends, see mybasecamp1/database.py
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_from_env(BASE_DIR),
+}
+
+# PRAGMAs run on every new SQLite connection; DATABASE_SQLITE_TUNED=0 keeps SQLite's defaults
+BASECAMP_SQLITE_PRAGMAS = sqlite_pragmas_from_env()
+
+# Cache
+# Configured from CACHE_URL, see mybasecamp1/caches.py. Role maps and page fragments are cached only
+# when every worker shares the cache; run several workers with redis:// or memcached:// to keep them
+
+CACHES = {
+    'default': cache_from_env(),
 }
+BASECAMP_CACHE_SHARED = cache_shared_from_env(CACHES['default'])
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -117,6 +136,29 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Chunked attachment uploads
+BASECAMP_UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, 'uploads')
+BASECAMP_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+BASECAMP_UPLOAD_MAX_SIZE = None
+
+# Attachment downloads: None streams through Django, 'nginx' sends X-Accel-Redirect
+# to BASECAMP_SENDFILE_URL + file name, 'apache' sends X-Sendfile with the file path
+BASECAMP_SENDFILE_MODE = os.environ.get('BASECAMP_SENDFILE_MODE') or None
+BASECAMP_SENDFILE_URL = '/protected-media/'
+
+# Live discussion updates under asgi.py; swap for a Redis-backed PubSub to share across processes
+BASECAMP_PUBSUB_BACKEND = 'basecamp.realtime.InProcessPubSub'
+
+# Background jobs, run by `manage.py run_jobs`: failures retry after BASECAMP_JOB_RETRY_DELAY
+# seconds doubling up to the maximum, and a job locked longer than the timeout is run again
+BASECAMP_JOB_RETRY_DELAY = 30
+BASECAMP_JOB_MAX_RETRY_DELAY = 60 * 60
+BASECAMP_JOB_LOCK_TIMEOUT = 10 * 60
+
+# Project deletion runs this many rows per statement and this many statements per job run
+BASECAMP_DELETE_BATCH_SIZE = 500
+BASECAMP_DELETE_BATCHES_PER_JOB = 20
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 